@@ -1,8 +1,11 @@
 import os
+from types import MappingProxyType
 from dotenv import load_dotenv
+from eth_utils import to_checksum_address
 
-# Load environment variables
-load_dotenv()
+# Load environment variables (skipped when the environment is already exported, e.g. by systemd)
+if not os.getenv('BSC_SNIPER_NO_DOTENV'):
+    load_dotenv()
 
 # Set up BSC Mainnet connection (with expanded fallback RPCs)
 BSC_RPC_ENDPOINTS = [
@@ -21,6 +24,9 @@ BSC_RPC_ENDPOINTS = [
     'https://bsc-dataseed4.binance.org/'
 ]
 
+# WebSocket endpoint for PairCreated push subscriptions (empty to poll over HTTP instead)
+BSC_WS_ENDPOINT = os.getenv('BSC_WS_ENDPOINT', 'wss://bsc-rpc.publicnode.com')
+
 # Security-critical variables
 PRIVATE_KEY = os.getenv('PRIVATE_KEY')
 if not PRIVATE_KEY:
@@ -38,10 +44,14 @@ MAX_INVESTMENT_PER_TOKEN = float(os.getenv('MAX_INVESTMENT_PER_TOKEN', '0.05'))
 MIN_LIQUIDITY = float(os.getenv('MIN_LIQUIDITY', '5'))  # in BNB
 SLIPPAGE = float(os.getenv('SLIPPAGE', '10'))  # in percent
 GAS_MULTIPLIER = float(os.getenv('GAS_MULTIPLIER', '1.2'))  # multiply recommended gas
+GAS_PRICE_TTL_SECONDS = float(os.getenv('GAS_PRICE_TTL_SECONDS', '5'))  # Reuse eth_gasPrice for non-critical calls (gas estimates)
 
 # Anti-scam settings
 TEST_BUY_AMOUNT = float(os.getenv('TEST_BUY_AMOUNT', '0.005'))  # in BNB for test buys
 MIN_SUCCESSFUL_SELLS = int(os.getenv('MIN_SUCCESSFUL_SELLS', '3'))  # Minimum number of sell transactions to consider token safe
+SELL_HISTORY_BLOCKS = int(os.getenv('SELL_HISTORY_BLOCKS', '40000'))  # Only look for sells in this many recent blocks
+SELL_HISTORY_MAX_ROWS = int(os.getenv('SELL_HISTORY_MAX_ROWS', '1000'))  # Cap on transfers fetched from BSCScan per check
+SELL_HISTORY_BLOCK_BUCKET = int(os.getenv('SELL_HISTORY_BLOCK_BUCKET', '1200'))  # Round the sell history start block down to a multiple of this, so the request (and its ETag) stays the same
 HONEYPOT_CHECK_ENABLED = os.getenv('HONEYPOT_CHECK_ENABLED', 'true').lower() == 'true'
 ASSEMBLY_CHECK_ENABLED = os.getenv('ASSEMBLY_CHECK_ENABLED', 'true').lower() == 'true'
 LIQUIDITY_SAFETY_MULTIPLIER = float(os.getenv('LIQUIDITY_SAFETY_MULTIPLIER', '1.5'))  # Minimum liquidity safety multiplier
@@ -50,22 +60,53 @@ LIQUIDITY_SAFETY_MULTIPLIER = float(os.getenv('LIQUIDITY_SAFETY_MULTIPLIER', '1.
 TAKE_PROFIT_PERCENTAGE = float(os.getenv('TAKE_PROFIT_PERCENTAGE', '20'))  # Sell when profit reaches 20%
 STOP_LOSS_PERCENTAGE = float(os.getenv('STOP_LOSS_PERCENTAGE', '10'))  # Sell when loss reaches 10%
 MAX_HOLDING_TIME = float(os.getenv('MAX_HOLDING_TIME', '24'))  # Maximum holding time in hours
-MONITORING_INTERVAL = float(os.getenv('MONITORING_INTERVAL', '60'))  # Check portfolio every 60 seconds
+MONITORING_INTERVAL = float(os.getenv('MONITORING_INTERVAL', '60'))  # Full portfolio check every 60 seconds (heartbeat)
+PRICE_POLL_INTERVAL = float(os.getenv('PRICE_POLL_INTERVAL', '3'))  # Poll pair Sync events every 3 seconds (one BSC block)
+QUOTE_TTL_SECONDS = float(os.getenv('QUOTE_TTL_SECONDS', '15'))  # Reuse router quotes for this long (monitor + dashboard)
+PAIR_MISS_TTL_SECONDS = float(os.getenv('PAIR_MISS_TTL_SECONDS', '30'))  # Re-query the factory for a token without a pair after this long
+REJECTED_TOKEN_TTL_SECONDS = float(os.getenv('REJECTED_TOKEN_TTL_SECONDS', '60'))  # Don't re-analyze a token that just failed analysis
+TOKEN_METADATA_MISS_TTL_SECONDS = float(os.getenv('TOKEN_METADATA_MISS_TTL_SECONDS', '30'))  # Retry symbol()/decimals() of a token whose calls reverted after this long
+APPROVE_PROBE_TTL_SECONDS = float(os.getenv('APPROVE_PROBE_TTL_SECONDS', '600'))  # Reject clones of a contract whose approve() reverted for this long
 
 # Connection retry settings
 MAX_RETRIES = 5
 RETRY_DELAY_BASE = 2
+# Retries of read-only RPC calls: short exponential backoff with jitter, capped
+RPC_RETRY_BASE_SECONDS = 0.1
+RPC_RETRY_CAP_SECONDS = 5.0
 CONNECTION_TIMEOUT = 30
 
+# HTTP connection pool per RPC endpoint (shared by discovery and monitoring threads)
+RPC_POOL_CONNECTIONS = 16
+RPC_POOL_MAXSIZE = 64
+# Worker threads for per-entry RPC fan-out (keep it below RPC_POOL_MAXSIZE)
+RPC_PARALLELISM = int(os.getenv('RPC_PARALLELISM', '8'))
+RPC_RACE_ENDPOINTS = int(os.getenv('RPC_RACE_ENDPOINTS', '2'))  # Quotes and gas price are raced across this many of the fastest endpoints (1 disables)
+# Requests per second allowed by the RPC provider for bulk scans (eth_getLogs)
+RPC_MAX_RPS = float(os.getenv('RPC_MAX_RPS', '10'))
+
 # Blacklisted token patterns (for security)
 BLACKLISTED_PATTERNS = [
     "test", "scam", "fake", "honey", "pot", "honeypot", "rug", "pull", "rugpull",
     "moon", "safe", "gem", "100x", "1000x", "fair", "presale", "pre-sale", "ico"
 ]
 
-# Contract addresses on Mainnet - these will be properly initialized with checksum format
-# by initialize_connections() function
-WBNB_ADDRESS = os.getenv('WBNB_ADDRESS', '0xbb4CdB9CBd36B01bD1cBaEBF2De08d9173bc095c')
-BUSD_ADDRESS = os.getenv('BUSD_ADDRESS', '0xe9e7CEA3DedcA5984780Bafc599bD69ADd087D56')
-PANCAKE_FACTORY_ADDRESS = os.getenv('PANCAKE_FACTORY_ADDRESS', '0xcA143Ce32Fe78f1f7019d7d551a6402fC5350c73')
-PANCAKE_ROUTER_ADDRESS = os.getenv('PANCAKE_ROUTER_ADDRESS', '0x10ED43C718714eb63d5aA57B78B54704E256024E')
\ No newline at end of file
+# Contract addresses on Mainnet - checksummed once here so contract construction never has to
+WBNB_ADDRESS = to_checksum_address(os.getenv('WBNB_ADDRESS', '0xbb4CdB9CBd36B01bD1cBaEBF2De08d9173bc095c'))
+BUSD_ADDRESS = to_checksum_address(os.getenv('BUSD_ADDRESS', '0xe9e7CEA3DedcA5984780Bafc599bD69ADd087D56'))
+PANCAKE_FACTORY_ADDRESS = to_checksum_address(os.getenv('PANCAKE_FACTORY_ADDRESS', '0xcA143Ce32Fe78f1f7019d7d551a6402fC5350c73'))
+PANCAKE_ROUTER_ADDRESS = to_checksum_address(os.getenv('PANCAKE_ROUTER_ADDRESS', '0x10ED43C718714eb63d5aA57B78B54704E256024E'))
+MULTICALL3_ADDRESS = to_checksum_address(os.getenv('MULTICALL3_ADDRESS', '0xcA11bde05977b3631167028862bE2a173976CA11'))
+# Lowercase form, for comparisons against addresses that aren't checksummed (database rows)
+WBNB_ADDRESS_LC = WBNB_ADDRESS.lower()
+
+# PancakeSwap V2 pair creation code hash (CREATE2 pair addresses) and swap fee
+PANCAKE_PAIR_INIT_CODE_HASH = os.getenv('PANCAKE_PAIR_INIT_CODE_HASH', '0x00fb7f630766e6a796048ea87d01acd3068e8ff67d078148a3fa3f4a84f69bd5')
+PANCAKE_SWAP_FEE_BPS = 25
+
+# Read-only snapshot of every setting above, taken once at import.
+# Other modules read settings from here (or the module constants), never from os.environ.
+CONFIG = MappingProxyType({
+    name: value for name, value in globals().items()
+    if name.isupper() and not name.startswith('_')
+})
\ No newline at end of file
@@ -1,15 +1,30 @@
+import time
+from functools import lru_cache
+
+from eth_utils import keccak, to_bytes
+
 from utils.logging_setup import logger
 from utils.web3_singleton import Web3Singleton
-from contracts.abis import TOKEN_ABI, PAIR_ABI, FACTORY_ABI, ROUTER_ABI
+from contracts.abis import TOKEN_ABI, PAIR_ABI, FACTORY_ABI, ROUTER_ABI, MULTICALL3_ABI, TAX_FUNCTIONS_ABI
 import config
 
-# Global contract instances
-factory_contract = None
-router_contract = None
+# Global contract instances, bound once by initialize_contracts()
+FACTORY = None
+ROUTER = None
+MULTICALL = None
+
+# Time of the last successful factory test call, so reconnect storms don't repeat it
+_last_healthy_ts = 0.0
+# How long a successful test call is trusted (seconds)
+_HEALTH_CHECK_TTL = 60
 
 def initialize_contracts():
     """Initialize contract instances using web3 connection"""
-    global factory_contract, router_contract
+    global FACTORY, ROUTER, MULTICALL, _last_healthy_ts
+    
+    # Already initialized and verified within the last minute
+    if FACTORY is not None and time.time() - _last_healthy_ts < _HEALTH_CHECK_TTL:
+        return True
     
     try:
         # Get web3 instance from singleton
@@ -26,6 +41,11 @@ def initialize_contracts():
             abi=ROUTER_ABI
         )
         
+        multicall_contract = w3.eth.contract(
+            address=config.MULTICALL3_ADDRESS,
+            abi=MULTICALL3_ABI
+        )
+        
         # Test the contracts to ensure they work
         try:
             factory_test = factory_contract.functions.getPair(
@@ -33,49 +53,120 @@ def initialize_contracts():
                 config.BUSD_ADDRESS
             ).call()
             
-            logger.info(f"Factory contract test: WBNB-BUSD pair = {factory_test}")
+            logger.info("Factory contract test: WBNB-BUSD pair = %s", factory_test)
         except Exception as e:
-            logger.error(f"Factory contract test failed: {e}")
+            logger.error("Factory contract test failed: %s", e)
             return False
         
+        FACTORY = factory_contract
+        ROUTER = router_contract
+        MULTICALL = multicall_contract
+        _last_healthy_ts = time.time()
+        
         logger.info("Contracts initialized successfully")
         return True
     except Exception as e:
-        logger.error(f"Error initializing contracts: {e}")
+        logger.error("Error initializing contracts: %s", e)
         return False
 
+# Unbound contract classes: the ABI is processed once, instances only add an address
+@lru_cache(maxsize=1)
+def _token_contract_class():
+    return Web3Singleton.get_instance().eth.contract(abi=TOKEN_ABI)
+
+@lru_cache(maxsize=1)
+def _pair_contract_class():
+    return Web3Singleton.get_instance().eth.contract(abi=PAIR_ABI)
+
+@lru_cache(maxsize=1)
+def _tax_contract_class():
+    return Web3Singleton.get_instance().eth.contract(abi=TAX_FUNCTIONS_ABI)
+
+@lru_cache(maxsize=4096)
+def _make_token_contract(token_address):
+    """Build a token contract instance (cached per address)"""
+    return _token_contract_class()(address=token_address)
+
+@lru_cache(maxsize=4096)
+def _make_pair_contract(pair_address):
+    """Build a pair contract instance (cached per address)"""
+    return _pair_contract_class()(address=pair_address)
+
+def clear_contract_caches():
+    """Drop cached contract classes and instances, e.g. after reconnecting to another RPC"""
+    global FACTORY, ROUTER, MULTICALL
+    
+    # Rebind the core contracts to the new connection (already verified, no test call needed)
+    if FACTORY is not None:
+        w3 = Web3Singleton.get_instance()
+        FACTORY = w3.eth.contract(address=config.PANCAKE_FACTORY_ADDRESS, abi=FACTORY_ABI)
+        ROUTER = w3.eth.contract(address=config.PANCAKE_ROUTER_ADDRESS, abi=ROUTER_ABI)
+        MULTICALL = w3.eth.contract(address=config.MULTICALL3_ADDRESS, abi=MULTICALL3_ABI)
+        
+    _token_contract_class.cache_clear()
+    _pair_contract_class.cache_clear()
+    _tax_contract_class.cache_clear()
+    _make_token_contract.cache_clear()
+    _make_pair_contract.cache_clear()
+
 def get_token_contract(token_address):
-    """Get token contract instance"""
+    """Get token contract instance (one per token, whatever the address casing)"""
     try:
-        w3 = Web3Singleton.get_instance()
-        return w3.eth.contract(address=token_address, abi=TOKEN_ABI)
+        return _make_token_contract(Web3Singleton.to_checksum_address(token_address))
+    except Exception as e:
+        logger.error("Error getting token contract: %s", e)
+        return None
+
+def get_tax_contract(token_address):
+    """Get a contract instance exposing the common tax getter functions of a token"""
+    try:
+        return _tax_contract_class()(address=Web3Singleton.to_checksum_address(token_address))
     except Exception as e:
-        logger.error(f"Error getting token contract: {e}")
+        logger.error("Error getting tax contract: %s", e)
         return None
 
 def get_pair_contract(pair_address):
-    """Get pair contract instance"""
+    """Get pair contract instance (one per pair, whatever the address casing)"""
     try:
-        w3 = Web3Singleton.get_instance()
-        return w3.eth.contract(address=pair_address, abi=PAIR_ABI)
+        return _make_pair_contract(Web3Singleton.to_checksum_address(pair_address))
     except Exception as e:
-        logger.error(f"Error getting pair contract: {e}")
+        logger.error("Error getting pair contract: %s", e)
         return None
 
-def get_factory_contract():
-    """Get factory contract instance"""
-    global factory_contract
+@lru_cache(maxsize=4096)
+def compute_pair_address(token_a, token_b=config.WBNB_ADDRESS):
+    """Compute the PancakeSwap V2 pair address of two tokens without an RPC call
+    
+    Same CREATE2 derivation as PancakeLibrary.pairFor: the pair address depends
+    only on the factory, the sorted token addresses and the pair init code hash.
+    It does not check that the pair is deployed: an address comes back for any
+    two tokens. Use tokendata.analysis.get_pair_address to ask the factory.
     
-    if factory_contract is None:
-        initialize_contracts()
+    Args:
+        token_a: Token address
+        token_b: Other token address (defaults to WBNB)
         
-    return factory_contract
+    Returns:
+        str: Checksummed pair address (the pair may not be deployed)
+    """
+    token0, token1 = sorted((token_a.lower(), token_b.lower()))
+    salt = keccak(to_bytes(hexstr=token0) + to_bytes(hexstr=token1))
+    digest = keccak(
+        b'\xff'
+        + to_bytes(hexstr=config.PANCAKE_FACTORY_ADDRESS)
+        + salt
+        + to_bytes(hexstr=config.PANCAKE_PAIR_INIT_CODE_HASH)
+    )
+    return Web3Singleton.to_checksum_address('0x' + digest[12:].hex())
+
+def get_factory_contract():
+    """Get factory contract instance (requires initialize_contracts())"""
+    return FACTORY
 
 def get_router_contract():
-    """Get router contract instance"""
-    global router_contract
-    
-    if router_contract is None:
-        initialize_contracts()
-        
-    return router_contract
\ No newline at end of file
+    """Get router contract instance (requires initialize_contracts())"""
+    return ROUTER
+
+def get_multicall_contract():
+    """Get Multicall3 contract instance (requires initialize_contracts())"""
+    return MULTICALL
\ No newline at end of file
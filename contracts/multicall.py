@@ -0,0 +1,125 @@
+"""
+Multicall3 helpers to batch read-only contract calls into a single eth_call
+"""
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+
+from eth_abi import encode
+from eth_utils import function_signature_to_4byte_selector
+from hexbytes import HexBytes
+from web3.exceptions import ContractLogicError
+
+from utils.logging_setup import logger
+from utils.web3_singleton import Web3Singleton
+from contracts.interfaces import get_multicall_contract
+import config
+
+# Maximum number of calls sent in one aggregate3 request
+MULTICALL_BATCH_SIZE = 100
+
+# Result of aggregate3: one (success, returnData) per call
+_AGGREGATE3_OUTPUT_TYPES = ['(bool,bytes)[]']
+
+# Threads for call_concurrently. The executor is built at import, but its threads only
+# start as calls are submitted and are then reused
+_call_pool = ThreadPoolExecutor(max_workers=config.RPC_PARALLELISM, thread_name_prefix="rpc-call")
+
+def _output_types(contract_function):
+    """Get the ABI output types of a bound contract function"""
+    return [output['type'] for output in contract_function.abi['outputs']]
+
+@lru_cache(maxsize=256)
+def _selector(fn_name, input_types):
+    """4-byte selector of a function signature (computed once per signature)"""
+    return function_signature_to_4byte_selector(f"{fn_name}({','.join(input_types)})")
+
+def _call_data(contract_function):
+    """ABI-encode a bound contract function call
+    
+    Calls with static argument types (balanceOf, allowance, getAmountsOut...) are encoded
+    from the cached selector, skipping web3's per-call ABI lookup and argument validation.
+    """
+    input_types = tuple(arg['type'] for arg in contract_function.abi['inputs'])
+    if not any(input_type.startswith('tuple') for input_type in input_types):
+        try:
+            return _selector(contract_function.fn_name, input_types) + encode(input_types, contract_function.args)
+        except Exception:
+            # e.g. an argument web3 would normalize first, fall back to its encoder
+            pass
+    return HexBytes(contract_function._encode_transaction_data())
+
+def multicall(contract_functions, batch_size=MULTICALL_BATCH_SIZE, race=False):
+    """Execute several read-only contract calls with Multicall3
+
+    Args:
+        contract_functions: Bound contract functions, e.g. token.functions.decimals()
+        batch_size: Maximum number of calls per eth_call
+        race: Send each eth_call to the fastest endpoints at once (Web3Singleton.call_race),
+              for reads that need not come from the latest block, such as quotes
+
+    Returns:
+        list: Decoded result per call, in order - a single value for functions with
+              one output, a tuple otherwise, None for calls that reverted.
+              Address outputs are checksummed.
+
+    Raises:
+        Exception: If the multicall itself fails (RPC error, no Multicall3 contract)
+    """
+    if not contract_functions:
+        return []
+
+    w3 = Web3Singleton.get_instance()
+    multicall_contract = get_multicall_contract()
+
+    results = []
+    for batch_start in range(0, len(contract_functions), batch_size):
+        batch = contract_functions[batch_start:batch_start + batch_size]
+        aggregate = multicall_contract.functions.aggregate3([(fn.address, True, _call_data(fn)) for fn in batch])
+        if race:
+            transaction = {'to': aggregate.address, 'data': aggregate._encode_transaction_data()}
+            raw = Web3Singleton.call_race(lambda racer: racer.eth.call(transaction))
+            outcomes = w3.codec.decode(_AGGREGATE3_OUTPUT_TYPES, raw)[0]
+        else:
+            outcomes = aggregate.call()
+
+        for fn, (success, return_data) in zip(batch, outcomes):
+            if not success or not return_data:
+                results.append(None)
+                continue
+
+            try:
+                output_types = _output_types(fn)
+                values = w3.codec.decode(output_types, return_data)
+                # Checksum addresses, the same as a direct .call() returns them
+                values = tuple(
+                    Web3Singleton.to_checksum_address(value) if output_type == 'address' else value
+                    for output_type, value in zip(output_types, values)
+                )
+            except Exception as e:
+                logger.warning("Failed to decode multicall result for %s on %s: %s", fn.fn_name, fn.address, e)
+                results.append(None)
+                continue
+
+            results.append(values[0] if len(values) == 1 else values)
+
+    return results
+
+def call_concurrently(contract_functions):
+    """Execute read-only contract calls as parallel eth_calls, for when Multicall3 can't be used
+
+    Args:
+        contract_functions: Bound contract functions, e.g. token.functions.decimals()
+
+    Returns:
+        list: Result per call, in order, None for calls that reverted (like multicall)
+
+    Raises:
+        Exception: If any call fails for another reason (RPC error)
+    """
+    def call(contract_function):
+        try:
+            return contract_function.call()
+        except ContractLogicError:
+            return None
+
+    return list(_call_pool.map(call, contract_functions))
@@ -1,11 +1,19 @@
 import sqlite3
+import threading
 from utils.logging_setup import logger
 
+DB_PATH = 'portfolio.db'
+
+# One connection per thread, reused for the lifetime of the thread
+_local = threading.local()
+
 def initialize_database():
     """Set up database tables if they don't exist"""
+    conn = None
     try:
-        conn = sqlite3.connect('portfolio.db')
+        conn = get_connection()
         cursor = conn.cursor()
+        cursor.execute('BEGIN')
         
         # Create portfolio table if it doesn't exist
         cursor.execute('''
@@ -16,10 +24,11 @@ def initialize_database():
             amount_tokens REAL NOT NULL,
             purchase_price_bnb REAL NOT NULL,
             investment_amount_bnb REAL NOT NULL,
-            purchase_time TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            purchase_time INTEGER DEFAULT (CAST(strftime('%s', 'now') AS INTEGER)),
             take_profit_target REAL NOT NULL,
             stop_loss_target REAL NOT NULL,
-            status TEXT DEFAULT 'active'
+            status TEXT DEFAULT 'active',
+            token_decimals INTEGER
         )
         ''')
         
@@ -33,7 +42,7 @@ def initialize_database():
             amount_tokens REAL,
             amount_bnb REAL,
             transaction_hash TEXT,
-            timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            timestamp INTEGER DEFAULT (CAST(strftime('%s', 'now') AS INTEGER)),
             profit_loss_bnb REAL
         )
         ''')
@@ -48,18 +57,87 @@ def initialize_database():
         )
         ''')
         
+        # Create failed transactions table for post-mortem analysis
+        cursor.execute('''
+        CREATE TABLE IF NOT EXISTS failed_transactions (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            token_address TEXT NOT NULL,
+            token_symbol TEXT NOT NULL,
+            transaction_type TEXT NOT NULL,
+            amount REAL,
+            tx_hash TEXT,
+            error_reason TEXT,
+            timestamp TEXT NOT NULL
+        )
+        ''')
+        
+        # Create token metadata cache (ERC20 name/symbol/decimals never change)
+        cursor.execute('''
+        CREATE TABLE IF NOT EXISTS token_metadata (
+            token_address TEXT PRIMARY KEY,
+            name TEXT,
+            symbol TEXT,
+            decimals INTEGER NOT NULL
+        )
+        ''')
+        
+        # Older databases have no token_decimals column; fill it from the metadata cache where possible
+        portfolio_columns = [row[1] for row in cursor.execute('PRAGMA table_info(portfolio)')]
+        if 'token_decimals' not in portfolio_columns:
+            cursor.execute('ALTER TABLE portfolio ADD COLUMN token_decimals INTEGER')
+        cursor.execute('''
+        UPDATE portfolio SET token_decimals = (
+            SELECT decimals FROM token_metadata WHERE token_metadata.token_address = portfolio.token_address
+        )
+        WHERE token_decimals IS NULL
+        ''')
+        
+        # Older databases stored CURRENT_TIMESTAMP strings, convert them to epoch seconds
+        cursor.execute('''
+        UPDATE portfolio SET purchase_time = CAST(strftime('%s', purchase_time) AS INTEGER)
+        WHERE typeof(purchase_time) = 'text'
+        ''')
+        cursor.execute('''
+        UPDATE transactions SET timestamp = CAST(strftime('%s', timestamp) AS INTEGER)
+        WHERE typeof(timestamp) = 'text'
+        ''')
+
+        # Indexes for the monitoring loop and dashboard queries
+        # (blacklisted_tokens.token_address is already indexed as the primary key)
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_portfolio_status ON portfolio(status, purchase_time)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_tx_type_ts ON transactions(transaction_type, timestamp DESC)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_tx_ts ON transactions(timestamp)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_failed_token_type ON failed_transactions(token_address, transaction_type)')
+
         conn.commit()
-        conn.close()
         logger.info("Database initialized successfully")
         return True
     except Exception as e:
         logger.error(f"Error initializing database: {e}")
+        if conn is not None and conn.in_transaction:
+            conn.rollback()
         return False
 
 def get_connection():
-    """Get a database connection"""
+    """Get the database connection for the current thread
+
+    The connection is opened once per thread and kept alive, in autocommit
+    mode with WAL journaling, so callers must not close it.
+    """
+    conn = getattr(_local, 'conn', None)
+    if conn is not None:
+        return conn
+        
     try:
-        return sqlite3.connect('portfolio.db')
+        conn = sqlite3.connect(DB_PATH, check_same_thread=False, isolation_level=None, cached_statements=256)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        conn.execute('PRAGMA temp_store=MEMORY')
+        conn.execute('PRAGMA mmap_size=268435456')
+        # Rows are accessible by column name without building a dict per row
+        conn.row_factory = sqlite3.Row
+        _local.conn = conn
+        return conn
     except Exception as e:
         logger.error(f"Error connecting to database: {e}")
         return None
\ No newline at end of file
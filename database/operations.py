@@ -1,6 +1,67 @@
+import time
+import threading
+from datetime import datetime, timezone
+
 from utils.logging_setup import logger
 from database.models import get_connection
 
+# SQL text kept as module constants so SQLite's prepared statement cache
+# is hit with the same string on every call
+_INSERT_FAILED = '''
+INSERT INTO failed_transactions 
+(token_address, token_symbol, transaction_type, amount, tx_hash, error_reason, timestamp)
+VALUES (?, ?, ?, ?, ?, ?, ?)
+'''
+
+_COUNT_FAILED = '''
+SELECT COUNT(*) FROM failed_transactions
+WHERE token_address = ? AND transaction_type = ?
+'''
+
+_SELECT_BLACKLIST = "SELECT token_address FROM blacklisted_tokens"
+
+_INSERT_BLACKLIST = '''
+INSERT OR REPLACE INTO blacklisted_tokens 
+(token_address, token_symbol, reason) 
+VALUES (?, ?, ?)
+'''
+
+_DELETE_BLACKLIST = "DELETE FROM blacklisted_tokens WHERE lower(token_address) = ?"
+
+_INSERT_PORTFOLIO = '''
+INSERT INTO portfolio
+(token_address, token_symbol, amount_tokens, purchase_price_bnb, investment_amount_bnb, take_profit_target, stop_loss_target, purchase_time, token_decimals)
+VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+'''
+
+_UPDATE_STATUS = '''
+UPDATE portfolio
+SET status = ?
+WHERE id = ?
+'''
+
+_UPDATE_DECIMALS = '''
+UPDATE portfolio
+SET token_decimals = ?
+WHERE token_address = ? AND token_decimals IS NULL
+'''
+
+_SELECT_ACTIVE = '''
+SELECT id, token_address, token_symbol, amount_tokens, purchase_price_bnb,
+       investment_amount_bnb, purchase_time, take_profit_target, stop_loss_target, token_decimals
+FROM portfolio
+WHERE status = 'active'
+'''
+
+_SELECT_ACTIVE_EXPIRED = _SELECT_ACTIVE + ' AND purchase_time <= ?'
+_SELECT_ACTIVE_HELD = _SELECT_ACTIVE + ' AND purchase_time > ?'
+
+_INSERT_TX = '''
+INSERT INTO transactions
+(token_address, token_symbol, transaction_type, amount_tokens, amount_bnb, transaction_hash, profit_loss_bnb, timestamp)
+VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+'''
+
 def record_failed_transaction(token_address, token_symbol, transaction_type, 
                              amount, tx_hash=None, error_reason=None):
     """
@@ -22,38 +83,60 @@ def record_failed_transaction(token_address, token_symbol, transaction_type,
         if not conn:
             return False
             
-        cursor = conn.cursor()
-        
-        # Create table if not exists
-        cursor.execute('''
-        CREATE TABLE IF NOT EXISTS failed_transactions (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            token_address TEXT NOT NULL,
-            token_symbol TEXT NOT NULL,
-            transaction_type TEXT NOT NULL,
-            amount REAL,
-            tx_hash TEXT,
-            error_reason TEXT,
-            timestamp TEXT NOT NULL
-        )
-        ''')
+        # Same format as SQLite's datetime('now'), computed here so the insert is a plain bound statement
+        timestamp = datetime.now(timezone.utc).strftime('%Y-%m-%d %H:%M:%S')
         
-        # Insert failed transaction
-        cursor.execute('''
-        INSERT INTO failed_transactions 
-        (token_address, token_symbol, transaction_type, amount, tx_hash, error_reason, timestamp)
-        VALUES (?, ?, ?, ?, ?, ?, datetime('now'))
-        ''', (token_address, token_symbol, transaction_type, amount, tx_hash, error_reason))
-        
-        conn.commit()
-        conn.close()
+        conn.execute(_INSERT_FAILED, (
+            token_address, token_symbol, transaction_type, amount, tx_hash, error_reason, timestamp
+        ))
         
         return True
     except Exception as e:
-        logger.error(f"Error recording failed transaction: {e}")
+        logger.error("Error recording failed transaction: %s", e)
         return False
 
+def count_failed_sells(token_address):
+    """Count the recorded failed sells of a token
+    
+    Args:
+        token_address: Token address
+        
+    Returns:
+        int: Number of failed sells or None on database error
+    """
+    try:
+        conn = get_connection()
+        if not conn:
+            return None
+            
+        return conn.execute(_COUNT_FAILED, (token_address, 'sell')).fetchone()[0]
+    except Exception as e:
+        logger.error("Error counting failed sells: %s", e)
+        return None
+
 # Blacklist operations
+# In-memory copy of blacklisted_tokens with lowercased addresses, loaded on
+# first lookup (the table is small) and kept in sync by add/remove
+_BLACKLIST_SET = None
+_BLACKLIST_LOCK = threading.Lock()
+
+def _get_blacklist_set():
+    """Get the in-memory blacklist, loading it from the database if needed"""
+    global _BLACKLIST_SET
+    with _BLACKLIST_LOCK:
+        if _BLACKLIST_SET is None:
+            conn = get_connection()
+            if not conn:
+                return set()
+            _BLACKLIST_SET = {row[0].lower() for row in conn.execute(_SELECT_BLACKLIST)}
+        return _BLACKLIST_SET
+
+def invalidate_blacklist_cache():
+    """Drop the in-memory blacklist so the next lookup reloads it from the database"""
+    global _BLACKLIST_SET
+    with _BLACKLIST_LOCK:
+        _BLACKLIST_SET = None
+
 def is_token_blacklisted(token_address):
     """Check if a token is blacklisted
     
@@ -64,20 +147,10 @@ def is_token_blacklisted(token_address):
         bool: True if token is blacklisted, False otherwise
     """
     try:
-        conn = get_connection()
-        if not conn:
-            return False
-            
-        cursor = conn.cursor()
-        
         # Check if token is in blacklist
-        cursor.execute("SELECT token_address FROM blacklisted_tokens WHERE token_address = ?", (token_address,))
-        result = cursor.fetchone()
-        
-        conn.close()
-        return result is not None
+        return token_address.lower() in _get_blacklist_set()
     except Exception as e:
-        logger.error(f"Error checking blacklist: {e}")
+        logger.error("Error checking blacklist: %s", e)
         return False  # Default to not blacklisted in case of database error
 
 def add_to_blacklist(token_address, token_symbol, reason):
@@ -96,26 +169,45 @@ def add_to_blacklist(token_address, token_symbol, reason):
         if not conn:
             return False
             
-        cursor = conn.cursor()
-        
         # Add token to blacklist
-        cursor.execute('''
-        INSERT OR REPLACE INTO blacklisted_tokens 
-        (token_address, token_symbol, reason) 
-        VALUES (?, ?, ?)
-        ''', (token_address, token_symbol, reason))
+        conn.execute(_INSERT_BLACKLIST, (token_address, token_symbol, reason))
+        blacklist = _get_blacklist_set()
+        with _BLACKLIST_LOCK:
+            blacklist.add(token_address.lower())
         
-        conn.commit()
-        conn.close()
+        logger.warning("Added %s (%s) to blacklist. Reason: %s", token_symbol, token_address, reason)
+        return True
+    except Exception as e:
+        logger.error("Error adding to blacklist: %s", e)
+        return False
+
+def remove_from_blacklist(token_address):
+    """Remove a token from the blacklist
+    
+    Args:
+        token_address: Token address to remove from blacklist
         
-        logger.warning(f"Added {token_symbol} ({token_address}) to blacklist. Reason: {reason}")
+    Returns:
+        bool: True if operation was successful, False otherwise
+    """
+    try:
+        conn = get_connection()
+        if not conn:
+            return False
+            
+        conn.execute(_DELETE_BLACKLIST, (token_address.lower(),))
+        blacklist = _get_blacklist_set()
+        with _BLACKLIST_LOCK:
+            blacklist.discard(token_address.lower())
+        
+        logger.info("Removed %s from blacklist", token_address)
         return True
     except Exception as e:
-        logger.error(f"Error adding to blacklist: {e}")
+        logger.error("Error removing from blacklist: %s", e)
         return False
 
 # Portfolio operations
-def add_to_portfolio(token_address, token_symbol, amount_tokens, purchase_price_bnb, investment_amount_bnb, take_profit, stop_loss):
+def add_to_portfolio(token_address, token_symbol, amount_tokens, purchase_price_bnb, investment_amount_bnb, take_profit, stop_loss, token_decimals=None):
     """Add a token to the portfolio
     
     Args:
@@ -126,6 +218,7 @@ def add_to_portfolio(token_address, token_symbol, amount_tokens, purchase_price_
         investment_amount_bnb: Total investment in BNB
         take_profit: Take profit percentage
         stop_loss: Stop loss percentage
+        token_decimals: Token decimals, stored so monitoring never has to fetch them
         
     Returns:
         int: Portfolio entry ID if successful, None otherwise
@@ -135,23 +228,14 @@ def add_to_portfolio(token_address, token_symbol, amount_tokens, purchase_price_
         if not conn:
             return None
             
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-        INSERT INTO portfolio
-        (token_address, token_symbol, amount_tokens, purchase_price_bnb, investment_amount_bnb, take_profit_target, stop_loss_target)
-        VALUES (?, ?, ?, ?, ?, ?, ?)
-        ''', (token_address, token_symbol, amount_tokens, purchase_price_bnb, investment_amount_bnb, take_profit, stop_loss))
-        
-        portfolio_id = cursor.lastrowid
+        portfolio_id = conn.execute(_INSERT_PORTFOLIO, (
+            token_address, token_symbol, amount_tokens, purchase_price_bnb, investment_amount_bnb, take_profit, stop_loss, int(time.time()), token_decimals
+        )).lastrowid
         
-        conn.commit()
-        conn.close()
-        
-        logger.info(f"Added {token_symbol} to portfolio with ID {portfolio_id}")
+        logger.info("Added %s to portfolio with ID %s", token_symbol, portfolio_id)
         return portfolio_id
     except Exception as e:
-        logger.error(f"Error adding to portfolio: {e}")
+        logger.error("Error adding to portfolio: %s", e)
         return None
 
 def update_portfolio_status(portfolio_id, status):
@@ -169,54 +253,72 @@ def update_portfolio_status(portfolio_id, status):
         if not conn:
             return False
             
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-        UPDATE portfolio
-        SET status = ?
-        WHERE id = ?
-        ''', (status, portfolio_id))
-        
-        conn.commit()
-        conn.close()
+        conn.execute(_UPDATE_STATUS, (status, portfolio_id))
         
-        logger.info(f"Updated portfolio entry {portfolio_id} status to {status}")
+        logger.info("Updated portfolio entry %s status to %s", portfolio_id, status)
         return True
     except Exception as e:
-        logger.error(f"Error updating portfolio status: {e}")
+        logger.error("Error updating portfolio status: %s", e)
         return False
 
-def get_active_portfolio():
-    """Get all active portfolio entries
+def set_portfolio_decimals(token_address, token_decimals):
+    """Backfill token_decimals on portfolio rows created without it
     
+    Args:
+        token_address: Token address
+        token_decimals: Token decimals
+        
     Returns:
-        list: List of active portfolio entries
+        bool: True if operation was successful, False otherwise
     """
     try:
         conn = get_connection()
         if not conn:
-            return []
+            return False
             
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-        SELECT id, token_address, token_symbol, amount_tokens, purchase_price_bnb,
-               investment_amount_bnb, purchase_time, take_profit_target, stop_loss_target
-        FROM portfolio
-        WHERE status = 'active'
-        ''')
-        
-        columns = [column[0] for column in cursor.description]
-        results = []
+        conn.execute(_UPDATE_DECIMALS, (token_decimals, token_address))
+        return True
+    except Exception as e:
+        logger.error("Error updating portfolio decimals: %s", e)
+        return False
+
+def iter_active_portfolio(max_holding_time=None, expired=False):
+    """Iterate over active portfolio entries without materializing them all
+    
+    Args:
+        max_holding_time: Maximum holding time in hours, None for every active entry
+        expired: With max_holding_time, yield only the entries held at least that long
+                 (True) or only the entries still within it (False)
         
-        for row in cursor.fetchall():
-            results.append(dict(zip(columns, row)))
+    Yields:
+        sqlite3.Row: Active portfolio entry (access columns by name)
+    """
+    try:
+        conn = get_connection()
+        if not conn:
+            return
             
-        conn.close()
-        return results
+        if max_holding_time is None:
+            yield from conn.execute(_SELECT_ACTIVE)
+            return
+            
+        cutoff = int(time.time() - max_holding_time * 3600)
+        query = _SELECT_ACTIVE_EXPIRED if expired else _SELECT_ACTIVE_HELD
+        yield from conn.execute(query, (cutoff,))
     except Exception as e:
-        logger.error(f"Error getting active portfolio: {e}")
-        return []
+        logger.error("Error getting active portfolio: %s", e)
+
+def get_active_portfolio(max_holding_time=None, expired=False):
+    """Get all active portfolio entries
+    
+    Args:
+        max_holding_time: Maximum holding time in hours, None for every active entry
+        expired: See iter_active_portfolio
+        
+    Returns:
+        list: Active portfolio entries as sqlite3.Row (access columns by name)
+    """
+    return list(iter_active_portfolio(max_holding_time, expired))
 
 # Transaction operations
 def record_transaction(token_address, token_symbol, transaction_type, amount_tokens, amount_bnb, transaction_hash, profit_loss_bnb=None):
@@ -239,21 +341,46 @@ def record_transaction(token_address, token_symbol, transaction_type, amount_tok
         if not conn:
             return None
             
-        cursor = conn.cursor()
+        transaction_id = conn.execute(_INSERT_TX, (
+            token_address, token_symbol, transaction_type, amount_tokens, amount_bnb, transaction_hash, profit_loss_bnb, int(time.time())
+        )).lastrowid
         
-        cursor.execute('''
-        INSERT INTO transactions
-        (token_address, token_symbol, transaction_type, amount_tokens, amount_bnb, transaction_hash, profit_loss_bnb)
-        VALUES (?, ?, ?, ?, ?, ?, ?)
-        ''', (token_address, token_symbol, transaction_type, amount_tokens, amount_bnb, transaction_hash, profit_loss_bnb))
+        logger.info("Recorded %s transaction for %s with ID %s", transaction_type, token_symbol, transaction_id)
+        return transaction_id
+    except Exception as e:
+        logger.error("Error recording transaction: %s", e)
+        return None
+
+def record_transactions_bulk(rows):
+    """Record several transactions in a single database transaction
+    
+    Args:
+        rows: Tuples of (token_address, token_symbol, transaction_type, amount_tokens,
+              amount_bnb, transaction_hash, profit_loss_bnb), as for record_transaction
         
-        transaction_id = cursor.lastrowid
+    Returns:
+        int: Number of transactions recorded (0 if nothing was recorded)
+    """
+    timestamp = int(time.time())
+    rows = [tuple(row) + (timestamp,) for row in rows]
+    if not rows:
+        return 0
         
-        conn.commit()
-        conn.close()
+    conn = None
+    try:
+        conn = get_connection()
+        if not conn:
+            return 0
+            
+        # One commit (and one WAL sync) for the whole batch
+        conn.execute('BEGIN')
+        conn.executemany(_INSERT_TX, rows)
+        conn.execute('COMMIT')
         
-        logger.info(f"Recorded {transaction_type} transaction for {token_symbol} with ID {transaction_id}")
-        return transaction_id
+        logger.info("Recorded %s transactions in bulk", len(rows))
+        return len(rows)
     except Exception as e:
-        logger.error(f"Error recording transaction: {e}")
-        return None
\ No newline at end of file
+        logger.error("Error recording transactions in bulk: %s", e)
+        if conn is not None and conn.in_transaction:
+            conn.rollback()
+        return 0
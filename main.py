@@ -1,20 +1,55 @@
-import time
+import os
 import argparse
+import csv
+import signal
 import sys
+import threading
 
 # Initialize logger first
 from utils.logging_setup import logger
 
 # Import other modules
 from utils.web3_singleton import Web3Singleton, initialize_web3_addresses
-from utils.helpers import print_banner, get_portfolio_summary, get_transaction_history, calculate_total_profits
+from utils.gas_tracker import GAS_TRACKER
+from utils.helpers import (print_banner, get_portfolio_summary, get_transaction_history, calculate_total_profits,
+                           PORTFOLIO_SUMMARY_COLUMNS, TRANSACTION_HISTORY_COLUMNS)
 from contracts.interfaces import initialize_contracts
 from database.models import initialize_database
 from portfolio.management import start_portfolio_monitoring
 # Change 'token' to 'tokendata' in these imports
 from tokendata.analysis import analyze_token  
-from tokendata.discovery import start_pair_listener, scan_recent_blocks
+from tokendata.discovery import start_pair_listener
+from tokendata.discovery_async import scan_recent_blocks_parallel
 from trading.buy import execute_buy
+import config
+
+# Set to shut down; the main thread parks on it instead of polling
+_stop = threading.Event()
+
+def _request_shutdown(signum=None, frame=None):
+    """Signal handler that wakes the main thread for a clean shutdown"""
+    _stop.set()
+
+def wait_for_shutdown():
+    """Park the main thread until shutdown is requested (Ctrl+C or SIGTERM)"""
+    try:
+        if os.name == 'nt':
+            # Event.wait() without a timeout can't be interrupted by Ctrl+C on Windows
+            while not _stop.wait(1):
+                pass
+        else:
+            _stop.wait()
+    except KeyboardInterrupt:
+        _stop.set()
+        
+    logger.info("Shutting down...")
+    sys.exit(0)
+
+def _print_rows(rows, columns):
+    """Print report rows to stdout as tab-separated values with a header"""
+    writer = csv.DictWriter(sys.stdout, fieldnames=columns, delimiter='\t', lineterminator='\n')
+    writer.writeheader()
+    writer.writerows(rows)
 
 def initialize_system():
     """Initialize the system components"""
@@ -62,6 +97,10 @@ def run_token_sniper(token_address=None, bnb_amount=None, scan_blocks=None, auto
     # Start portfolio monitoring
     monitoring_thread = start_portfolio_monitoring()
     
+    # Keep the gas price in memory for sends (without a WebSocket endpoint it's read per send)
+    if config.BSC_WS_ENDPOINT:
+        GAS_TRACKER.start()
+    
     if token_address:
         # Single token mode
         logger.info(f"Analyzing token: {token_address}")
@@ -71,12 +110,18 @@ def run_token_sniper(token_address=None, bnb_amount=None, scan_blocks=None, auto
         if token_analysis:
             logger.info(f"Token analysis successful: {token_analysis['symbol']} ({token_analysis['name']})")
             
-            if bnb_amount:
+            if bnb_amount and not token_analysis['sell_history_checked']:
+                logger.warning(f"Sell history of {token_analysis['symbol']} could not be checked, not buying")
+            elif bnb_amount:
                 # Execute buy if BNB amount specified
                 logger.info(f"Executing buy for {token_analysis['symbol']}: {bnb_amount} BNB")
                 
                 buy_result = execute_buy(token_address, bnb_amount)
                 
+                # Single token mode exits afterwards, so wait for the buy to be mined and recorded
+                if buy_result:
+                    buy_result = buy_result['confirmation'].result()
+                    
                 if buy_result and buy_result['status'] == 'success':
                     logger.info(f"Buy successful: {buy_result['token_balance']} {token_analysis['symbol']} for {buy_result['bnb_spent']} BNB")
                 else:
@@ -88,7 +133,7 @@ def run_token_sniper(token_address=None, bnb_amount=None, scan_blocks=None, auto
     elif scan_blocks:
         # Scan recent blocks mode
         logger.info(f"Scanning {scan_blocks} recent blocks for new pairs")
-        processed_pairs = scan_recent_blocks(scan_blocks)
+        processed_pairs = scan_recent_blocks_parallel(scan_blocks)
         logger.info(f"Processed {len(processed_pairs)} pairs from recent blocks")
         
         # Continue with auto mode if enabled
@@ -96,13 +141,8 @@ def run_token_sniper(token_address=None, bnb_amount=None, scan_blocks=None, auto
             # Start pair listener
             listener_thread = start_pair_listener()
             
-            try:
-                # Keep main thread alive
-                while True:
-                    time.sleep(1)
-            except KeyboardInterrupt:
-                logger.info("Shutting down...")
-                sys.exit(0)
+            # Keep main thread alive
+            wait_for_shutdown()
     elif auto_mode:
         # Automatic discovery mode
         logger.info("Starting automatic discovery mode")
@@ -110,24 +150,14 @@ def run_token_sniper(token_address=None, bnb_amount=None, scan_blocks=None, auto
         # Start pair listener
         listener_thread = start_pair_listener()
         
-        try:
-            # Keep main thread alive
-            while True:
-                time.sleep(1)
-        except KeyboardInterrupt:
-            logger.info("Shutting down...")
-            sys.exit(0)
+        # Keep main thread alive
+        wait_for_shutdown()
     else:
         # Monitoring mode only
         logger.info("No token address specified. Running in monitoring mode only.")
         
-        try:
-            # Keep main thread alive
-            while True:
-                time.sleep(1)
-        except KeyboardInterrupt:
-            logger.info("Shutting down...")
-            sys.exit(0)
+        # Keep main thread alive
+        wait_for_shutdown()
 
 def main():
     """Main entry point"""
@@ -138,10 +168,14 @@ def main():
     parser.add_argument('--auto', action='store_true', help='Enable automatic discovery mode')
     parser.add_argument('--portfolio', '-p', action='store_true', help='Show portfolio summary')
     parser.add_argument('--transactions', action='store_true', help='Show transaction history')
+    parser.add_argument('--tail', type=int, default=50, help='Number of most recent transactions to show (default: 50)')
     parser.add_argument('--profits', action='store_true', help='Show profit summary')
     
     args = parser.parse_args()
     
+    # Let systemd/docker stop requests shut down as cleanly as Ctrl+C
+    signal.signal(signal.SIGTERM, _request_shutdown)
+    
     # Initialize system
     if not initialize_system():
         logger.error("System initialization failed")
@@ -152,15 +186,15 @@ def main():
         portfolio = get_portfolio_summary()
         if portfolio is not None:
             print("\n=== PORTFOLIO SUMMARY ===")
-            print(portfolio.to_string(index=False))
+            _print_rows(portfolio, PORTFOLIO_SUMMARY_COLUMNS)
             print()
         
     # Show transaction history if requested
     if args.transactions:
-        transactions = get_transaction_history()
+        transactions = get_transaction_history(limit=args.tail)
         if transactions is not None:
             print("\n=== TRANSACTION HISTORY ===")
-            print(transactions.to_string(index=False))
+            _print_rows(transactions, TRANSACTION_HISTORY_COLUMNS)
             print()
         
     # Show profits if requested
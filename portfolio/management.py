@@ -1,25 +1,35 @@
+import asyncio
 import time
 import threading
-from datetime import datetime, timedelta
+from datetime import datetime
+
+import numpy as np
 
 from utils.logging_setup import logger
-from utils.connections import web3, get_web3_connection
+from utils.web3_singleton import Web3Singleton
+from contracts.abis import SYNC_TOPIC
+from contracts.interfaces import compute_pair_address
 from database.operations import get_active_portfolio
-from tokendata.analysis import fetch_token_data
-from trading.sell import estimate_bnb_output, execute_sell
+from portfolio.valuations import value_portfolio_entries_async, value_entries_from_reserves, get_entry_decimals
+from tokendata.cache import get_token_decimals
+from trading.sell import estimate_bnb_output, execute_sells
 import config
 
-def calculate_current_value(token_address, token_amount, token_decimals):
+def calculate_current_value(token_address, token_amount, token_decimals=None):
     """Calculate current value of tokens in BNB
     
     Args:
         token_address: Token address
         token_amount: Amount of tokens
-        token_decimals: Token decimals
+        token_decimals: Token decimals (looked up in the metadata cache if None)
         
     Returns:
         float: Current value in BNB or None if calculation fails
     """
+    if token_decimals is None:
+        token_decimals = get_token_decimals(token_address)
+        if token_decimals is None:
+            return None
     return estimate_bnb_output(token_address, token_amount, token_decimals)
 
 def should_take_profit(current_value, investment_amount, take_profit_target):
@@ -70,143 +80,229 @@ def should_sell_by_time(purchase_time, max_holding_time):
     """Check if we should sell based on holding time
     
     Args:
-        purchase_time: Purchase time as string or datetime
+        purchase_time: Purchase time as epoch seconds, string or datetime
         max_holding_time: Maximum holding time in hours
         
     Returns:
         bool: True if should sell, False otherwise
     """
-    if isinstance(purchase_time, str):
-        purchase_datetime = datetime.strptime(purchase_time, '%Y-%m-%d %H:%M:%S')
+    if isinstance(purchase_time, (int, float)):
+        seconds_held = time.time() - purchase_time
     else:
-        purchase_datetime = purchase_time
-        
-    time_held = datetime.now() - purchase_datetime
-    max_holding_timedelta = timedelta(hours=max_holding_time)
+        if isinstance(purchase_time, str):
+            purchase_time = datetime.strptime(purchase_time, '%Y-%m-%d %H:%M:%S')
+        seconds_held = (datetime.now() - purchase_time).total_seconds()
     
-    if time_held >= max_holding_timedelta:
-        hours_held = time_held.total_seconds() / 3600
+    if seconds_held >= max_holding_time * 3600:
+        hours_held = seconds_held / 3600
         logger.info(f"Time-based sell triggered: Held for {hours_held:.2f} hours (max: {max_holding_time} hours)")
         return True
         
     return False
 
-def monitor_portfolio():
-    """Monitor portfolio and take profit/stop loss as needed"""
-    try:
-        # Check web3 connection
-        if web3 is None or not web3.is_connected():
-            logger.warning("Web3 connection lost during portfolio monitoring, reconnecting...")
-            get_web3_connection()
+def _sell_triggers(valued_entries):
+    """Decide which valued portfolio entries hit their take profit or stop loss, in one NumPy pass
+    
+    Args:
+        valued_entries: (entry, token_decimals, current_value) tuples - None values when unavailable
+        
+    Returns:
+        list: (entry, trigger, token_decimals) of every entry to sell, trigger being 'take_profit' or 'stop_loss'
+    """
+    valued = []
+    for entry, token_decimals, current_value in valued_entries:
+        if token_decimals is None:
+            logger.warning(f"Failed to fetch data for {entry['token_symbol']} ({entry['token_address']})")
+        elif current_value is None:
+            logger.warning(f"Failed to calculate current value for {entry['token_symbol']}")
+        else:
+            valued.append((entry, token_decimals, current_value))
             
-        # Get active portfolio entries
-        portfolio_entries = get_active_portfolio()
+    if not valued:
+        return []
         
-        if not portfolio_entries:
+    current = np.array([current_value for _, _, current_value in valued], dtype=float)
+    invested = np.array([entry['investment_amount_bnb'] for entry, _, _ in valued], dtype=float)
+    take_profit = np.array([entry['take_profit_target'] for entry, _, _ in valued], dtype=float)
+    stop_loss = np.array([entry['stop_loss_target'] for entry, _, _ in valued], dtype=float)
+    
+    # Profit percentage (negative for a loss); entries without a valid investment trigger nothing
+    with np.errstate(divide='ignore', invalid='ignore'):
+        change = (current - invested) / invested * 100
+    valid = np.isfinite(change)
+    take_profit_hit = valid & (change >= take_profit)
+    stop_loss_hit = valid & ~take_profit_hit & (-change >= stop_loss)
+    
+    sells = []
+    for i in np.flatnonzero(take_profit_hit | stop_loss_hit):
+        entry, token_decimals, current_value = valued[i]
+        if take_profit_hit[i]:
+            logger.info(f"Taking profit on {entry['token_symbol']}: {change[i]:.2f}% profit (target: {entry['take_profit_target']}%), value {current_value} BNB")
+            sells.append((entry, 'take_profit', token_decimals))
+        else:
+            logger.info(f"Stopping loss on {entry['token_symbol']}: {-change[i]:.2f}% loss (target: {entry['stop_loss_target']}%), value {current_value} BNB")
+            sells.append((entry, 'stop_loss', token_decimals))
+            
+    logger.info(f"Checked {len(valued)} portfolio entries, {len(sells)} hit a sell target")
+    return sells
+
+def _log_sell_result(entry, trigger, sell_result):
+    """Log the outcome of a monitoring sell"""
+    success = sell_result and sell_result['status'] == 'success'
+    
+    if trigger == 'max_holding_time':
+        if success:
+            profit_loss = sell_result['bnb_received'] - entry['investment_amount_bnb']
+            logger.info(f"Successfully sold {entry['token_symbol']} based on time: {sell_result['bnb_received']} BNB (P/L: {profit_loss} BNB)")
+        else:
+            logger.error(f"Failed to sell {entry['token_symbol']} based on time")
+    elif trigger == 'take_profit':
+        if success:
+            logger.info(f"Successfully took profit on {entry['token_symbol']}: {sell_result['bnb_received']} BNB (profit: {sell_result['bnb_received'] - entry['investment_amount_bnb']} BNB)")
+        else:
+            logger.error(f"Failed to take profit on {entry['token_symbol']}")
+    else:
+        if success:
+            logger.info(f"Successfully stopped loss on {entry['token_symbol']}: {sell_result['bnb_received']} BNB (loss: {entry['investment_amount_bnb'] - sell_result['bnb_received']} BNB)")
+        else:
+            logger.error(f"Failed to stop loss on {entry['token_symbol']}")
+
+async def monitor_portfolio_async():
+    """Monitor portfolio and take profit/stop loss as needed
+    
+    RPC reads are awaited on the event loop. Every sell triggered in a round
+    is collected first and handed to execute_sells, which submits them
+    together from a worker thread.
+    """
+    try:
+        # Entries past the maximum holding time are sold whatever their value,
+        # so SQLite splits them off by purchase_time before any RPC work
+        expired_entries = get_active_portfolio(max_holding_time=config.MAX_HOLDING_TIME, expired=True)
+        live_entries = get_active_portfolio(max_holding_time=config.MAX_HOLDING_TIME)
+        
+        if not expired_entries and not live_entries:
             logger.info("No active portfolio entries to monitor")
             return
             
-        logger.info(f"Monitoring {len(portfolio_entries)} active portfolio entries")
+        logger.info(f"Monitoring {len(expired_entries) + len(live_entries)} active portfolio entries")
         
-        for entry in portfolio_entries:
-            try:
-                # Fetch current token data
-                token_data = fetch_token_data(entry['token_address'])
-                
-                if not token_data:
-                    logger.warning(f"Failed to fetch data for {entry['token_symbol']} ({entry['token_address']})")
-                    continue
-                    
-                # Calculate current value
-                current_value = calculate_current_value(
-                    entry['token_address'],
-                    entry['amount_tokens'],
-                    token_data['decimals']
-                )
-                
-                if current_value is None:
-                    logger.warning(f"Failed to calculate current value for {entry['token_symbol']}")
-                    continue
-                    
-                logger.info(f"Portfolio entry {entry['id']}: {entry['token_symbol']} - Current value: {current_value} BNB (invested: {entry['investment_amount_bnb']} BNB)")
-                
-                # Check take profit
-                if should_take_profit(current_value, entry['investment_amount_bnb'], entry['take_profit_target']):
-                    logger.info(f"Taking profit on {entry['token_symbol']}")
-                    
-                    # Execute sell
-                    sell_result = execute_sell(
-                        entry['token_address'],
-                        entry['token_symbol'],
-                        token_data['decimals'],
-                        amount_tokens=entry['amount_tokens'],
-                        portfolio_id=entry['id']
-                    )
-                    
-                    if sell_result and sell_result['status'] == 'success':
-                        logger.info(f"Successfully took profit on {entry['token_symbol']}: {sell_result['bnb_received']} BNB (profit: {sell_result['bnb_received'] - entry['investment_amount_bnb']} BNB)")
-                    else:
-                        logger.error(f"Failed to take profit on {entry['token_symbol']}")
-                        
-                # Check stop loss
-                elif should_stop_loss(current_value, entry['investment_amount_bnb'], entry['stop_loss_target']):
-                    logger.info(f"Stopping loss on {entry['token_symbol']}")
-                    
-                    # Execute sell
-                    sell_result = execute_sell(
-                        entry['token_address'],
-                        entry['token_symbol'],
-                        token_data['decimals'],
-                        amount_tokens=entry['amount_tokens'],
-                        portfolio_id=entry['id']
-                    )
-                    
-                    if sell_result and sell_result['status'] == 'success':
-                        logger.info(f"Successfully stopped loss on {entry['token_symbol']}: {sell_result['bnb_received']} BNB (loss: {entry['investment_amount_bnb'] - sell_result['bnb_received']} BNB)")
-                    else:
-                        logger.error(f"Failed to stop loss on {entry['token_symbol']}")
-                        
-                # Check time-based selling
-                elif should_sell_by_time(entry['purchase_time'], config.MAX_HOLDING_TIME):
-                    logger.info(f"Selling {entry['token_symbol']} based on maximum holding time")
-                    
-                    # Execute sell
-                    sell_result = execute_sell(
-                        entry['token_address'],
-                        entry['token_symbol'],
-                        token_data['decimals'],
-                        amount_tokens=entry['amount_tokens'],
-                        portfolio_id=entry['id']
-                    )
-                    
-                    if sell_result and sell_result['status'] == 'success':
-                        profit_loss = sell_result['bnb_received'] - entry['investment_amount_bnb']
-                        logger.info(f"Successfully sold {entry['token_symbol']} based on time: {sell_result['bnb_received']} BNB (P/L: {profit_loss} BNB)")
-                    else:
-                        logger.error(f"Failed to sell {entry['token_symbol']} based on time")
-                
-            except Exception as e:
-                logger.error(f"Error monitoring portfolio entry {entry['id']} ({entry['token_symbol']}): {e}")
+        # (entry, trigger, token_decimals) of every sell to execute this round
+        sells_to_execute = []
+        
+        for entry in expired_entries:
+            # Only the token decimals are needed (stored on the row), no valuation
+            token_decimals = get_entry_decimals(entry)
+            if token_decimals is None:
+                logger.warning(f"Failed to fetch data for {entry['token_symbol']} ({entry['token_address']})")
+                continue
+            logger.info(f"Selling {entry['token_symbol']} based on maximum holding time")
+            sells_to_execute.append((entry, 'max_holding_time', token_decimals))
+            
+        sells_to_execute.extend(_sell_triggers(await value_portfolio_entries_async(live_entries)))
                 
+        await _execute_monitor_sells(sells_to_execute)
+            
     except Exception as e:
         logger.error(f"Error in portfolio monitoring: {e}")
 
-def start_portfolio_monitoring():
-    """Start portfolio monitoring in a separate thread"""
-    def monitoring_thread():
-        while True:
-            try:
-                monitor_portfolio()
-            except Exception as e:
-                logger.error(f"Error in monitoring thread: {e}")
-                
-            # Sleep for monitoring interval
-            time.sleep(config.MONITORING_INTERVAL)
+async def _execute_monitor_sells(sells_to_execute):
+    """Execute the sells triggered in a monitoring round and log their outcome
+    
+    Args:
+        sells_to_execute: (entry, trigger, token_decimals) tuples
+    """
+    if not sells_to_execute:
+        return
+        
+    sell_results = await asyncio.to_thread(execute_sells, [{
+        'token_address': entry['token_address'],
+        'token_symbol': entry['token_symbol'],
+        'token_decimals': token_decimals,
+        'amount_tokens': entry['amount_tokens'],
+        'portfolio_id': entry['id']
+    } for entry, _, token_decimals in sells_to_execute])
+    
+    for (entry, trigger, _), sell_result in zip(sells_to_execute, sell_results):
+        _log_sell_result(entry, trigger, sell_result)
+
+# Maximum blocks scanned for Sync events in one poll (older moves are left to the heartbeat round)
+MAX_SYNC_SCAN_BLOCKS = 100
+
+async def check_price_updates(from_block=None):
+    """Check take profit/stop loss only for entries whose pair reserves changed
     
-    # Start monitoring thread
-    thread = threading.Thread(target=monitoring_thread)
+    Scans the Sync events of the active entries' token/WBNB pairs since
+    from_block and values the affected entries from the reserves in the
+    events, so no quote calls are needed.
+    
+    Args:
+        from_block: First block to scan (None to start from the next block)
+        
+    Returns:
+        int: First block to scan on the next call
+    """
+    w3 = Web3Singleton.get_instance()
+    latest_block = await asyncio.to_thread(lambda: w3.eth.block_number)
+    if from_block is None:
+        return latest_block + 1
+    if from_block > latest_block:
+        return from_block
+    from_block = max(from_block, latest_block - MAX_SYNC_SCAN_BLOCKS + 1)
+    
+    entries_by_pair = {}
+    for entry in get_active_portfolio(max_holding_time=config.MAX_HOLDING_TIME):
+        entries_by_pair.setdefault(compute_pair_address(entry['token_address']), []).append(entry)
+    if not entries_by_pair:
+        return latest_block + 1
+        
+    logs = await asyncio.to_thread(w3.eth.get_logs, {
+        'fromBlock': from_block,
+        'toBlock': latest_block,
+        'address': list(entries_by_pair),
+        'topics': [SYNC_TOPIC]
+    })
+    
+    # Logs are in chain order, so the last Sync of a pair holds its current reserves
+    reserves_by_pair = {}
+    for log in logs:
+        reserves_by_pair[log['address']] = w3.codec.decode(['uint112', 'uint112'], log['data'])
+        
+    if reserves_by_pair:
+        entries = [entry for pair in reserves_by_pair for entry in entries_by_pair.get(pair, [])]
+        logger.info(f"Reserves changed for {len(reserves_by_pair)} pairs, checking {len(entries)} portfolio entries")
+        
+        await _execute_monitor_sells(_sell_triggers(value_entries_from_reserves(entries, reserves_by_pair)))
+        
+    return latest_block + 1
+
+def monitor_portfolio():
+    """Monitor portfolio and take profit/stop loss as needed (runs one round of monitor_portfolio_async)"""
+    asyncio.run(monitor_portfolio_async())
+
+async def _monitoring_loop():
+    """React to pair reserve changes, with a full monitoring round every MONITORING_INTERVAL seconds"""
+    next_block = None
+    next_full_round = 0.0
+    
+    while True:
+        try:
+            if time.monotonic() >= next_full_round:
+                # Heartbeat: also covers the holding time limit and pairs without Sync events
+                next_full_round = time.monotonic() + config.MONITORING_INTERVAL
+                await monitor_portfolio_async()
+            else:
+                next_block = await check_price_updates(next_block)
+        except Exception as e:
+            logger.error(f"Error in monitoring thread: {e}")
+            Web3Singleton.reconnect_on_transport_error(e)
+            
+        await asyncio.sleep(config.PRICE_POLL_INTERVAL)
+
+def start_portfolio_monitoring():
+    """Start portfolio monitoring on an event loop in a separate thread"""
+    thread = threading.Thread(target=lambda: asyncio.run(_monitoring_loop()))
     thread.daemon = True
     thread.start()
     
-    logger.info(f"Portfolio monitoring started (interval: {config.MONITORING_INTERVAL} seconds)")
-    return thread
\ No newline at end of file
+    logger.info(f"Portfolio monitoring started (price checks every {config.PRICE_POLL_INTERVAL} seconds, full check every {config.MONITORING_INTERVAL} seconds)")
+    return thread
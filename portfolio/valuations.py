@@ -0,0 +1,263 @@
+"""
+Portfolio valuation with batched RPC reads
+"""
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from utils.logging_setup import logger
+from utils.web3_singleton import Web3Singleton
+from contracts.interfaces import compute_pair_address, get_pair_contract, get_token_contract
+from contracts.multicall import multicall
+from database.operations import is_token_blacklisted, set_portfolio_decimals
+from tokendata.cache import get_token_decimals, get_token_metadata, store_token_metadata
+from trading.sell import estimate_bnb_output, QUOTE_CACHE
+import config
+
+def get_entry_decimals(entry):
+    """Get the token decimals of a portfolio entry
+    
+    Decimals are stored on the portfolio row at buy time; rows created before
+    that are resolved through the token metadata cache once and backfilled.
+    
+    Args:
+        entry: Portfolio entry
+        
+    Returns:
+        int: Token decimals or None if unavailable
+    """
+    if entry['token_decimals'] is not None:
+        return entry['token_decimals']
+        
+    token_decimals = get_token_decimals(entry['token_address'])
+    if token_decimals is not None:
+        set_portfolio_decimals(entry['token_address'], token_decimals)
+    return token_decimals
+
+def _value_entry(entry):
+    """Value a single portfolio entry with individual RPC calls
+    
+    Args:
+        entry: Portfolio entry
+        
+    Returns:
+        tuple: (entry, token_decimals, current_value) - None values when unavailable
+    """
+    if is_token_blacklisted(entry['token_address']):
+        return entry, None, None
+        
+    token_decimals = get_entry_decimals(entry)
+    if token_decimals is None:
+        return entry, None, None
+        
+    current_value = estimate_bnb_output(
+        entry['token_address'],
+        entry['amount_tokens'],
+        token_decimals
+    )
+    return entry, token_decimals, current_value
+
+def _value_entries_parallel(portfolio_entries):
+    """Value portfolio entries with per-entry RPC calls, overlapped in a thread pool"""
+    if not portfolio_entries:
+        return []
+    with ThreadPoolExecutor(max_workers=min(config.RPC_PARALLELISM, len(portfolio_entries))) as executor:
+        return list(executor.map(_value_entry, portfolio_entries))
+
+async def _value_entries_concurrent(portfolio_entries):
+    """Value portfolio entries with per-entry RPC calls, overlapped on the event loop"""
+    semaphore = asyncio.Semaphore(config.RPC_PARALLELISM)
+    
+    async def value_entry(entry):
+        async with semaphore:
+            return await asyncio.to_thread(_value_entry, entry)
+            
+    return list(await asyncio.gather(*[value_entry(entry) for entry in portfolio_entries]))
+
+def get_amounts_out(amounts_in, reserves_in, reserves_out):
+    """Vectorized PancakeSwap V2 getAmountOut (constant product minus the swap fee)
+    
+    Args:
+        amounts_in: Input amounts in wei
+        reserves_in: Pair reserves of the input token
+        reserves_out: Pair reserves of the output token
+        
+    Returns:
+        numpy.ndarray: Output amounts in wei as float64, NaN where a pair has no liquidity
+    """
+    amounts_in = np.asarray(amounts_in, dtype=np.float64)
+    reserves_in = np.asarray(reserves_in, dtype=np.float64)
+    reserves_out = np.asarray(reserves_out, dtype=np.float64)
+    
+    amounts_in_with_fee = amounts_in * (10000 - config.PANCAKE_SWAP_FEE_BPS)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        amounts_out = amounts_in_with_fee * reserves_out / (reserves_in * 10000 + amounts_in_with_fee)
+    return np.where((reserves_in > 0) & (reserves_out > 0), amounts_out, np.nan)
+
+def _quote_from_reserves(quoted, amounts_in, pair_reserves):
+    """Turn token/WBNB pair reserves into BNB values and cache them as quotes
+    
+    Args:
+        quoted: (entry, quote cache key) tuples
+        amounts_in: Token amount in wei per entry
+        pair_reserves: (reserve0, reserve1, ...) per entry, None if the pair is missing
+        
+    Returns:
+        dict: BNB value by portfolio entry ID, for the entries whose pair has liquidity
+    """
+    # Reserves are ordered by token0, the lower of the two addresses
+    reserves_in = []
+    reserves_out = []
+    for (entry, _), reserves in zip(quoted, pair_reserves):
+        reserve0, reserve1 = reserves[:2] if reserves else (0, 0)
+        if entry['token_address'].lower() < config.WBNB_ADDRESS_LC:
+            reserves_in.append(reserve0)
+            reserves_out.append(reserve1)
+        else:
+            reserves_in.append(reserve1)
+            reserves_out.append(reserve0)
+            
+    values_by_id = {}
+    amounts_out = get_amounts_out(amounts_in, reserves_in, reserves_out) / 1e18
+    for (entry, cache_key), bnb_output in zip(quoted, amounts_out):
+        if np.isnan(bnb_output):
+            continue
+        values_by_id[entry['id']] = float(bnb_output)
+        QUOTE_CACHE.set(cache_key, values_by_id[entry['id']])
+    return values_by_id
+
+def value_entries_from_reserves(portfolio_entries, reserves_by_pair):
+    """Value portfolio entries from known pair reserves (e.g. decoded Sync events), without RPC calls
+    
+    Args:
+        portfolio_entries: Portfolio entries
+        reserves_by_pair: (reserve0, reserve1) by token/WBNB pair address
+        
+    Returns:
+        list: (entry, token_decimals, current_value) tuples - None values when unavailable
+    """
+    quoted = []
+    amounts_in = []
+    pair_reserves = []
+    decimals_by_id = {}
+    for entry in portfolio_entries:
+        token_decimals = get_entry_decimals(entry)
+        decimals_by_id[entry['id']] = token_decimals
+        if token_decimals is None:
+            continue
+        quoted.append((entry, (entry['token_address'], entry['amount_tokens'], token_decimals)))
+        amounts_in.append(int(entry['amount_tokens'] * (10 ** token_decimals)))
+        pair_reserves.append(reserves_by_pair.get(compute_pair_address(entry['token_address'])))
+        
+    values_by_id = _quote_from_reserves(quoted, amounts_in, pair_reserves)
+    return [(entry, decimals_by_id[entry['id']], values_by_id.get(entry['id'])) for entry in portfolio_entries]
+
+def _value_entries_batched(portfolio_entries):
+    """Value all portfolio entries with batched RPC reads
+    
+    Token decimals come from the portfolio rows (or the metadata cache for
+    rows created without them); unknown decimals and the
+    token/WBNB pair reserves of every entry are fetched with (at most) two
+    Multicall3 calls in total, and the router formula is applied to all
+    entries at once with NumPy instead of one getAmountsOut call per entry.
+    
+    Args:
+        portfolio_entries: Active portfolio entries
+        
+    Returns:
+        list: (entry, token_decimals, current_value) tuples - None values when unavailable
+        
+    Raises:
+        Exception: If a multicall fails
+    """
+    # Blacklisted tokens are not valued (fetch_token_data refuses them too)
+    candidates = [entry for entry in portfolio_entries if not is_token_blacklisted(entry['token_address'])]
+    
+    # Decimals never change, so only legacy rows whose token is missing from the cache are queried
+    decimals = []
+    missing = []
+    for entry in candidates:
+        token_decimals = entry['token_decimals']
+        if token_decimals is None:
+            metadata = get_token_metadata(entry['token_address'])
+            if metadata is not None:
+                token_decimals = metadata['decimals']
+                set_portfolio_decimals(entry['token_address'], token_decimals)
+        decimals.append(token_decimals)
+        if token_decimals is None:
+            missing.append(len(decimals) - 1)
+            
+    fetched = multicall([
+        get_token_contract(candidates[i]['token_address']).functions.decimals()
+        for i in missing
+    ])
+    for i, token_decimals in zip(missing, fetched):
+        decimals[i] = token_decimals
+        if token_decimals is not None:
+            store_token_metadata(candidates[i]['token_address'], token_decimals, symbol=candidates[i]['token_symbol'])
+            set_portfolio_decimals(candidates[i]['token_address'], token_decimals)
+            
+    token_decimals_by_id = {entry['id']: token_decimals for entry, token_decimals in zip(candidates, decimals)}
+    
+    # Quotes need the decimals to convert amounts to wei; recent quotes are reused
+    values_by_id = {}
+    quoted = []
+    amounts_in = []
+    reserve_calls = []
+    for entry, token_decimals in zip(candidates, decimals):
+        if token_decimals is None:
+            continue
+        cache_key = (entry['token_address'], entry['amount_tokens'], token_decimals)
+        cached = QUOTE_CACHE.get(cache_key)
+        if cached is not None:
+            values_by_id[entry['id']] = cached
+            continue
+        amounts_in.append(int(entry['amount_tokens'] * (10 ** token_decimals)))
+        reserve_calls.append(get_pair_contract(compute_pair_address(entry['token_address'])).functions.getReserves())
+        quoted.append((entry, cache_key))
+        
+    values_by_id.update(_quote_from_reserves(quoted, amounts_in, multicall(reserve_calls)))
+        
+    results = []
+    for entry in portfolio_entries:
+        results.append((entry, token_decimals_by_id.get(entry['id']), values_by_id.get(entry['id'])))
+        
+    return results
+
+def value_portfolio_entries(portfolio_entries):
+    """Value all portfolio entries with batched RPC reads (see _value_entries_batched)
+    
+    Falls back to per-entry calls, run in parallel, if the multicall fails.
+    
+    Args:
+        portfolio_entries: Active portfolio entries
+        
+    Returns:
+        list: (entry, token_decimals, current_value) tuples - None values when unavailable
+    """
+    try:
+        return _value_entries_batched(portfolio_entries)
+    except Exception as e:
+        logger.warning("Batched portfolio valuation failed, falling back to per-entry calls: %s", e)
+        Web3Singleton.reconnect_on_transport_error(e)
+        return _value_entries_parallel(portfolio_entries)
+
+async def value_portfolio_entries_async(portfolio_entries):
+    """Coroutine version of value_portfolio_entries for the monitoring event loop
+    
+    The batched reads run in a worker thread; if they fail, the per-entry calls
+    are overlapped with asyncio.gather (at most RPC_PARALLELISM at a time).
+    
+    Args:
+        portfolio_entries: Active portfolio entries
+        
+    Returns:
+        list: (entry, token_decimals, current_value) tuples - None values when unavailable
+    """
+    try:
+        return await asyncio.to_thread(_value_entries_batched, portfolio_entries)
+    except Exception as e:
+        logger.warning("Batched portfolio valuation failed, falling back to per-entry calls: %s", e)
+        Web3Singleton.reconnect_on_transport_error(e)
+        return await _value_entries_concurrent(portfolio_entries)
@@ -1,164 +1,199 @@
-import time
+import re
+from functools import lru_cache
+
 import requests
-from web3.exceptions import TimeExhausted, BadFunctionCallOutput
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from eth_utils import keccak
+from web3.exceptions import ContractLogicError
 
 from utils.logging_setup import logger
 from utils.web3_singleton import Web3Singleton
 from database.operations import add_to_blacklist
-from contracts.interfaces import get_router_contract, get_token_contract
+from utils.blacklist_matcher import compile_patterns
+from utils.ttl_cache import TTLCache
+from utils.retry import retry
+from contracts.abis import TAX_FUNCTION_NAMES
+from contracts.interfaces import get_router_contract, get_token_contract, get_tax_contract
+from contracts.multicall import multicall
 import config
 
+# Strings searched for in the raw bytecode (metadata, revert messages), each list compiled
+# into one case-insensitive alternation so the code is scanned once without any copies
+_TAX_RE = compile_patterns((b"tax", b"fee", b"reflect", b"redistribution"), re.IGNORECASE)
+_SUSPICIOUS_RE = compile_patterns((
+    b"assembly",
+    b"selfdestruct", b"suicide",  # Self-destruct functions
+    b"delegatecall",  # Potential proxy vulnerabilities
+    b"callcode",      # Deprecated and dangerous
+    b"iszero(caller", # Often used to restrict selling
+    b"origin"         # Using tx.origin is often a bad practice
+), re.IGNORECASE)
+
+# Shared BSCScan session: keeps TLS connections alive between checks and
+# retries rate-limited/5xx responses with backoff (honouring Retry-After)
+_BSCSCAN_SESSION = requests.Session()
+_BSCSCAN_SESSION.mount('https://', HTTPAdapter(
+    pool_maxsize=32,
+    max_retries=Retry(
+        total=3,
+        backoff_factor=0.5,
+        status_forcelist=(429, 500, 502, 503, 504),
+        respect_retry_after_header=True
+    )
+))
+
+@lru_cache(maxsize=4096)
+def _get_code(address):
+    """Fetch a contract's raw bytecode, cached by checksummed address
+    
+    Deployed code never changes, so entries never go stale. Failed lookups
+    raise and are not cached.
+    """
+    return bytes(Web3Singleton.get_instance().eth.get_code(address))
+
+def get_contract_code(token_address):
+    """Get the raw bytecode of a contract, fetching each address only once"""
+    return _get_code(Web3Singleton.to_checksum_address(token_address))
+
+# Revert reason of the approve probe by keccak(bytecode), so clones of a template whose approve()
+# reverted are rejected without another estimate. Passing probes aren't cached: the outcome also
+# depends on the token's storage (owner switches, blacklists), which clones don't share.
+_APPROVE_PROBE_CACHE = TTLCache(maxsize=4096, ttl=config.APPROVE_PROBE_TTL_SECONDS)
+
+# Last sell history answer per request URL: (ETag, result), revalidated with If-None-Match.
+# Only useful because the URL's startblock is aligned to SELL_HISTORY_BLOCK_BUCKET blocks.
+_SELL_HISTORY_ETAGS = TTLCache(maxsize=4096, ttl=3600)
+
 def check_for_transfer_tax(token_address, token_symbol):
     """Check if a token implements transfer taxes"""
     try:
-        w3 = Web3Singleton.get_instance()
-        token_contract = get_token_contract(token_address)
-        
-        # Common function names for tax information
-        tax_functions = [
-            "getTaxFeePercent", "getTotalFee", "taxRate", 
-            "sellTaxes", "buyTaxes", "transferTaxes"
-        ]
-        
-        for func_name in tax_functions:
-            try:
-                # Try to find and call tax functions
-                if hasattr(token_contract.functions, func_name):
-                    tax_fee = getattr(token_contract.functions, func_name)().call()
-                    logger.info(f"Token {token_symbol} has {func_name} = {tax_fee}")
-                    return tax_fee
-            except Exception:
-                continue
+        # Call every common tax getter in one multicall; the ones a token lacks just revert
+        tax_contract = get_tax_contract(token_address)
+        try:
+            tax_fees = multicall([getattr(tax_contract.functions, func_name)() for func_name in TAX_FUNCTION_NAMES])
+        except Exception as e:
+            logger.warning(f"Failed to query tax functions of {token_symbol}: {e}")
+            tax_fees = []
+            
+        for func_name, tax_fee in zip(TAX_FUNCTION_NAMES, tax_fees):
+            if tax_fee is not None:
+                logger.info(f"Token {token_symbol} has {func_name} = {tax_fee}")
+                return tax_fee
                 
         # If no dedicated function, check contract code for tax-related strings
-        contract_code = w3.eth.get_code(token_address).hex().lower()
-        tax_related_strings = ["tax", "fee", "reflect", "redistribution"]
-        
-        for tax_string in tax_related_strings:
-            if tax_string in contract_code:
-                logger.info(f"Token {token_symbol} likely has transfer tax (found '{tax_string}' in code)")
-                return True
+        match = _TAX_RE.search(get_contract_code(token_address))
+        if match:
+            logger.info(f"Token {token_symbol} likely has transfer tax (found '{match.group(0).decode().lower()}' in code)")
+            return True
                 
         return False
     except Exception as e:
         logger.error(f"Error checking for transfer tax: {e}")
         return False
 
-def detect_suspicious_assembly(token_address, max_retries=3):
+# Fail safe - if the code can't be analyzed, consider it suspicious
+@retry("analyzing contract code", default=True)
+def _has_suspicious_code(token_address):
+    """Scan a contract's bytecode for patterns often used in scams"""
+    # Check for assembly code and other patterns often used in scams
+    match = _SUSPICIOUS_RE.search(get_contract_code(token_address))
+    if match:
+        pattern = match.group(0).decode().lower()
+        if pattern == "assembly":
+            logger.warning(f"Token {token_address} contains assembly code, potential honeypot detected")
+        else:
+            logger.warning(f"Token {token_address} contains suspicious code pattern: {pattern}")
+        return True
+            
+    return False
+
+def detect_suspicious_assembly(token_address):
     """Check for suspicious assembly code in contract
     
     Args:
         token_address: Token address to check
-        max_retries: Maximum number of retry attempts
         
     Returns:
-        bool: True if suspicious code detected, False otherwise
+        bool: True if suspicious code detected (or the code couldn't be fetched), False otherwise
     """
     if not config.ASSEMBLY_CHECK_ENABLED:
         return False
         
-    for attempt in range(max_retries):
-        try:
-            # Get web3 instance
-            w3 = Web3Singleton.get_instance()
-                
-            # Get contract code
-            contract_code = w3.eth.get_code(token_address).hex()
-            
-            # Convert to lowercase for case-insensitive matching
-            contract_code_lower = contract_code.lower()
-            
-            # Check for assembly code
-            if "assembly" in contract_code_lower:
-                logger.warning(f"Token {token_address} contains assembly code, potential honeypot detected")
-                return True
-                
-            # Check for other suspicious opcodes/patterns that are often used in scams
-            suspicious_patterns = [
-                "selfdestruct", "suicide",  # Self-destruct functions
-                "delegatecall",  # Potential proxy vulnerabilities
-                "callcode",      # Deprecated and dangerous
-                "iszero(caller", # Often used to restrict selling
-                "origin"         # Using tx.origin is often a bad practice
-            ]
-            
-            for pattern in suspicious_patterns:
-                if pattern in contract_code_lower:
-                    logger.warning(f"Token {token_address} contains suspicious code pattern: {pattern}")
-                    return True
-                    
-            return False
-        except (TimeExhausted, BadFunctionCallOutput) as e:
-            logger.warning(f"Timeout checking contract code (attempt {attempt+1}/{max_retries}): {e}")
-        except Exception as e:
-            logger.error(f"Error analyzing contract code (attempt {attempt+1}/{max_retries}): {e}")
-            
-        # Exponential backoff
-        if attempt < max_retries - 1:
-            backoff_time = config.RETRY_DELAY_BASE * (attempt + 1)
-            logger.info(f"Retrying contract code analysis in {backoff_time} seconds...")
-            time.sleep(backoff_time)
-    
-    # If we've exhausted all retries, consider it suspicious
-    logger.error(f"Failed to analyze contract code for {token_address} after {max_retries} attempts")
-    return True  # Fail safe - if we can't analyze, consider it suspicious
+    return _has_suspicious_code(token_address)
 
-def check_token_sell_history(token_address, pair_address, max_retries=3):
+def check_token_sell_history(token_address, pair_address):
     """Check if a token has had successful sell transactions
     
     Args:
         token_address: Token address to check
         pair_address: Pair address for the token
-        max_retries: Maximum number of retry attempts
         
     Returns:
-        bool: True if token has sufficient sell history, False otherwise
+        bool: True if token has sufficient sell history, False otherwise,
+              None if BSCScan couldn't be queried (unknown, worth retrying later)
     """
-    for attempt in range(max_retries):
-        try:
-            # We need BSCScan API for this check
-            if not config.BSCSCAN_API_KEY:
-                logger.warning("BSCScan API key not provided, skipping sell history check")
-                return True  # Skip check if no API key
-                
-            # Get recent transfers involving the pair address
-            url = f"https://api.bscscan.com/api?module=account&action=tokentx&address={pair_address}&startblock=0&endblock=999999999&sort=desc&apikey={config.BSCSCAN_API_KEY}"
+    try:
+        # We need BSCScan API for this check
+        if not config.BSCSCAN_API_KEY:
+            logger.warning("BSCScan API key not provided, skipping sell history check")
+            return True  # Skip check if no API key
             
-            response = requests.get(url, timeout=30)  # 30 second timeout
-            if response.status_code != 200:
-                logger.warning(f"Failed to get token transactions from BSCScan: {response.status_code}")
-                return True  # Skip check if API fails
-                
-            data = response.json()
-            if data["status"] != "1":
-                logger.warning(f"BSCScan API error: {data['message']}")
-                return True  # Skip check if API returns error
-                
-            # Count successful sells (transfers from pair to non-pair address)
-            successful_sells = 0
-            for tx in data["result"]:
-                # If token was sent from the pair to someone else, it's likely a sell
-                if tx["from"].lower() == pair_address.lower() and tx["tokenAddress"].lower() == token_address.lower():
-                    successful_sells += 1
-                    
-            logger.info(f"Token {token_address} has {successful_sells} successful sell transactions")
+        # Get the latest transfers of this token involving the pair address, recent blocks only.
+        # The start is rounded down to a bucket so repeated checks request the same URL.
+        start_block = max(0, Web3Singleton.get_instance().eth.block_number - config.SELL_HISTORY_BLOCKS)
+        start_block -= start_block % config.SELL_HISTORY_BLOCK_BUCKET
+        url = f"https://api.bscscan.com/api?module=account&action=tokentx&contractaddress={token_address}&address={pair_address}&startblock={start_block}&endblock=999999999&page=1&offset={config.SELL_HISTORY_MAX_ROWS}&sort=desc&apikey={config.BSCSCAN_API_KEY}"
+        
+        # Revalidate the previous answer for this exact URL instead of downloading it again
+        cached = _SELL_HISTORY_ETAGS.get(url)
+        headers = {'If-None-Match': cached[0]} if cached else None
+        
+        # Retries and backoff on 429/5xx are handled by the session's adapter
+        response = _BSCSCAN_SESSION.get(url, headers=headers, timeout=(5, 30))
+        if response.status_code == 304 and cached:
+            logger.info(f"Sell history of {token_address} unchanged since the last check")
+            return cached[1]
             
-            # Return true if enough successful sells are found
-            return successful_sells >= config.MIN_SUCCESSFUL_SELLS
-        except requests.exceptions.RequestException as e:
-            logger.warning(f"BSCScan API request error (attempt {attempt+1}/{max_retries}): {e}")
-        except Exception as e:
-            logger.error(f"Error checking token sell history (attempt {attempt+1}/{max_retries}): {e}")
+        if response.status_code != 200:
+            logger.warning(f"Failed to get token transactions from BSCScan: {response.status_code}")
+            return None
             
-        # Exponential backoff
-        if attempt < max_retries - 1:
-            backoff_time = config.RETRY_DELAY_BASE * (attempt + 1)
-            logger.info(f"Retrying token sell history check in {backoff_time} seconds...")
-            time.sleep(backoff_time)
-    
-    # If we've exhausted all retries, skip check to be safe
-    logger.error(f"Failed to check sell history for {token_address} after {max_retries} attempts")
-    return True  # Skip check if there's an error
+        data = response.json()
+        # An empty history is an answer (no sells), anything else with status 0 is an API error
+        if data["status"] != "1" and data["message"] != "No transactions found":
+            logger.warning(f"BSCScan API error: {data['message']}")
+            return None
+            
+        # BSCScan returns lowercase addresses, so lowercase our side once
+        pair_lc = pair_address.lower()
+        token_lc = token_address.lower()
+        
+        # Count successful sells (transfers from pair to non-pair address), stopping once there are enough
+        successful_sells = 0
+        for tx in data["result"]:
+            # If token was sent from the pair to someone else, it's likely a sell
+            if tx["from"] == pair_lc and tx["tokenAddress"] == token_lc:
+                successful_sells += 1
+                if successful_sells >= config.MIN_SUCCESSFUL_SELLS:
+                    break
+                
+        logger.info(f"Token {token_address} has {successful_sells} successful sell transactions")
+        
+        # Return true if enough successful sells are found
+        has_sell_history = successful_sells >= config.MIN_SUCCESSFUL_SELLS
+        etag = response.headers.get('ETag')
+        if etag:
+            _SELL_HISTORY_ETAGS.set(url, (etag, has_sell_history))
+        return has_sell_history
+    except requests.exceptions.RequestException as e:
+        logger.warning(f"BSCScan API request error: {e}")
+    except Exception as e:
+        logger.error(f"Error checking token sell history: {e}")
+        
+    # Unknown rather than passed: buying on no data would defeat the check
+    logger.error(f"Failed to check sell history for {token_address}")
+    return None
 
 def check_for_honeypot(token_address, token_symbol):
     """Perform a test buy and sell to check for honeypot
@@ -181,6 +216,15 @@ def check_for_honeypot(token_address, token_symbol):
         w3 = Web3Singleton.get_instance()
         router_contract = get_router_contract()
         
+        # Reuse a recent approve revert of a contract with identical bytecode
+        contract_code = get_contract_code(token_address)
+        code_hash = keccak(contract_code) if contract_code else None
+        probe_error = _APPROVE_PROBE_CACHE.get(code_hash) if code_hash else None
+        if probe_error is not None:
+            logger.warning(f"Approval known to revert for this contract code - likely a honeypot: {probe_error}")
+            add_to_blacklist(token_address, token_symbol, f"Approval function manipulation detected: {probe_error}")
+            return True
+        
         # First check if we can approve the router (without sending transaction)
         token_contract = get_token_contract(token_address)
         
@@ -192,8 +236,8 @@ def check_for_honeypot(token_address, token_symbol):
             ).build_transaction({
                 'from': config.WALLET_ADDRESS,
                 'gas': 100000,
-                'gasPrice': w3.eth.gas_price,
-                'nonce': w3.eth.get_transaction_count(config.WALLET_ADDRESS),
+                # Only estimated, never sent: a recent gas price is fine and no nonce is needed
+                'gasPrice': Web3Singleton.get_cached_gas_price(),
                 'chainId': 56,
             })
             
@@ -201,6 +245,9 @@ def check_for_honeypot(token_address, token_symbol):
             gas_estimate = w3.eth.estimate_gas(approve_txn)
             logger.info(f"Approval gas estimate: {gas_estimate}")
         except Exception as e:
+            # Only a revert is down to the code; transport errors are not remembered
+            if code_hash and isinstance(e, ContractLogicError):
+                _APPROVE_PROBE_CACHE.set(code_hash, str(e))
             logger.warning(f"Failed to estimate gas for approval - likely a honeypot: {e}")
             add_to_blacklist(token_address, token_symbol, f"Approval function manipulation detected: {e}")
             return True
@@ -5,10 +5,10 @@ setup(
     version="0.1.0",
     packages=find_packages(),
     install_requires=[
-        "web3>=5.31.1",
+        "web3>=7,<8",
         "python-dotenv>=0.20.0",
         "requests>=2.28.0",
-        "pandas>=1.4.2",
+        "numpy>=1.21",
     ],
     entry_points={
         "console_scripts": [
@@ -24,9 +24,8 @@ setup(
         "Development Status :: 3 - 4lphA",
         "Intended Audience :: Developers",
         "Programming Language :: Python :: 3",
-        "Programming Language :: Python :: 3.7",
         "Programming Language :: Python :: 3.8",
         "Programming Language :: Python :: 3.9",
     ],
-    python_requires=">=3.7",
+    python_requires=">=3.8",
 )
\ No newline at end of file
@@ -1,189 +1,188 @@
-import time
-from web3.exceptions import TimeExhausted, BadFunctionCallOutput, TransactionNotFound
+import asyncio
+import math
+import threading
+from concurrent.futures import Future
 
 from utils.logging_setup import logger
 from utils.web3_singleton import Web3Singleton
+from utils.blacklist_matcher import find_blacklisted_pattern
+from utils.ttl_cache import TTLCache
+from utils.retry import retry
 from contracts.interfaces import get_factory_contract, get_token_contract, get_pair_contract
+from contracts.multicall import multicall
 from database.operations import add_to_blacklist, is_token_blacklisted
+from tokendata.cache import store_token_metadata, store_token_metadata_miss
 import config
 
-def get_pair_address(token_address, max_retries=3):
+# Factory getPair results by checksummed token address. A pair never changes once
+# created so hits are kept for good; misses expire so a pair created later is found.
+_PAIR_CACHE = TTLCache(maxsize=8192, ttl=config.PAIR_MISS_TTL_SECONDS)
+_NOT_CACHED = object()
+
+# Analyses in progress by checksummed token address, shared by concurrent callers
+_inflight_analyses = {}
+_inflight_lock = threading.Lock()
+# Tokens that recently failed analysis, skipped until the entry expires
+_REJECTED_TOKENS = TTLCache(maxsize=4096, ttl=config.REJECTED_TOKEN_TTL_SECONDS)
+
+@retry("getting pair address")
+def _get_pair_from_factory(token_address):
+    """Ask the PancakeSwap factory for the WBNB pair of a token, caching the answer"""
+    factory_contract = get_factory_contract()
+        
+    # Get pair address from PancakeSwap factory
+    pair_address = factory_contract.functions.getPair(
+        config.WBNB_ADDRESS, 
+        token_address
+    ).call()
+    
+    if pair_address == '0x0000000000000000000000000000000000000000':
+        _PAIR_CACHE.set(token_address, None)
+        return None
+    
+    _PAIR_CACHE.set(token_address, pair_address, ttl=math.inf)
+    return pair_address
+
+def get_pair_address(token_address):
     """Get the trading pair address for a token
     
     Args:
         token_address: Token address
-        max_retries: Maximum number of retry attempts
         
     Returns:
         str: Pair address or None if not found
     """
-    for attempt in range(max_retries):
-        try:
-            # Check web3 connection first
-            w3 = Web3Singleton.get_instance()
-                
-            factory_contract = get_factory_contract()
-                
-            # Get pair address from PancakeSwap factory
-            pair_address = factory_contract.functions.getPair(
-                config.WBNB_ADDRESS, 
-                token_address
-            ).call()
-            
-            if pair_address == '0x0000000000000000000000000000000000000000':
-                return None
-            
-            return pair_address
-        except (TimeExhausted, BadFunctionCallOutput) as e:
-            logger.warning(f"Timeout getting pair address (attempt {attempt+1}/{max_retries}): {e}")
-        except Exception as e:
-            logger.error(f"Error getting pair address (attempt {attempt+1}/{max_retries}): {e}")
-            
-        # Exponential backoff
-        if attempt < max_retries - 1:
-            backoff_time = config.RETRY_DELAY_BASE * (attempt + 1)
-            logger.info(f"Retrying get_pair_address in {backoff_time} seconds...")
-            time.sleep(backoff_time)
+    token_address = Web3Singleton.to_checksum_address(token_address)
+    cached = _PAIR_CACHE.get(token_address, _NOT_CACHED)
+    if cached is not _NOT_CACHED:
+        return cached
+        
+    return _get_pair_from_factory(token_address)
+
+@retry("fetching token data", on_error=Web3Singleton.reconnect_on_transport_error)
+def _fetch_token_metadata(token_address):
+    """Read the ERC20 metadata of a (checksummed, not blacklisted) token"""
+    # Create token contract
+    token_contract = get_token_contract(token_address)
+    if not token_contract:
+        logger.error(f"Failed to get token contract for {token_address}")
+        return None
+    
+    # Get token details in a single Multicall3 eth_call
+    name, symbol, decimals, total_supply = multicall([
+        token_contract.functions.name(),
+        token_contract.functions.symbol(),
+        token_contract.functions.decimals(),
+        token_contract.functions.totalSupply()
+    ])
+    # Seed the token metadata cache, so execute_buy only has to quote
+    if symbol is None or decimals is None:
+        store_token_metadata_miss(token_address)
+    else:
+        store_token_metadata(token_address, decimals, name, symbol)
     
-    # If we've exhausted all retries
-    logger.error(f"Failed to get pair address for {token_address} after {max_retries} attempts")
-    return None
+    # A reverted or undecodable call won't succeed on retry (non-standard ERC20)
+    if None in (name, symbol, decimals, total_supply):
+        logger.warning(f"Token {token_address} doesn't implement the standard ERC20 metadata functions")
+        return None
+
+    # Check for blacklisted words in name/symbol
+    pattern = find_blacklisted_pattern(name, symbol)
+    if pattern:
+        logger.warning(f"Token {symbol} contains blacklisted pattern: {pattern}")
+        add_to_blacklist(token_address, symbol, f"Contains blacklisted pattern: {pattern}")
+        return None
+
+    logger.info(f"Token: {symbol} ({name}), Decimals: {decimals}, Total Supply: {total_supply}")
+    return {
+        "name": name,
+        "symbol": symbol,
+        "decimals": decimals,
+        "total_supply": total_supply,
+        "address": token_address
+    }
 
-def fetch_token_data(token_address, max_retries=3):
+def fetch_token_data(token_address, checked=False):
     """Fetch token metadata using Web3
     
     Args:
         token_address: Token address
-        max_retries: Maximum number of retry attempts
+        checked: True if the caller already checksummed the address and checked the blacklist
         
     Returns:
         dict: Token data or None if failed
     """
-    for attempt in range(max_retries):
-        try:
-            # Get web3 instance
-            w3 = Web3Singleton.get_instance()
-                
-            # Convert address to checksum format if needed
-            if isinstance(token_address, str):
-                token_address = w3.to_checksum_address(token_address)
-                
-            if not token_address:
-                return None
-            
-            # Check if token is blacklisted
-            if is_token_blacklisted(token_address):
-                logger.warning(f"Token {token_address} is blacklisted, skipping")
-                return None
-            
-            # Create token contract
-            token_contract = get_token_contract(token_address)
-            if not token_contract:
-                logger.error(f"Failed to get token contract for {token_address}")
-                return None
+    if not checked:
+        # Convert address to checksum format if needed
+        if isinstance(token_address, str):
+            token_address = Web3Singleton.to_checksum_address(token_address)
             
-            # Get token details (Web3.py 7.x compatible - no timeout)
-            name = token_contract.functions.name().call()
-            symbol = token_contract.functions.symbol().call()
-            decimals = token_contract.functions.decimals().call()
-            total_supply = token_contract.functions.totalSupply().call()
-
-            # Check for blacklisted words in name/symbol
-            name_lower = name.lower()
-            symbol_lower = symbol.lower()
-            for pattern in config.BLACKLISTED_PATTERNS:
-                if pattern in name_lower or pattern in symbol_lower:
-                    logger.warning(f"Token {symbol} contains blacklisted pattern: {pattern}")
-                    add_to_blacklist(token_address, symbol, f"Contains blacklisted pattern: {pattern}")
-                    return None
-
-            logger.info(f"Token: {symbol} ({name}), Decimals: {decimals}, Total Supply: {total_supply}")
-            return {
-                "name": name,
-                "symbol": symbol,
-                "decimals": decimals,
-                "total_supply": total_supply,
-                "address": token_address
-            }
-        except (TimeExhausted, BadFunctionCallOutput) as e:
-            # Specific web3 timeout errors
-            logger.warning(f"Web3 timeout during token data fetch (attempt {attempt+1}/{max_retries}): {e}")
-        except Exception as e:
-            logger.error(f"Error fetching token data (attempt {attempt+1}/{max_retries}): {e}")
-            
-        # Exponential backoff
-        if attempt < max_retries - 1:
-            backoff_time = config.RETRY_DELAY_BASE * (attempt + 1)
-            logger.info(f"Retrying fetch_token_data in {backoff_time} seconds...")
-            time.sleep(backoff_time)
-    
-    # If we've exhausted all retries
-    logger.error(f"Failed to fetch token data for {token_address} after {max_retries} attempts")
-    return None
+        if not token_address:
+            return None
+        
+        # Check if token is blacklisted
+        if is_token_blacklisted(token_address):
+            logger.warning(f"Token {token_address} is blacklisted, skipping")
+            return None
+        
+    return _fetch_token_metadata(token_address)
 
-def check_token_liquidity(token_address, pair_address, max_retries=3):
+@retry("checking liquidity")
+def check_token_liquidity(token_address, pair_address):
     """Check if a token has sufficient liquidity
     
     Args:
         token_address: Token address
         pair_address: Pair address for the token
-        max_retries: Maximum number of retry attempts
         
     Returns:
         float: Liquidity in BNB or None if insufficient
     """
-    for attempt in range(max_retries):
-        try:
-            w3 = Web3Singleton.get_instance()
-                
-            # Get pair contract
-            pair_contract = get_pair_contract(pair_address)
-            if not pair_contract:
-                logger.error(f"Failed to get pair contract for {pair_address}")
-                return None
-                
-            # Get reserves
-            reserves = pair_contract.functions.getReserves().call()
-            
-            # Get token0 address to determine reserve order
-            token0 = pair_contract.functions.token0().call()
-            
-            # Determine which reserve is BNB and which is the token
-            if token0.lower() == config.WBNB_ADDRESS.lower():
-                bnb_reserve = reserves[0]
-                token_reserve = reserves[1]
-            else:
-                bnb_reserve = reserves[1]
-                token_reserve = reserves[0]
-                
-            # Convert wei to BNB
-            bnb_liquidity = w3.from_wei(bnb_reserve, 'ether')
-            
-            logger.info(f"Token {token_address} has {bnb_liquidity} BNB in liquidity")
-            
-            # Check if liquidity is sufficient
-            if bnb_liquidity < config.MIN_LIQUIDITY:
-                logger.warning(f"Insufficient liquidity: {bnb_liquidity} BNB (minimum: {config.MIN_LIQUIDITY} BNB)")
-                return None
-                
-            return float(bnb_liquidity)
-        except (TimeExhausted, BadFunctionCallOutput) as e:
-            logger.warning(f"Timeout checking liquidity (attempt {attempt+1}/{max_retries}): {e}")
-        except Exception as e:
-            logger.error(f"Error checking liquidity (attempt {attempt+1}/{max_retries}): {e}")
-            
-        # Exponential backoff
-        if attempt < max_retries - 1:
-            backoff_time = config.RETRY_DELAY_BASE * (attempt + 1)
-            logger.info(f"Retrying liquidity check in {backoff_time} seconds...")
-            time.sleep(backoff_time)
+    w3 = Web3Singleton.get_instance()
+        
+    # Get pair contract
+    pair_contract = get_pair_contract(pair_address)
+    if not pair_contract:
+        logger.error(f"Failed to get pair contract for {pair_address}")
+        return None
+        
+    # Get reserves and token0 (to determine reserve order) in a single eth_call
+    reserves, token0 = multicall([
+        pair_contract.functions.getReserves(),
+        pair_contract.functions.token0()
+    ])
+    if reserves is None or token0 is None:
+        logger.error(f"Failed to read reserves of pair {pair_address}")
+        return None
+    
+    # Determine which reserve is BNB and which is the token
+    # Decoded addresses are checksummed, like config.WBNB_ADDRESS
+    if token0 == config.WBNB_ADDRESS:
+        bnb_reserve = reserves[0]
+        token_reserve = reserves[1]
+    else:
+        bnb_reserve = reserves[1]
+        token_reserve = reserves[0]
+        
+    # Convert wei to BNB
+    bnb_liquidity = w3.from_wei(bnb_reserve, 'ether')
     
-    # If we've exhausted all retries
-    logger.error(f"Failed to check liquidity for {token_address} after {max_retries} attempts")
-    return None
+    logger.info(f"Token {token_address} has {bnb_liquidity} BNB in liquidity")
+    
+    # Check if liquidity is sufficient
+    if bnb_liquidity < config.MIN_LIQUIDITY:
+        logger.warning(f"Insufficient liquidity: {bnb_liquidity} BNB (minimum: {config.MIN_LIQUIDITY} BNB)")
+        return None
+        
+    return float(bnb_liquidity)
 
-def analyze_token(token_address):
-    """Perform a comprehensive analysis of a token
+async def analyze_token_async(token_address):
+    """Perform a comprehensive analysis of a token, overlapping independent checks
+    
+    Checks that don't depend on each other run concurrently in worker threads
+    (token data with the pair lookup, then liquidity with the code and sell history
+    checks); results are evaluated in the same order as before, so a token is
+    rejected and blacklisted for the same reason.
     
     Args:
         token_address: Token address to analyze
@@ -191,12 +190,9 @@ def analyze_token(token_address):
     Returns:
         dict: Analysis results or None if token fails checks
     """
-    # Get web3 instance
-    w3 = Web3Singleton.get_instance()
-    
     # Convert address to checksum format
     if isinstance(token_address, str):
-        token_address = w3.to_checksum_address(token_address)
+        token_address = Web3Singleton.to_checksum_address(token_address)
         
     if not token_address:
         logger.error(f"Invalid token address format")
@@ -207,39 +203,46 @@ def analyze_token(token_address):
         logger.warning(f"Token {token_address} is blacklisted, skipping analysis")
         return None
         
-    # Fetch token data
-    token_data = fetch_token_data(token_address)
+    # Fetch token data and the pair address together
+    token_data, pair_address = await asyncio.gather(
+        asyncio.to_thread(fetch_token_data, token_address, checked=True),
+        asyncio.to_thread(get_pair_address, token_address)
+    )
     if not token_data:
         logger.warning(f"Failed to fetch token data for {token_address}")
         return None
         
-    # Get pair address
-    pair_address = get_pair_address(token_address)
     if not pair_address:
         logger.warning(f"No liquidity pair found for {token_data['symbol']} ({token_address})")
         return None
         
-    # Check token liquidity
-    liquidity = check_token_liquidity(token_address, pair_address)
+    # Import security checks to avoid circular imports
+    from security.token_checks import detect_suspicious_assembly, check_token_sell_history, check_for_honeypot
+    
+    # Check liquidity, contract code and sell history together
+    liquidity, suspicious_code, has_sell_history = await asyncio.gather(
+        asyncio.to_thread(check_token_liquidity, token_address, pair_address),
+        asyncio.to_thread(detect_suspicious_assembly, token_address),
+        asyncio.to_thread(check_token_sell_history, token_address, pair_address)
+    )
     if not liquidity:
         logger.warning(f"Insufficient liquidity for {token_data['symbol']} ({token_address})")
         return None
         
-    # Import security checks to avoid circular imports
-    from security.token_checks import detect_suspicious_assembly, check_token_sell_history, check_for_honeypot
-        
     # Perform security checks
-    if detect_suspicious_assembly(token_address):
+    if suspicious_code:
         logger.warning(f"Suspicious code detected in {token_data['symbol']} ({token_address})")
         add_to_blacklist(token_address, token_data['symbol'], "Suspicious assembly code detected")
         return None
         
-    if not check_token_sell_history(token_address, pair_address):
+    if has_sell_history is None:
+        logger.warning(f"Sell history of {token_data['symbol']} ({token_address}) could not be checked")
+    elif not has_sell_history:
         logger.warning(f"Insufficient sell history for {token_data['symbol']} ({token_address})")
         add_to_blacklist(token_address, token_data['symbol'], "Insufficient sell history")
         return None
         
-    if check_for_honeypot(token_address, token_data['symbol']):
+    if await asyncio.to_thread(check_for_honeypot, token_address, token_data['symbol']):
         logger.warning(f"Honeypot detected: {token_data['symbol']} ({token_address})")
         add_to_blacklist(token_address, token_data['symbol'], "Honeypot detected")
         return None
@@ -249,8 +252,58 @@ def analyze_token(token_address):
         **token_data,
         "pair_address": pair_address,
         "liquidity_bnb": liquidity,
-        "passed_security_checks": True
+        "passed_security_checks": True,
+        # False if BSCScan couldn't be reached: the token must not be bought until it's rechecked
+        "sell_history_checked": has_sell_history is not None
     }
     
-    logger.info(f"Token {token_data['symbol']} ({token_address}) passed all security checks")
-    return analysis_result
\ No newline at end of file
+    if analysis_result["sell_history_checked"]:
+        logger.info(f"Token {token_data['symbol']} ({token_address}) passed all security checks")
+    else:
+        logger.info(f"Token {token_data['symbol']} ({token_address}) passed the other security checks, sell history pending")
+    return analysis_result
+
+def analyze_token(token_address):
+    """Synchronous entry point for analyze_token_async
+    
+    Concurrent calls for the same token share a single analysis, and a token that
+    failed analysis is skipped for REJECTED_TOKEN_TTL_SECONDS.
+    
+    Args:
+        token_address: Token address to analyze
+        
+    Returns:
+        dict: Analysis results or None if token fails checks
+    """
+    if isinstance(token_address, str):
+        token_address = Web3Singleton.to_checksum_address(token_address)
+        
+    if not token_address:
+        logger.error(f"Invalid token address format")
+        return None
+        
+    if _REJECTED_TOKENS.get(token_address):
+        logger.info(f"Token {token_address} failed analysis recently, skipping")
+        return None
+        
+    with _inflight_lock:
+        future = _inflight_analyses.get(token_address)
+        owner = future is None
+        if owner:
+            future = Future()
+            _inflight_analyses[token_address] = future
+            
+    if not owner:
+        logger.info(f"Token {token_address} is already being analyzed, waiting for that result")
+        return future.result()
+        
+    result = None
+    try:
+        result = asyncio.run(analyze_token_async(token_address))
+        if result is None:
+            _REJECTED_TOKENS.set(token_address, True)
+        return result
+    finally:
+        future.set_result(result)
+        with _inflight_lock:
+            _inflight_analyses.pop(token_address, None)
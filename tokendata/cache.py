@@ -0,0 +1,127 @@
+"""
+Persistent cache of immutable ERC20 metadata (name, symbol, decimals)
+
+Entries are kept in memory and in the token_metadata table, so a token's
+metadata is fetched over RPC at most once, even across restarts. Tokens whose
+metadata calls reverted are remembered in memory only, for a short while.
+"""
+import threading
+
+from utils.logging_setup import logger
+from utils.ttl_cache import TTLCache
+from database.models import get_connection
+import config
+
+_SELECT_METADATA = "SELECT name, symbol, decimals FROM token_metadata WHERE token_address = ?"
+
+_UPSERT_METADATA = '''
+INSERT INTO token_metadata (token_address, name, symbol, decimals)
+VALUES (?, ?, ?, ?)
+ON CONFLICT(token_address) DO UPDATE SET
+    name = COALESCE(excluded.name, name),
+    symbol = COALESCE(excluded.symbol, symbol),
+    decimals = excluded.decimals
+'''
+
+_metadata = {}
+_lock = threading.Lock()
+
+# Tokens whose symbol()/decimals() reverted, not read again until the entry expires
+_missing = TTLCache(maxsize=4096, ttl=config.TOKEN_METADATA_MISS_TTL_SECONDS)
+
+def get_token_metadata(token_address):
+    """Get cached metadata for a token
+    
+    Args:
+        token_address: Token address
+        
+    Returns:
+        dict: Metadata with name, symbol and decimals, or None if not cached
+    """
+    metadata = _metadata.get(token_address)
+    if metadata is not None:
+        return metadata
+        
+    try:
+        conn = get_connection()
+        if not conn:
+            return None
+            
+        row = conn.execute(_SELECT_METADATA, (token_address,)).fetchone()
+        if row is None:
+            return None
+            
+        metadata = {"name": row['name'], "symbol": row['symbol'], "decimals": row['decimals']}
+        with _lock:
+            _metadata[token_address] = metadata
+        return metadata
+    except Exception as e:
+        logger.error("Error reading token metadata cache: %s", e)
+        return None
+
+def store_token_metadata(token_address, decimals, name=None, symbol=None):
+    """Store metadata for a token
+    
+    Args:
+        token_address: Token address
+        decimals: Token decimals
+        name: Token name (kept from a previous entry if None)
+        symbol: Token symbol (kept from a previous entry if None)
+    """
+    try:
+        previous = _metadata.get(token_address) or {}
+        metadata = {
+            "name": name if name is not None else previous.get('name'),
+            "symbol": symbol if symbol is not None else previous.get('symbol'),
+            "decimals": decimals
+        }
+        with _lock:
+            _metadata[token_address] = metadata
+            
+        conn = get_connection()
+        if conn:
+            conn.execute(_UPSERT_METADATA, (token_address, name, symbol, decimals))
+    except Exception as e:
+        logger.error("Error writing token metadata cache: %s", e)
+
+def store_token_metadata_miss(token_address):
+    """Remember that the metadata calls of a token reverted
+    
+    Args:
+        token_address: Token address
+    """
+    _missing.set(token_address, True)
+
+def is_token_metadata_missing(token_address):
+    """Check whether the metadata calls of a token reverted recently
+    
+    Args:
+        token_address: Token address
+        
+    Returns:
+        bool: True if they reverted within TOKEN_METADATA_MISS_TTL_SECONDS
+    """
+    return _missing.get(token_address, False)
+
+def get_token_decimals(token_address):
+    """Get token decimals, fetching token data only on a cache miss
+    
+    Args:
+        token_address: Token address
+        
+    Returns:
+        int: Token decimals or None if they couldn't be fetched
+    """
+    metadata = get_token_metadata(token_address)
+    if metadata is not None:
+        return metadata['decimals']
+        
+    # Import here to avoid circular imports
+    from tokendata.analysis import fetch_token_data
+    
+    token_data = fetch_token_data(token_address)
+    if not token_data:
+        return None
+        
+    store_token_metadata(token_address, token_data['decimals'], token_data['name'], token_data['symbol'])
+    return token_data['decimals']
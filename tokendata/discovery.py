@@ -1,20 +1,64 @@
+import asyncio
+import random
 import time
 import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from web3.exceptions import LogTopicError, BlockNotFound
 
 from utils.logging_setup import logger
 from utils.web3_singleton import Web3Singleton
+from utils.rate_limiter import RPC_RATE_LIMITER
+from contracts.abis import PAIR_CREATED_TOPIC
 from contracts.interfaces import get_factory_contract
 from tokendata.analysis import analyze_token
 from trading.buy import execute_buy
 import config
 
-def handle_new_pair(token_address, pair_address):
+# Delay before re-subscribing after the WebSocket connection drops (seconds)
+WS_RECONNECT_DELAY = 5
+# Delay before recreating the HTTP polling filter after an error (seconds)
+POLL_RECONNECT_DELAY = 60
+# How often the HTTP fallback checks for a new block (seconds, BSC produces one every ~3)
+BLOCK_POLL_INTERVAL = 1
+# Delay before retrying a block range that hit the endpoint's rate limit (seconds)
+RATE_LIMIT_BACKOFF = 10
+# Maximum pairs analyzed at the same time by the WebSocket listener
+PAIR_HANDLER_CONCURRENCY = 4
+# Retry schedule for pairs whose sell history couldn't be checked (seconds, doubled per attempt)
+SELL_HISTORY_RETRY_DELAY = 30
+SELL_HISTORY_MAX_RETRIES = 4
+
+def queue_for_retry(token_address, pair_address, attempt):
+    """Handle a pair again later, with exponential backoff and jitter
+    
+    Args:
+        token_address: Token address
+        pair_address: Pair address
+        attempt: Number of retries already made
+        
+    Returns:
+        bool: True if a retry was scheduled, False if retries are exhausted
+    """
+    if attempt >= SELL_HISTORY_MAX_RETRIES:
+        logger.warning(f"Giving up on {token_address}: sell history still unknown after {attempt} retries")
+        return False
+        
+    # Jitter spreads out the retries of pairs that failed together (e.g. a BSCScan 429 burst)
+    delay = SELL_HISTORY_RETRY_DELAY * (2 ** attempt) * random.uniform(0.5, 1.5)
+    logger.info(f"Retrying {token_address} in {delay:.0f} seconds (retry {attempt+1}/{SELL_HISTORY_MAX_RETRIES})")
+    
+    timer = threading.Timer(delay, handle_new_pair, args=(token_address, pair_address, attempt + 1))
+    timer.daemon = True
+    timer.start()
+    return True
+
+def handle_new_pair(token_address, pair_address, retry_attempt=0):
     """Handle a newly created trading pair
     
     Args:
         token_address: Token address
         pair_address: Pair address
+        retry_attempt: Number of earlier attempts deferred because the sell history was unknown
         
     Returns:
         bool: True if successfully handled, False otherwise
@@ -29,6 +73,11 @@ def handle_new_pair(token_address, pair_address):
             logger.warning(f"Token analysis failed for {token_address}")
             return False
             
+        # Don't buy on missing data, check again once BSCScan is reachable
+        if not token_analysis['sell_history_checked']:
+            queue_for_retry(token_address, pair_address, retry_attempt)
+            return False
+            
         logger.info(f"Token analysis successful: {token_analysis['symbol']} ({token_analysis['name']})")
         
         # Execute buy if all checks pass
@@ -36,10 +85,12 @@ def handle_new_pair(token_address, pair_address):
         
         logger.info(f"Executing buy for {token_analysis['symbol']}: {investment_amount} BNB")
         
+        # Nonces come from WALLET_NONCES, so concurrent handlers can buy at the same time
         buy_result = execute_buy(token_address, investment_amount)
         
-        if buy_result and buy_result['status'] == 'success':
-            logger.info(f"Buy successful: {buy_result['token_balance']} {token_analysis['symbol']} for {buy_result['bnb_spent']} BNB")
+        # The confirmation worker records the buy once it is mined
+        if buy_result and buy_result['status'] == 'pending':
+            logger.info(f"Buy submitted: {buy_result['bnb_spent']} BNB of {token_analysis['symbol']} ({buy_result['tx_hash']})")
             return True
         else:
             logger.error(f"Buy failed for {token_analysis['symbol']}")
@@ -67,9 +118,10 @@ def process_pair_created_event(event_data):
         logger.info(f"PairCreated event: token0={token0}, token1={token1}, pair={pair_address}")
         
         # Determine which token is the one we're interested in (paired with WBNB)
-        if token0.lower() == config.WBNB_ADDRESS.lower():
+        # Decoded event addresses are checksummed, like config.WBNB_ADDRESS
+        if token0 == config.WBNB_ADDRESS:
             target_token = token1
-        elif token1.lower() == config.WBNB_ADDRESS.lower():
+        elif token1 == config.WBNB_ADDRESS:
             target_token = token0
         else:
             # Neither token is WBNB, we're not interested
@@ -83,11 +135,30 @@ def process_pair_created_event(event_data):
         logger.error(f"Error processing PairCreated event: {e}")
         return False
 
+def _fetch_pair_created_events(factory_contract, batch_start, batch_end):
+    """Fetch the PairCreated events of a block range, retrying once on rate limits"""
+    logger.info(f"Scanning blocks {batch_start} to {batch_end}")
+    
+    try:
+        RPC_RATE_LIMITER.acquire()
+        # Use the newer API for web3.py 7.x
+        return factory_contract.events.PairCreated.get_logs(from_block=batch_start, to_block=batch_end)
+    except Exception as e:
+        if "limit exceeded" not in str(e):
+            raise
+        logger.warning(f"Rate limit hit on blocks {batch_start} to {batch_end}, retrying in {RATE_LIMIT_BACKOFF} seconds...")
+        time.sleep(RATE_LIMIT_BACKOFF)
+        RPC_RATE_LIMITER.acquire()
+        return factory_contract.events.PairCreated.get_logs(from_block=batch_start, to_block=batch_end)
+
 def scan_recent_blocks(blocks_to_scan=50):
-    """Scan recent blocks for PairCreated events - reduced to work with rate limits
+    """Scan recent blocks for PairCreated events
+    
+    Block ranges are fetched concurrently (config.RPC_PARALLELISM requests in flight,
+    paced by the shared RPC rate limiter) and events are processed as ranges arrive.
     
     Args:
-        blocks_to_scan: Number of blocks to scan (reduced default to avoid rate limits)
+        blocks_to_scan: Number of blocks to scan
         
     Returns:
         list: Processed pairs
@@ -104,42 +175,35 @@ def scan_recent_blocks(blocks_to_scan=50):
         
         logger.info(f"Scanning for PairCreated events from block {from_block} to {current_block}")
         
-        # Process in much smaller batches to avoid rate limits
-        batch_size = 10  # Molto più piccoli batch per evitare limiti di frequenza
+        # Small block ranges keep each eth_getLogs response under provider limits
+        batch_size = 10
+        batches = [
+            (batch_start, min(batch_start + batch_size - 1, current_block))
+            for batch_start in range(from_block, current_block, batch_size)
+        ]
         processed_pairs = []
         
-        # Più tempo tra le richieste iniziali
-        time.sleep(5)
-        
-        for batch_start in range(from_block, current_block, batch_size):
-            batch_end = min(batch_start + batch_size - 1, current_block)
+        with ThreadPoolExecutor(max_workers=max(1, min(config.RPC_PARALLELISM, len(batches)))) as executor:
+            futures = {
+                executor.submit(_fetch_pair_created_events, factory_contract, batch_start, batch_end): (batch_start, batch_end)
+                for batch_start, batch_end in batches
+            }
             
-            try:
-                logger.info(f"Scanning blocks {batch_start} to {batch_end}")
-                
-                # Add delay between requests to avoid rate limits
-                time.sleep(3)  # Aumentato da 1 a 3 secondi
-                
-                # Use the newer API for web3.py 7.x
-                events = factory_contract.events.PairCreated.get_logs(from_block=batch_start, to_block=batch_end)
-                
+            # Analysis and buys stay sequential on this thread
+            for future in as_completed(futures):
+                batch_start, batch_end = futures[future]
+                try:
+                    events = future.result()
+                except (LogTopicError, BlockNotFound) as e:
+                    logger.warning(f"Error scanning blocks {batch_start} to {batch_end}: {e}")
+                    continue
+                except Exception as e:
+                    logger.error(f"Unexpected error scanning blocks {batch_start} to {batch_end}: {e}")
+                    continue
+                    
                 for event in events:
                     if process_pair_created_event(event):
                         processed_pairs.append(event.args.pair)
-                        
-            except (LogTopicError, BlockNotFound) as e:
-                logger.warning(f"Error scanning blocks {batch_start} to {batch_end}: {e}")
-            except Exception as e:
-                # Aggiungere backoff esponenziale quando si raggiungono i limiti
-                if "limit exceeded" in str(e):
-                    # Ritardo esponenziale quando si raggiunge il limite
-                    backoff_time = 10 * ((batch_start - from_block) // batch_size + 1)
-                    logger.warning(f"Limite di frequenza raggiunto, attendere {backoff_time} secondi...")
-                    time.sleep(backoff_time)
-                else:
-                    logger.error(f"Unexpected error scanning blocks {batch_start} to {batch_end}: {e}")
-                    # Add increasing delay on errors to respect rate limits
-                    time.sleep(5)  # Aumentato da 3 a 5 secondi
                 
         logger.info(f"Completed scanning {blocks_to_scan} blocks, processed {len(processed_pairs)} pairs")
         return processed_pairs
@@ -148,9 +212,90 @@ def scan_recent_blocks(blocks_to_scan=50):
         logger.error(f"Error scanning recent blocks: {e}")
         return []
 
+async def _subscribe_pair_created():
+    """Subscribe to PairCreated logs over WebSocket and process each pair as it is pushed
+    
+    Runs until the connection drops (the exception propagates to the caller).
+    """
+    pair_created = get_factory_contract().events.PairCreated()
+    log_filter = {
+        'address': config.PANCAKE_FACTORY_ADDRESS,
+        'topics': [PAIR_CREATED_TOPIC]
+    }
+    
+    semaphore = asyncio.Semaphore(PAIR_HANDLER_CONCURRENCY)
+    # Strong references to in-flight handlers so they aren't garbage collected
+    handlers = set()
+    
+    async def handle_event(event):
+        async with semaphore:
+            # Analysis and buys block, so run them off the loop to keep answering WebSocket pings
+            await asyncio.to_thread(process_pair_created_event, event)
+    
+    async with Web3Singleton.websocket() as w3:
+        await w3.eth.subscribe('logs', log_filter)
+        logger.info(f"Subscribed to PairCreated events via {config.BSC_WS_ENDPOINT}")
+        
+        async for payload in w3.socket.process_subscriptions():
+            try:
+                event = pair_created.process_log(payload['result'])
+            except Exception as e:
+                logger.warning(f"Failed to decode PairCreated log: {e}")
+                continue
+                
+            # Handle each pair in its own task so a slow analysis doesn't hold up the next pair
+            handler = asyncio.create_task(handle_event(event))
+            handlers.add(handler)
+            handler.add_done_callback(handlers.discard)
+
+def _poll_pair_created():
+    """Poll for PairCreated events over HTTP (fallback when no WebSocket endpoint is set)
+    
+    A block filter wakes the poller only when a new block arrives; the PairCreated
+    logs of every block since the last poll are then fetched in one get_logs call.
+    Runs until a poll fails.
+    """
+    w3 = Web3Singleton.get_instance()
+    factory_contract = get_factory_contract()
+    
+    block_filter = w3.eth.filter('latest')
+    last_block = w3.eth.block_number
+    
+    logger.info("Listening for new PairCreated events...")
+    
+    last_check = time.time()
+    
+    while True:
+        try:
+            # Nothing to fetch until a new block has been produced
+            if not block_filter.get_new_entries():
+                time.sleep(BLOCK_POLL_INTERVAL)
+                continue
+                
+            current_block = w3.eth.block_number
+            if current_block > last_block:
+                events = factory_contract.events.PairCreated.get_logs(from_block=last_block + 1, to_block=current_block)
+                for event in events:
+                    process_pair_created_event(event)
+                last_block = current_block
+                
+            # Log periodic updates with less frequency to avoid spamming the log
+            now = time.time()
+            if now - last_check > 300:  # Every 5 minutes
+                logger.info("Still listening for PairCreated events...")
+                last_check = now
+                
+        except Exception as e:
+            logger.error(f"Error polling for PairCreated events: {e}")
+            # Let the caller recreate the filter
+            return
+
 def start_pair_listener():
     """Start listening for new pairs in a separate thread
     
+    New pairs are pushed over a WebSocket subscription when config.BSC_WS_ENDPOINT
+    is set, otherwise an HTTP log filter is polled.
+    
     Returns:
         threading.Thread: Listener thread
     """
@@ -162,47 +307,17 @@ def start_pair_listener():
        # except Exception as e:
        #     logger.error(f"Error scanning recent blocks: {e}")
        # 
-        # Set up event filter
-        factory_contract = get_factory_contract()
-        
         while True:
             try:
-                # Create event filter for latest blocks using web3.py 7.x approach
-                # Only listen for new blocks, don't try to scan history
-                event_filter = factory_contract.events.PairCreated.create_filter(from_block='latest')
-                
-                logger.info("Listening for new PairCreated events...")
-                
-                # Poll for new events
-                last_check = time.time()
-                
-                while True:
-                    try:
-                        # Check for new entries
-                        new_events = event_filter.get_new_entries()
-                        
-                        for event in new_events:
-                            process_pair_created_event(event)
-                            
-                        # Log periodic updates with less frequency to avoid spamming the log
-                        now = time.time()
-                        if now - last_check > 300:  # Every 5 minutes
-                            logger.info("Still listening for PairCreated events...")
-                            last_check = now
-                            
-                        # Sleep to avoid too many requests (increased to respect rate limits)
-                        time.sleep(5)  # Aumentato da 3 a 5 secondi
-                        
-                    except Exception as e:
-                        logger.error(f"Error getting new entries: {e}")
-                        # Recreate filter and continue
-                        break
-                        
+                if config.BSC_WS_ENDPOINT:
+                    asyncio.run(_subscribe_pair_created())
+                else:
+                    _poll_pair_created()
             except Exception as e:
                 logger.error(f"Error in listener thread: {e}")
                 
-            # Sleep before reconnecting (increased to respect rate limits)
-            time.sleep(60)  # Aumentato da 30 a 60 secondi
+            # Sleep before reconnecting
+            time.sleep(WS_RECONNECT_DELAY if config.BSC_WS_ENDPOINT else POLL_RECONNECT_DELAY)
     
     # Start listener thread
     thread = threading.Thread(target=listener_thread)
@@ -210,4 +325,4 @@ def start_pair_listener():
     thread.start()
     
     logger.info("Pair listener started")
-    return thread
\ No newline at end of file
+    return thread
@@ -0,0 +1,118 @@
+"""
+Parallel block scanning for PairCreated events using AsyncWeb3
+"""
+import asyncio
+
+from web3 import AsyncWeb3, AsyncHTTPProvider
+
+from utils.logging_setup import logger
+from utils import rpc_health
+from contracts.abis import PAIR_CREATED_TOPIC
+from contracts.interfaces import get_factory_contract
+from tokendata.discovery import process_pair_created_event
+import config
+
+# Blocks fetched concurrently per round (stays under the public dataseed rate limits)
+SCAN_CHUNK_SIZE = 32
+# Maximum in-flight eth_getLogs requests per endpoint
+SCAN_CONCURRENCY = 32
+# Delay before retrying a block that hit the endpoint's rate limit (seconds)
+RATE_LIMIT_BACKOFF = 5
+
+async def _get_block_logs(w3, semaphore, block_number, factory_address):
+    """Fetch the PairCreated logs of a single block, retrying once on rate limits"""
+    log_filter = {
+        'fromBlock': block_number,
+        'toBlock': block_number,
+        'address': factory_address,
+        'topics': [PAIR_CREATED_TOPIC]
+    }
+
+    async with semaphore:
+        try:
+            return await w3.eth.get_logs(log_filter)
+        except Exception as e:
+            if "limit exceeded" not in str(e):
+                raise
+            logger.warning("Rate limit hit on block %s, retrying in %s seconds...", block_number, RATE_LIMIT_BACKOFF)
+            await asyncio.sleep(RATE_LIMIT_BACKOFF)
+            return await w3.eth.get_logs(log_filter)
+
+async def fetch_pair_created_logs(blocks_to_scan=50, endpoint=None):
+    """Fetch raw PairCreated logs for the most recent blocks concurrently
+
+    Args:
+        blocks_to_scan: Number of blocks to scan
+        endpoint: RPC endpoint to use (defaults to the healthiest configured endpoint)
+
+    Returns:
+        list: Raw logs, ordered by block
+    """
+    endpoint = endpoint or rpc_health.ranked_endpoints(config.BSC_RPC_ENDPOINTS)[0]
+    w3 = AsyncWeb3(AsyncHTTPProvider(endpoint, request_kwargs={'timeout': config.CONNECTION_TIMEOUT}))
+    semaphore = asyncio.Semaphore(SCAN_CONCURRENCY)
+    factory_address = config.PANCAKE_FACTORY_ADDRESS
+
+    try:
+        current_block = await w3.eth.block_number
+        from_block = max(1, current_block - blocks_to_scan)
+
+        logger.info("Scanning for PairCreated events from block %s to %s via %s", from_block, current_block, endpoint)
+
+        logs = []
+        blocks = list(range(from_block, current_block + 1))
+
+        for chunk_start in range(0, len(blocks), SCAN_CHUNK_SIZE):
+            chunk = blocks[chunk_start:chunk_start + SCAN_CHUNK_SIZE]
+            results = await asyncio.gather(
+                *[_get_block_logs(w3, semaphore, block, factory_address) for block in chunk],
+                return_exceptions=True
+            )
+
+            for block_number, result in zip(chunk, results):
+                if isinstance(result, Exception):
+                    logger.warning("Error scanning block %s: %s", block_number, result)
+                    continue
+                logs.extend(result)
+
+        return logs
+    finally:
+        await w3.provider.disconnect()
+
+async def scan_recent_blocks_async(blocks_to_scan=50):
+    """Scan recent blocks for PairCreated events, fetching blocks in parallel
+
+    Args:
+        blocks_to_scan: Number of blocks to scan
+
+    Returns:
+        list: Processed pairs
+    """
+    try:
+        logs = await fetch_pair_created_logs(blocks_to_scan)
+
+        # Decoding, analysis and buys stay sequential on the sync stack
+        pair_created = get_factory_contract().events.PairCreated()
+        processed_pairs = []
+
+        for log in logs:
+            try:
+                event = pair_created.process_log(log)
+            except Exception as e:
+                logger.warning("Failed to decode PairCreated log: %s", e)
+                continue
+
+            # analyze_token runs its own event loop and buys block, so run them off this loop
+            if await asyncio.to_thread(process_pair_created_event, event):
+                processed_pairs.append(event.args.pair)
+
+        logger.info("Completed scanning %s blocks, processed %s pairs", blocks_to_scan, len(processed_pairs))
+        return processed_pairs
+
+    except Exception as e:
+        logger.error("Error scanning recent blocks: %s", e)
+        return []
+
+def scan_recent_blocks_parallel(blocks_to_scan=50):
+    """Synchronous entry point for scan_recent_blocks_async"""
+    return asyncio.run(scan_recent_blocks_async(blocks_to_scan))
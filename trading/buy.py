@@ -1,12 +1,111 @@
+import queue
+import threading
 import time
+from concurrent.futures import Future
+from functools import lru_cache
 from web3.exceptions import TimeExhausted, BadFunctionCallOutput, TransactionNotFound
 
 from utils.logging_setup import logger
 from utils.web3_singleton import Web3Singleton
+from utils.nonce_manager import WALLET_NONCES
+from utils.gas_tracker import GAS_TRACKER
+from utils.retry import backoff_delay, rpc_backoff_delay
 from contracts.interfaces import get_router_contract, get_token_contract
+from contracts.multicall import multicall
+from tokendata.cache import get_token_metadata, store_token_metadata, store_token_metadata_miss, is_token_metadata_missing
 from database.operations import record_transaction, add_to_portfolio, add_to_blacklist
 import config
 
+# Receipt polling of submitted buys: delays double from 1 s up to this cap (seconds)
+RECEIPT_POLL_MAX_DELAY = 8
+# Stop tracking a buy that isn't mined after this long (seconds)
+RECEIPT_TIMEOUT = 120
+
+# Byte ranges of the uint256 arguments patched into cached buy calldata: after the
+# 4-byte selector, amountOutMin is the first head slot and deadline the fourth
+# (swapExactETHForTokensSupportingFeeOnTransferTokens(amountOutMin, path, to, deadline))
+_AMOUNT_OUT_MIN_SLOT = slice(4, 36)
+_DEADLINE_SLOT = slice(100, 132)
+
+# Submitted buys waiting for a receipt, as (context, Future) pairs
+_pending_buys = queue.Queue()
+_confirmation_worker = None
+_worker_lock = threading.Lock()
+
+def _prefetch_buy_quotes(token_contract, bnb_amount_wei, quote=True):
+    """Read a token's symbol and decimals and quote the buy, all in one Multicall3 eth_call
+    
+    Metadata already in tokendata.cache is reused, leaving only the quote to fetch.
+    
+    Args:
+        token_contract: Token contract instance
+        bnb_amount_wei: Amount of BNB to spend, in wei
+        quote: Whether to quote the buy (test buys don't need a minimum output)
+        
+    Returns:
+        tuple: (symbol, decimals, expected tokens out), with None for any call that reverted or was skipped
+    """
+    if is_token_metadata_missing(token_contract.address):
+        # The metadata calls reverted moments ago, no point quoting
+        return None, None, None
+        
+    calls = []
+    if quote:
+        calls.append(get_router_contract().functions.getAmountsOut(bnb_amount_wei, [config.WBNB_ADDRESS, token_contract.address]))
+        
+    metadata = get_token_metadata(token_contract.address)
+    if metadata is not None and metadata['symbol'] is not None:
+        symbol, decimals = metadata['symbol'], metadata['decimals']
+        amounts_out = calls[0].call() if calls else None
+    else:
+        symbol, decimals, *quoted = multicall([
+            token_contract.functions.symbol(),
+            token_contract.functions.decimals()
+        ] + calls)
+        amounts_out = quoted[0] if quoted else None
+        if symbol is None or decimals is None:
+            store_token_metadata_miss(token_contract.address)
+        else:
+            store_token_metadata(token_contract.address, decimals, symbol=symbol)
+        
+    return symbol, decimals, amounts_out[1] if amounts_out else None
+
+@lru_cache(maxsize=1024)
+def _buy_calldata_template(token_address):
+    """ABI-encode the buy call of a token once, with zero amountOutMin and deadline"""
+    return bytes.fromhex(get_router_contract().encode_abi(
+        'swapExactETHForTokensSupportingFeeOnTransferTokens',
+        args=[0, [config.WBNB_ADDRESS, token_address], config.WALLET_ADDRESS, 0]
+    )[2:])
+
+def _build_cached_calldata(token_address, min_tokens, deadline):
+    """Calldata of a buy, patching the per-transaction arguments into the cached encoding
+    
+    Args:
+        token_address: Checksummed token address
+        min_tokens: Minimum tokens to receive
+        deadline: Transaction deadline (unix time)
+        
+    Returns:
+        bytes: Transaction data
+    """
+    calldata = bytearray(_buy_calldata_template(token_address))
+    calldata[_AMOUNT_OUT_MIN_SLOT] = min_tokens.to_bytes(32, 'big')
+    calldata[_DEADLINE_SLOT] = deadline.to_bytes(32, 'big')
+    return bytes(calldata)
+
+def _apply_slippage(expected_tokens, slippage_percentage=None):
+    """Minimum tokens to accept for an expected output, given the slippage tolerance"""
+    if slippage_percentage is None:
+        slippage_percentage = config.SLIPPAGE
+        
+    # Integer math in basis points: a float product would lose precision on large outputs
+    bps = int(round(slippage_percentage * 100))
+    min_tokens = expected_tokens * (10000 - bps) // 10000
+    
+    logger.info("Expected tokens: %s, Min tokens after %s%% slippage: %s", expected_tokens, slippage_percentage, min_tokens)
+    return min_tokens
+
 def calculate_min_tokens(token_address, bnb_amount, slippage_percentage=None):
     """Calculate minimum tokens to receive based on current rate and slippage
     
@@ -18,9 +117,6 @@ def calculate_min_tokens(token_address, bnb_amount, slippage_percentage=None):
     Returns:
         int: Minimum tokens to receive or None if calculation fails
     """
-    if slippage_percentage is None:
-        slippage_percentage = config.SLIPPAGE
-        
     try:
         # Get web3 instance
         w3 = Web3Singleton.get_instance()
@@ -36,77 +132,77 @@ def calculate_min_tokens(token_address, bnb_amount, slippage_percentage=None):
         ).call()
         
         # Apply slippage tolerance
-        min_tokens = int(amount_out[1] * (100 - slippage_percentage) / 100)
-        
-        logger.info(f"Expected tokens: {amount_out[1]}, Min tokens after {slippage_percentage}% slippage: {min_tokens}")
-        return min_tokens
+        return _apply_slippage(amount_out[1], slippage_percentage)
     except Exception as e:
-        logger.error(f"Error calculating minimum tokens: {e}")
+        logger.error("Error calculating minimum tokens: %s", e)
         return None
 
-def execute_buy(token_address, bnb_amount, is_test=False, max_retries=3):
-    """Execute a buy transaction
+def submit_buy(token_address, bnb_amount, is_test=False, max_retries=3):
+    """Build, sign and send a buy transaction without waiting for it to be mined
     
     Args:
         token_address: Token address to buy
         bnb_amount: Amount of BNB to spend
-        is_test: Whether this is a test buy (for honeypot check)
+        is_test: Whether this is a test buy (sent without a minimum output, so without a quote)
         max_retries: Maximum number of retry attempts
         
     Returns:
-        dict: Transaction result or None if failed
+        dict: Buy context (token_address, token_symbol, token_decimals, bnb_amount, tx_hash) or None if failed
     """
+    # Invariant across attempts; only a reconnect (checked before each retry) replaces them
+    w3 = Web3Singleton.get_instance()
+    token_contract = get_token_contract(token_address)
+    if not token_contract:
+        logger.error("Failed to get token contract for %s", token_address)
+        return None
+        
+    # Convert BNB amount to wei
+    bnb_amount_wei = w3.to_wei(bnb_amount, 'ether')
+    
     for attempt in range(max_retries):
+        nonce = None
+        sent = False
+        timed_out = False
         try:
-            # Get web3 instance
-            w3 = Web3Singleton.get_instance()
-            router_contract = get_router_contract()
-            token_contract = get_token_contract(token_address)
-            
-            if not token_contract:
-                logger.error(f"Failed to get token contract for {token_address}")
+            # Get token symbol and decimals for reporting (cached after the first read), and a
+            # fresh expected output, in one round trip
+            token_symbol, token_decimals, expected_tokens = _prefetch_buy_quotes(token_contract, bnb_amount_wei, quote=not is_test)
+            if token_symbol is None or token_decimals is None:
+                logger.error("Failed to read symbol/decimals of %s", token_address)
                 return None
                 
-            # Get token symbol and decimals for reporting
-            token_symbol = token_contract.functions.symbol().call()
-            token_decimals = token_contract.functions.decimals().call()
-            
-            # Calculate minimum tokens to receive
-            min_tokens = calculate_min_tokens(token_address, bnb_amount)
-            if not min_tokens:
-                logger.error(f"Failed to calculate minimum tokens for {token_address}")
-                return None
+            if is_test:
+                # A test buy only probes whether the token can be bought and sold back,
+                # so it accepts any output and skips the getAmountsOut round trip
+                min_tokens = 0
+            else:
+                # Calculate minimum tokens to receive; a real buy never goes out without a minimum
+                min_tokens = _apply_slippage(expected_tokens) if expected_tokens else None
+                if not min_tokens:
+                    logger.error("Failed to calculate minimum tokens for %s", token_address)
+                    return None
                 
-            # Convert BNB amount to wei
-            bnb_amount_wei = w3.to_wei(bnb_amount, 'ether')
-            
-            # Current gas price
-            gas_price = int(w3.eth.gas_price * config.GAS_MULTIPLIER)
+            # Current gas price, tracked per block
+            gas_price = int(GAS_TRACKER.current() * config.GAS_MULTIPLIER)
             
-            # For nonce management: add a small delay and get the latest nonce
-            time.sleep(1)  # Short delay to ensure blockchain state is updated
-            
-            # Current nonce with logging
-            nonce = w3.eth.get_transaction_count(config.WALLET_ADDRESS)
-            logger.info(f"Using nonce {nonce} for buy transaction")
+            # Next nonce from the local allocator, no RPC round trip
+            nonce = WALLET_NONCES.next()
+            logger.info("Using nonce %s for buy transaction", nonce)
             
             # Transaction deadline (5 minutes from now)
             deadline = int(time.time() + 300)
             
-            # Build transaction
-            tx = router_contract.functions.swapExactETHForTokensSupportingFeeOnTransferTokens(
-                min_tokens,  # Minimum tokens to receive
-                [config.WBNB_ADDRESS, token_address],  # Path
-                config.WALLET_ADDRESS,  # Recipient
-                deadline  # Deadline
-            ).build_transaction({
+            # Build transaction: every field is known, so skip build_transaction and its ABI encoding
+            tx = {
                 'from': config.WALLET_ADDRESS,
+                'to': config.PANCAKE_ROUTER_ADDRESS,
+                'data': _build_cached_calldata(token_contract.address, min_tokens, deadline),
                 'value': bnb_amount_wei,
                 'gas': 300000,  # Gas limit
                 'gasPrice': gas_price,
                 'nonce': nonce,
                 'chainId': 56  # BSC Chain ID
-            })
+            }
             
             # Sign transaction - Updated for Web3.py 7.x
             signed_tx = w3.eth.account.sign_transaction(tx, config.PRIVATE_KEY)
@@ -120,76 +216,215 @@ def execute_buy(token_address, bnb_amount, is_test=False, max_retries=3):
                 raw_tx = signed_tx.raw_transaction
                 
             # Send transaction
+            sent = True
             tx_hash = w3.eth.send_raw_transaction(raw_tx)
-            tx_hash_hex = tx_hash.hex()
-            
-            logger.info(f"Buy transaction sent: {tx_hash_hex}")
+            WALLET_NONCES.sent(nonce)
             
-            # Wait for transaction receipt
-            tx_receipt = w3.eth.wait_for_transaction_receipt(tx_hash, timeout=120)
+            logger.info("Buy transaction sent: %s", tx_hash.hex())
             
-            if tx_receipt['status'] == 1:
-                logger.info(f"Buy transaction successful: {tx_hash_hex}")
-                
-                # Get token balance after purchase
-                token_balance = token_contract.functions.balanceOf(
-                    config.WALLET_ADDRESS
-                ).call()
-                
-                # Record transaction
-                transaction_type = "test_buy" if is_test else "buy"
-                record_transaction(
-                    token_address,
-                    token_symbol,
-                    transaction_type,
-                    token_balance / (10 ** token_decimals),  # Convert to token units
-                    bnb_amount,
-                    tx_hash_hex
-                )
-                
-                # Add to portfolio if not a test buy
-                if not is_test:
-                    token_price = bnb_amount / (token_balance / (10 ** token_decimals))
-                    
-                    add_to_portfolio(
-                        token_address,
-                        token_symbol,
-                        token_balance / (10 ** token_decimals),
-                        token_price,
-                        bnb_amount,
-                        config.TAKE_PROFIT_PERCENTAGE,
-                        config.STOP_LOSS_PERCENTAGE
-                    )
-                
-                return {
-                    "status": "success",
-                    "tx_hash": tx_hash_hex,
-                    "token_balance": token_balance / (10 ** token_decimals),
-                    "bnb_spent": bnb_amount
-                }
-            else:
-                logger.error(f"Buy transaction failed: {tx_hash_hex}")
-                
-                # Add to blacklist if regular buy fails
-                if not is_test:
-                    add_to_blacklist(token_address, token_symbol, "Buy transaction failed")
-                    
-                return {
-                    "status": "failed",
-                    "tx_hash": tx_hash_hex
-                }
+            return {
+                "token_address": token_address,
+                "token_symbol": token_symbol,
+                "token_decimals": token_decimals,
+                "bnb_amount": bnb_amount,
+                "tx_hash": tx_hash
+            }
                 
         except (TimeExhausted, BadFunctionCallOutput, TransactionNotFound) as e:
-            logger.warning(f"Transaction error during buy (attempt {attempt+1}/{max_retries}): {e}")
+            timed_out = True
+            logger.warning("Transaction error during buy (attempt %s/%s): %s", attempt+1, max_retries, e)
         except Exception as e:
-            logger.error(f"Error executing buy (attempt {attempt+1}/{max_retries}): {e}")
+            logger.error("Error executing buy (attempt %s/%s): %s", attempt+1, max_retries, e)
             
-        # Exponential backoff with larger delay for transaction-related errors
+        # An unsent nonce is recycled; after a failed send it may be used (or already taken),
+        # so it is re-read from the chain
+        if sent:
+            WALLET_NONCES.resync(nonce)
+            # The retry re-reads the gas price too, in case the send was underpriced
+            GAS_TRACKER.invalidate()
+        elif nonce is not None:
+            WALLET_NONCES.release(nonce)
+            
+        # Exponential backoff, jittered so buys that failed together don't retry together;
+        # a timeout waits for the next blocks, any other failure is retried right away
         if attempt < max_retries - 1:
-            backoff_time = config.RETRY_DELAY_BASE * (attempt + 1) * 2  # Double the backoff
-            logger.info(f"Retrying buy in {backoff_time} seconds...")
+            if timed_out:
+                backoff_time = backoff_delay(attempt, jitter=config.RETRY_DELAY_BASE)
+            else:
+                backoff_time = rpc_backoff_delay(attempt)
+            logger.info("Retrying buy in %.2f seconds...", backoff_time)
             time.sleep(backoff_time)
+            
+            # A reconnect replaces the instance and drops the cached contracts
+            current = Web3Singleton.get_instance()
+            if current is not w3:
+                w3 = current
+                token_contract = get_token_contract(token_address)
     
     # If we've exhausted all retries
-    logger.error(f"Failed to execute buy for {token_address} after {max_retries} attempts")
-    return None
\ No newline at end of file
+    logger.error("Failed to execute buy for %s after %s attempts", token_address, max_retries)
+    return None
+
+def finalize_buy(tx_receipt, ctx, is_test=False):
+    """Record a mined buy: transaction history and portfolio on success, blacklist on revert
+    
+    Args:
+        tx_receipt: Transaction receipt
+        ctx: Buy context from submit_buy
+        is_test: Whether this is a test buy (for honeypot check)
+        
+    Returns:
+        dict: Transaction result
+    """
+    token_address = ctx['token_address']
+    token_symbol = ctx['token_symbol']
+    token_decimals = ctx['token_decimals']
+    bnb_amount = ctx['bnb_amount']
+    tx_hash_hex = ctx['tx_hash'].hex()
+    
+    if tx_receipt['status'] == 1:
+        logger.info("Buy transaction successful: %s", tx_hash_hex)
+        
+        # Get token balance after purchase
+        token_balance = get_token_contract(token_address).functions.balanceOf(
+            config.WALLET_ADDRESS
+        ).call()
+        # Convert to token units once
+        tokens_readable = token_balance / (10 ** token_decimals)
+        
+        # Record transaction
+        transaction_type = "test_buy" if is_test else "buy"
+        record_transaction(
+            token_address,
+            token_symbol,
+            transaction_type,
+            tokens_readable,
+            bnb_amount,
+            tx_hash_hex
+        )
+        
+        # Add to portfolio if not a test buy
+        if not is_test:
+            token_price = bnb_amount / tokens_readable
+            
+            add_to_portfolio(
+                token_address,
+                token_symbol,
+                tokens_readable,
+                token_price,
+                bnb_amount,
+                config.TAKE_PROFIT_PERCENTAGE,
+                config.STOP_LOSS_PERCENTAGE,
+                token_decimals=token_decimals
+            )
+        
+        return {
+            "status": "success",
+            "tx_hash": tx_hash_hex,
+            "token_balance": tokens_readable,
+            "bnb_spent": bnb_amount
+        }
+    else:
+        logger.error("Buy transaction failed: %s", tx_hash_hex)
+        
+        # Add to blacklist if regular buy fails
+        if not is_test:
+            add_to_blacklist(token_address, token_symbol, "Buy transaction failed")
+            
+        return {
+            "status": "failed",
+            "tx_hash": tx_hash_hex
+        }
+
+def _confirm_buys():
+    """Worker loop: poll the receipts of submitted buys with exponential backoff and finalize them"""
+    pending = []
+    
+    while True:
+        # Sleep until a buy is submitted or the earliest poll is due
+        timeout = max(0, min(entry['next_poll'] for entry in pending) - time.monotonic()) if pending else None
+        try:
+            ctx, future, is_test = _pending_buys.get(timeout=timeout)
+            now = time.monotonic()
+            pending.append({
+                'ctx': ctx, 'future': future, 'is_test': is_test,
+                'polls': 0, 'next_poll': now + 1, 'deadline': now + RECEIPT_TIMEOUT
+            })
+            continue
+        except queue.Empty:
+            pass
+            
+        w3 = Web3Singleton.get_instance()
+        now = time.monotonic()
+        still_pending = []
+        
+        for entry in pending:
+            if entry['next_poll'] > now:
+                still_pending.append(entry)
+                continue
+                
+            tx_hash_hex = entry['ctx']['tx_hash'].hex()
+            try:
+                tx_receipt = w3.eth.get_transaction_receipt(entry['ctx']['tx_hash'])
+            except TransactionNotFound:
+                tx_receipt = None
+            except Exception as e:
+                logger.warning("Error polling receipt of %s: %s", tx_hash_hex, e)
+                tx_receipt = None
+                
+            if tx_receipt is not None:
+                try:
+                    entry['future'].set_result(finalize_buy(tx_receipt, entry['ctx'], entry['is_test']))
+                except Exception as e:
+                    logger.error("Error finalizing buy %s: %s", tx_hash_hex, e)
+                    entry['future'].set_result(None)
+            elif now >= entry['deadline']:
+                # Not retried: the transaction may still be mined, and a resend would buy twice
+                logger.error("Buy transaction %s not mined after %s seconds, no longer tracking it", tx_hash_hex, RECEIPT_TIMEOUT)
+                WALLET_NONCES.resync()
+                entry['future'].set_result(None)
+            else:
+                entry['polls'] += 1
+                entry['next_poll'] = now + min(2 ** entry['polls'], RECEIPT_POLL_MAX_DELAY)
+                still_pending.append(entry)
+                
+        pending = still_pending
+
+def _ensure_confirmation_worker():
+    """Start the receipt polling thread on first use"""
+    global _confirmation_worker
+    
+    with _worker_lock:
+        if _confirmation_worker is None or not _confirmation_worker.is_alive():
+            _confirmation_worker = threading.Thread(target=_confirm_buys, name="buy-confirmations", daemon=True)
+            _confirmation_worker.start()
+
+def execute_buy(token_address, bnb_amount, is_test=False, max_retries=3):
+    """Execute a buy transaction, returning as soon as it is sent
+    
+    The receipt is polled by a background worker, which records the buy once it is mined.
+    
+    Args:
+        token_address: Token address to buy
+        bnb_amount: Amount of BNB to spend
+        is_test: Whether this is a test buy (for honeypot check)
+        max_retries: Maximum number of retry attempts
+        
+    Returns:
+        dict: Pending result (status, tx_hash, bnb_spent, and a confirmation Future resolving
+        to the finalize_buy result, or None if not mined in time) or None if sending failed
+    """
+    ctx = submit_buy(token_address, bnb_amount, is_test, max_retries)
+    if not ctx:
+        return None
+        
+    confirmation = Future()
+    _pending_buys.put((ctx, confirmation, is_test))
+    _ensure_confirmation_worker()
+    
+    return {
+        "status": "pending",
+        "tx_hash": ctx['tx_hash'].hex(),
+        "bnb_spent": bnb_amount,
+        "confirmation": confirmation
+    }
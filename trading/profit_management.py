@@ -1,12 +1,42 @@
 """
 Profit management and exit strategy functions
 """
-from datetime import datetime, timedelta
+import time
+from bisect import bisect_right
+from datetime import datetime
 
 from utils.logging_setup import logger
-from trading.sell import execute_sell, estimate_bnb_output
+from utils.ttl_cache import TTLCache
+from database.operations import count_failed_sells
+from security.token_checks import check_for_transfer_tax
+from trading.sell import execute_sell, estimate_bnb_output, batch_estimate_bnb_output
 import config
 
+# Tiered profit taking: (minimum profit percentage, fraction of the position sold)
+TAKE_PROFIT_TIERS = (
+    (100, 0.75),
+    (50, 0.5),
+    (config.TAKE_PROFIT_PERCENTAGE, 0.25)  # Regular take profit
+)
+# The same tiers by ascending threshold, for bisect
+_TIER_THRESHOLDS = [threshold for threshold, _ in sorted(TAKE_PROFIT_TIERS)]
+_TIER_FRACTIONS = [fraction for _, fraction in sorted(TAKE_PROFIT_TIERS)]
+
+# calculate_optimal_slippage results by (token_address, base_slippage)
+_SLIPPAGE_CACHE = TTLCache(maxsize=1024, ttl=60)
+
+def take_profit_fraction(profit_percentage):
+    """Fraction of a position to sell at a profit percentage (the highest tier reached)
+
+    Args:
+        profit_percentage: Current profit percentage
+
+    Returns:
+        float: Fraction to sell, or None below the lowest tier
+    """
+    tier = bisect_right(_TIER_THRESHOLDS, profit_percentage) - 1
+    return _TIER_FRACTIONS[tier] if tier >= 0 else None
+
 def calculate_optimal_slippage(token_address, token_symbol, base_slippage=config.SLIPPAGE):
     """
     Calculate optimal slippage based on token characteristics
@@ -19,37 +49,35 @@ def calculate_optimal_slippage(token_address, token_symbol, base_slippage=config
     Returns:
         float: Optimal slippage percentage
     """
-    try:
-        # Check token history for sell failures
-        from database.operations import get_token_transaction_history
-        
-        history = get_token_transaction_history(token_address)
+    cache_key = (token_address, base_slippage)
+    cached = _SLIPPAGE_CACHE.get(cache_key)
+    if cached is not None:
+        return cached
         
-        if not history:
+    try:
+        # Count failed sells in SQL instead of loading the token's history
+        failed_sells = count_failed_sells(token_address)
+        if failed_sells is None:
             return base_slippage
-            
-        # Count failed sells
-        failed_sells = sum(1 for tx in history 
-                         if tx['transaction_type'] == 'sell' and tx['status'] == 'failed')
         
         # Increase slippage based on failure rate
         if failed_sells > 5:
             # High failure rate, use more aggressive slippage
-            return min(base_slippage * 2, 49.9)  # Max 49.9% to avoid frontend limits
+            slippage = min(base_slippage * 2, 49.9)  # Max 49.9% to avoid frontend limits
         elif failed_sells > 2:
             # Medium failure rate
-            return min(base_slippage * 1.5, 49.9)
-            
-        # Check if token has transfer tax
-        has_tax = check_for_transfer_tax(token_address, token_symbol)
-        if has_tax:
+            slippage = min(base_slippage * 1.5, 49.9)
+        elif check_for_transfer_tax(token_address, token_symbol):
             # Add extra slippage for tokens with tax
-            return min(base_slippage + 10, 49.9)
+            slippage = min(base_slippage + 10, 49.9)
+        else:
+            slippage = base_slippage
             
-        return base_slippage
+        _SLIPPAGE_CACHE.set(cache_key, slippage)
+        return slippage
         
     except Exception as e:
-        logger.error(f"Error calculating optimal slippage: {e}")
+        logger.error("Error calculating optimal slippage: %s", e)
         return base_slippage
 
 def calculate_profit_percentage(current_value, investment_amount):
@@ -102,7 +130,7 @@ def should_take_profit(current_value, investment_amount, take_profit_target):
     profit_percentage = calculate_profit_percentage(current_value, investment_amount)
     
     if profit_percentage >= take_profit_target:
-        logger.info(f"Take profit triggered: {profit_percentage:.2f}% profit (target: {take_profit_target}%)")
+        logger.info("Take profit triggered: %.2f%% profit (target: %s%%)", profit_percentage, take_profit_target)
         return True
         
     return False
@@ -125,7 +153,7 @@ def should_stop_loss(current_value, investment_amount, stop_loss_target):
     loss_percentage = calculate_loss_percentage(current_value, investment_amount)
     
     if loss_percentage >= stop_loss_target:
-        logger.info(f"Stop loss triggered: {loss_percentage:.2f}% loss (target: {stop_loss_target}%)")
+        logger.info("Stop loss triggered: %.2f%% loss (target: %s%%)", loss_percentage, stop_loss_target)
         return True
         
     return False
@@ -135,23 +163,22 @@ def should_sell_by_time(purchase_time, max_holding_time):
     Check if we should sell based on holding time
     
     Args:
-        purchase_time: Purchase time as string or datetime
+        purchase_time: Purchase time as epoch seconds, string or datetime
         max_holding_time: Maximum holding time in hours
         
     Returns:
         bool: True if should sell, False otherwise
     """
-    if isinstance(purchase_time, str):
-        purchase_datetime = datetime.strptime(purchase_time, '%Y-%m-%d %H:%M:%S')
+    if isinstance(purchase_time, (int, float)):
+        seconds_held = time.time() - purchase_time
     else:
-        purchase_datetime = purchase_time
-        
-    time_held = datetime.now() - purchase_datetime
-    max_holding_timedelta = timedelta(hours=max_holding_time)
+        if isinstance(purchase_time, str):
+            purchase_time = datetime.strptime(purchase_time, '%Y-%m-%d %H:%M:%S')
+        seconds_held = (datetime.now() - purchase_time).total_seconds()
     
-    if time_held >= max_holding_timedelta:
-        hours_held = time_held.total_seconds() / 3600
-        logger.info(f"Time-based sell triggered: Held for {hours_held:.2f} hours (max: {max_holding_time} hours)")
+    if seconds_held >= max_holding_time * 3600:
+        hours_held = seconds_held / 3600
+        logger.info("Time-based sell triggered: Held for %.2f hours (max: %s hours)", hours_held, max_holding_time)
         return True
         
     return False
@@ -179,20 +206,53 @@ def implement_trailing_stop_loss(token_address, token_symbol, token_decimals, am
     # Update highest value if current value is higher
     if current_value > highest_value:
         highest_value = current_value
-        logger.info(f"New high for {token_symbol}: {highest_value} BNB")
+        logger.info("New high for %s: %s BNB", token_symbol, highest_value)
         return False, highest_value
         
     # Calculate decline from highest value as a percentage
     decline_percentage = ((highest_value - current_value) / highest_value) * 100
     
     if decline_percentage >= trailing_percentage:
-        logger.info(f"Trailing stop loss triggered for {token_symbol}: Declined {decline_percentage:.2f}% from high of {highest_value} BNB")
+        logger.info("Trailing stop loss triggered for %s: Declined %.2f%% from high of %s BNB", token_symbol, decline_percentage, highest_value)
         return True, highest_value
         
     return False, highest_value
 
+def execute_take_profit_strategies(positions):
+    """Run the take profit strategy for several positions, quoting them all in one eth_call
+    
+    Args:
+        positions: Dicts with token_address, token_symbol, token_decimals, amount_tokens,
+            investment_amount and portfolio_id
+            
+    Returns:
+        list: execute_take_profit_strategy result per position, in order
+    """
+    try:
+        current_values = batch_estimate_bnb_output([
+            (position['token_address'], position['amount_tokens'], position['token_decimals'])
+            for position in positions
+        ])
+    except Exception as e:
+        # Each strategy quotes its own position instead
+        logger.warning("Batched quotes failed, falling back to per-token quotes: %s", e)
+        current_values = [None] * len(positions)
+        
+    return [
+        execute_take_profit_strategy(
+            position['token_address'],
+            position['token_symbol'],
+            position['token_decimals'],
+            position['amount_tokens'],
+            position['investment_amount'],
+            position['portfolio_id'],
+            current_value=current_value
+        )
+        for position, current_value in zip(positions, current_values)
+    ]
+
 def execute_take_profit_strategy(token_address, token_symbol, token_decimals, 
-                               amount_tokens, investment_amount, portfolio_id):
+                               amount_tokens, investment_amount, portfolio_id, current_value=None):
     """
     Execute take profit strategy with tiered selling
     
@@ -203,38 +263,31 @@ def execute_take_profit_strategy(token_address, token_symbol, token_decimals,
         amount_tokens: Amount of tokens
         investment_amount: Original investment in BNB
         portfolio_id: Portfolio entry ID
+        current_value: Current value in BNB, if already quoted (e.g. by batch_estimate_bnb_output)
         
     Returns:
         dict: Result of the operation
     """
     try:
         # Current value of total position
-        current_value = estimate_bnb_output(token_address, amount_tokens, token_decimals)
+        if current_value is None:
+            current_value = estimate_bnb_output(token_address, amount_tokens, token_decimals)
         
         if current_value is None:
-            logger.warning(f"Failed to estimate current value for {token_symbol}")
+            logger.warning("Failed to estimate current value for %s", token_symbol)
             return {"status": "failed", "reason": "Failed to estimate current value"}
             
         profit_percentage = calculate_profit_percentage(current_value, investment_amount)
         
-        # Define tiered profit-taking strategy
-        # This is a simple example - modify based on your strategy
-        if profit_percentage >= 100:  # 100% profit or more
-            # Sell 75% of tokens
-            sell_amount = amount_tokens * 0.75
-            logger.info(f"Taking partial profit (75%) for {token_symbol} at {profit_percentage:.2f}% profit")
-        elif profit_percentage >= 50:  # 50-100% profit
-            # Sell 50% of tokens
-            sell_amount = amount_tokens * 0.5
-            logger.info(f"Taking partial profit (50%) for {token_symbol} at {profit_percentage:.2f}% profit")
-        elif profit_percentage >= config.TAKE_PROFIT_PERCENTAGE:  # Regular take profit
-            # Sell 25% of tokens
-            sell_amount = amount_tokens * 0.25
-            logger.info(f"Taking partial profit (25%) for {token_symbol} at {profit_percentage:.2f}% profit")
-        else:
+        # Tiered profit-taking strategy (see TAKE_PROFIT_TIERS)
+        fraction = take_profit_fraction(profit_percentage)
+        if fraction is None:
             # No profit taking yet
             return {"status": "skipped", "reason": "Profit threshold not met"}
             
+        sell_amount = amount_tokens * fraction
+        logger.info("Taking partial profit (%.0f%%) for %s at %.2f%% profit", fraction*100, token_symbol, profit_percentage)
+            
         # Execute sell
         sell_result = execute_sell(
             token_address,
@@ -245,7 +298,7 @@ def execute_take_profit_strategy(token_address, token_symbol, token_decimals,
         )
         
         if sell_result and sell_result['status'] == 'success':
-            logger.info(f"Partial profit taking successful for {token_symbol}: {sell_result['bnb_received']} BNB")
+            logger.info("Partial profit taking successful for %s: %s BNB", token_symbol, sell_result['bnb_received'])
             return {
                 "status": "success",
                 "profit_percentage": profit_percentage,
@@ -253,9 +306,9 @@ def execute_take_profit_strategy(token_address, token_symbol, token_decimals,
                 "bnb_received": sell_result['bnb_received']
             }
         else:
-            logger.error(f"Failed to take profit for {token_symbol}")
+            logger.error("Failed to take profit for %s", token_symbol)
             return {"status": "failed", "reason": "Sell execution failed"}
             
     except Exception as e:
-        logger.error(f"Error in execute_take_profit_strategy: {e}")
+        logger.error("Error in execute_take_profit_strategy: %s", e)
         return {"status": "failed", "reason": str(e)}
\ No newline at end of file
@@ -1,15 +1,172 @@
+import random
 import time
-from web3.exceptions import TimeExhausted, BadFunctionCallOutput, TransactionNotFound
+from web3.exceptions import TimeExhausted, BadFunctionCallOutput, TransactionNotFound, Web3RPCError
 from datetime import datetime, timedelta
 from utils.logging_setup import logger
 from utils.web3_singleton import Web3Singleton
+from utils.nonce_manager import WALLET_NONCES
+from utils.retry import rpc_backoff_delay
+from utils.gas_tracker import GAS_TRACKER
+from utils.ttl_cache import TTLCache
 from contracts.interfaces import get_router_contract, get_token_contract
-from database.operations import record_transaction, update_portfolio_status
+from contracts.multicall import multicall, call_concurrently
+from database.operations import record_transaction, update_portfolio_status, record_failed_transaction
+try:
+    from database.operations import add_to_sell_queue
+except ImportError:
+    # No sell queue in this database: gradual selling is skipped
+    add_to_sell_queue = None
 import config
 from web3 import Web3
+from eth_abi import encode
+from eth_utils import function_signature_to_4byte_selector
 
-def estimate_bnb_output(token_address, token_amount, token_decimals, max_retries=3):
-    """Estimate BNB output for a given token amount"""
+# Recent router quotes keyed by (token_address, token_amount, token_decimals)
+QUOTE_CACHE = TTLCache(maxsize=1024, ttl=config.QUOTE_TTL_SECONDS)
+
+MAX_UINT256 = (1 << 256) - 1
+
+# Gradual selling of a token that can't be sold at once: share of the amount and delay of each step
+SELL_SCHEDULE = (
+    {"percent": 5, "delay_minutes": 5},    # Try 5% after 5 minutes
+    {"percent": 10, "delay_minutes": 15},  # Try 10% after 15 minutes
+    {"percent": 15, "delay_minutes": 30},  # Try 15% after 30 minutes
+    {"percent": 20, "delay_minutes": 60},  # Try 20% after 1 hour
+    {"percent": 50, "delay_minutes": 120}  # Try 50% after 2 hours
+)
+
+# Sells are encoded directly from the fixed router signature instead of through build_transaction
+_SELL_SELECTOR = function_signature_to_4byte_selector(
+    'swapExactTokensForETHSupportingFeeOnTransferTokens(uint256,uint256,address[],address,uint256)'
+)
+_SELL_ARG_TYPES = ('uint256', 'uint256', 'address[]', 'address', 'uint256')
+# approve(router, max) never changes
+_APPROVE_ROUTER_CALLDATA = function_signature_to_4byte_selector('approve(address,uint256)') + encode(
+    ('address', 'uint256'), (config.PANCAKE_ROUTER_ADDRESS, MAX_UINT256)
+)
+
+# Sell receipts: first poll after half a BSC block, then every second, for up to two minutes
+RECEIPT_FIRST_POLL_DELAY = 1.5
+RECEIPT_POLL_INTERVAL = 1
+RECEIPT_TIMEOUT = 120
+# With the newHeads subscription up, receipts are polled on each block; a missed head waits at most this long
+RECEIPT_BLOCK_WAIT = 4
+# After an approval is mined, its allowance is read back up to this many times, this far apart (seconds)
+APPROVAL_READBACK_ATTEMPTS = 10
+APPROVAL_READBACK_INTERVAL = 0.2
+
+# Waits between sell attempts (seconds, per attempt), by the kind of the last failure:
+# gas failures retry at once with a higher limit, price impact needs the pool to move,
+# restricted tokens get a few blocks before the gradual sell queue takes over, and any
+# other error waits up to about a block so the retry doesn't hammer the endpoint
+SELL_RETRY_BACKOFF = {
+    'OUT_OF_GAS': (0.2, 0.5, 1.0),
+    'PRICE_IMPACT': (2.0, 5.0, 10.0),
+    'ALWAYS_FAILING': (6.0, 12.0, 24.0),
+    'TIMEOUT': (2.0, 4.0, 8.0),
+    'DEFAULT': (0.5, 1.5, 3.0),
+}
+
+# Keywords of sell failure reasons (lowercase substring -> tag)
+_FAILURE_KEYWORDS = (
+    ('gas', 'GAS'),
+    ('exceed', 'EXCEEDED'),
+    ('price impact', 'PRICE_IMPACT'),
+    ('slippage', 'SLIPPAGE'),
+    ('insufficient_output', 'INSUFFICIENT_OUTPUT'),
+)
+# Markers execute_sell appends for reverting sells, tagged as themselves
+_REVERT_MARKERS = frozenset({'ALWAYS_FAILING', 'EXECUTION_REVERTED'})
+_GAS_TAGS = frozenset({'GAS', 'EXCEEDED'})
+_PRICE_TAGS = frozenset({'PRICE_IMPACT', 'SLIPPAGE', 'INSUFFICIENT_OUTPUT'})
+
+def _failure_tags(reason):
+    """Canonical tags of one sell failure reason, lowercased and scanned once"""
+    if reason in _REVERT_MARKERS:
+        return {reason}
+    lowered = reason.lower()
+    return {tag for keyword, tag in _FAILURE_KEYWORDS if keyword in lowered}
+
+def _sell_failure_kind(failure_reasons, timed_out=False):
+    """Classify the last sell failure into a SELL_RETRY_BACKOFF key"""
+    tags = _failure_tags(failure_reasons[-1]) if failure_reasons else set()
+    if tags & _REVERT_MARKERS:
+        return 'ALWAYS_FAILING'
+    if tags & _GAS_TAGS:
+        return 'OUT_OF_GAS'
+    if tags & _PRICE_TAGS:
+        return 'PRICE_IMPACT'
+    return 'TIMEOUT' if timed_out else 'DEFAULT'
+
+def _sell_retry_delay(failure_kind, attempt):
+    """Wait before the next sell attempt, jittered so sells that failed together don't retry together"""
+    delays = SELL_RETRY_BACKOFF[failure_kind]
+    return delays[min(attempt, len(delays) - 1)] * random.uniform(0.75, 1.25)
+
+def _sell_calldata(token_address, amount_tokens_wei, min_bnb, deadline):
+    """Calldata of swapExactTokensForETHSupportingFeeOnTransferTokens selling a token for BNB to the wallet"""
+    return _SELL_SELECTOR + encode(
+        _SELL_ARG_TYPES,
+        (amount_tokens_wei, min_bnb, [token_address, config.WBNB_ADDRESS], config.WALLET_ADDRESS, deadline)
+    )
+
+def _wait_for_receipt(w3, tx_hash, timeout=RECEIPT_TIMEOUT):
+    """Wait for a transaction receipt, polling at the pace BSC produces blocks
+    
+    While GAS_TRACKER's newHeads subscription is live, the receipt is polled once
+    per new block instead of on a timer.
+    
+    Args:
+        w3: Web3 instance the transaction was sent through
+        tx_hash: Transaction hash
+        timeout: Maximum wait (seconds)
+        
+    Returns:
+        AttributeDict: Transaction receipt
+        
+    Raises:
+        TimeExhausted: If the transaction isn't mined within timeout
+    """
+    deadline = time.monotonic() + timeout
+    delay = RECEIPT_FIRST_POLL_DELAY
+    while True:
+        remaining = max(0, deadline - time.monotonic())
+        if GAS_TRACKER.is_live():
+            GAS_TRACKER.wait_for_block(min(RECEIPT_BLOCK_WAIT, remaining))
+        else:
+            time.sleep(min(delay, remaining))
+        try:
+            return w3.eth.get_transaction_receipt(tx_hash)
+        except TransactionNotFound:
+            pass
+        if time.monotonic() >= deadline:
+            raise TimeExhausted(f"Transaction {tx_hash.hex()} is not in the chain after {timeout} seconds")
+        delay = RECEIPT_POLL_INTERVAL
+
+def _read_for_sell(contract_functions):
+    """Read the pre-sell state in one multicall, or in parallel eth_calls if Multicall3 fails"""
+    try:
+        return multicall(contract_functions)
+    except Exception as e:
+        logger.warning("Multicall failed, reading %s values in parallel: %s", len(contract_functions), e)
+        return call_concurrently(contract_functions)
+
+def invalidate_quotes(token_address):
+    """Drop cached quotes for a token, e.g. after selling it"""
+    QUOTE_CACHE.discard_where(lambda key: key[0] == token_address)
+
+def estimate_bnb_output(token_address, token_amount, token_decimals, max_retries=3, use_cache=True):
+    """Estimate BNB output for a given token amount
+    
+    Quotes are reused for QUOTE_TTL_SECONDS unless use_cache is False
+    (sells price their minimum output from a fresh quote).
+    """
+    cache_key = (token_address, token_amount, token_decimals)
+    if use_cache:
+        cached = QUOTE_CACHE.get(cache_key)
+        if cached is not None:
+            return cached
+            
     for attempt in range(max_retries):
         try:
             w3 = Web3Singleton.get_instance()
@@ -17,26 +174,74 @@ def estimate_bnb_output(token_address, token_amount, token_decimals, max_retries
             
             token_amount_wei = int(token_amount * (10 ** token_decimals))
             
-            amount_out = router_contract.functions.getAmountsOut(
+            # A quote from any recent block will do, so the fastest endpoints are raced
+            amount_out = multicall([router_contract.functions.getAmountsOut(
                 token_amount_wei,
                 [token_address, config.WBNB_ADDRESS]
-            ).call()
+            )], race=True)[0]
+            if amount_out is None:
+                raise ValueError(f"getAmountsOut reverted for {token_address}")
             
             bnb_output = w3.from_wei(amount_out[1], 'ether')
             
-            logger.info(f"Estimated BNB output for {token_amount} tokens: {bnb_output} BNB")
+            logger.info("Estimated BNB output for %s tokens: %s BNB", token_amount, bnb_output)
+            QUOTE_CACHE.set(cache_key, float(bnb_output))
             return float(bnb_output)
         except Exception as e:
-            logger.error(f"Error estimating BNB output (attempt {attempt+1}/{max_retries}): {e}")
+            logger.error("Error estimating BNB output (attempt %s/%s): %s", attempt+1, max_retries, e)
+            Web3Singleton.reconnect_on_transport_error(e)
             
         if attempt < max_retries - 1:
-            backoff_time = config.RETRY_DELAY_BASE * (attempt + 1)
-            logger.info(f"Retrying BNB output estimation in {backoff_time} seconds...")
+            backoff_time = rpc_backoff_delay(attempt)
+            logger.info("Retrying BNB output estimation in %.2f seconds...", backoff_time)
             time.sleep(backoff_time)
     
-    logger.error(f"Failed to estimate BNB output for {token_address} after {max_retries} attempts")
+    logger.error("Failed to estimate BNB output for %s after %s attempts", token_address, max_retries)
     return None
 
+def batch_estimate_bnb_output(entries, use_cache=True):
+    """Estimate the BNB output of several token amounts with one Multicall3 eth_call
+    
+    Args:
+        entries: (token_address, token_amount, token_decimals) tuples
+        use_cache: Reuse quotes younger than QUOTE_TTL_SECONDS (like estimate_bnb_output)
+        
+    Returns:
+        list: Estimated BNB output per entry, in order (None where the quote reverted)
+        
+    Raises:
+        Exception: If the multicall fails
+    """
+    w3 = Web3Singleton.get_instance()
+    router_contract = get_router_contract()
+    
+    results = [None] * len(entries)
+    missing = []
+    for index, cache_key in enumerate(entries):
+        cached = QUOTE_CACHE.get(cache_key) if use_cache else None
+        if cached is not None:
+            results[index] = cached
+        else:
+            missing.append(index)
+            
+    amounts_out = multicall([
+        router_contract.functions.getAmountsOut(
+            int(entries[index][1] * (10 ** entries[index][2])),
+            [entries[index][0], config.WBNB_ADDRESS]
+        )
+        for index in missing
+    ], race=True)
+    for index, amount_out in zip(missing, amounts_out):
+        if amount_out is None:
+            logger.warning("Quote reverted for %s", entries[index][0])
+            continue
+        bnb_output = float(w3.from_wei(amount_out[1], 'ether'))
+        QUOTE_CACHE.set(entries[index], bnb_output)
+        results[index] = bnb_output
+        
+    logger.info("Estimated BNB output of %s positions (%s quoted in one multicall)", len(entries), len(missing))
+    return results
+
 def queue_token_for_gradual_selling(token_address, token_symbol, token_decimals, total_amount):
     """
     Queue a token for gradual selling over time
@@ -50,21 +255,13 @@ def queue_token_for_gradual_selling(token_address, token_symbol, token_decimals,
     Returns:
         bool: True if queued successfully, False otherwise
     """
-    try:
-        # Create a queue entry in the database
-        from database.operations import add_to_sell_queue
-        
-        # Calculate sell amounts: Start with 5% and gradually increase
-        sell_schedule = [
-            {"percent": 5, "delay_minutes": 5},   # Try 5% after 5 minutes
-            {"percent": 10, "delay_minutes": 15}, # Try 10% after 15 minutes
-            {"percent": 15, "delay_minutes": 30}, # Try 15% after 30 minutes
-            {"percent": 20, "delay_minutes": 60}, # Try 20% after 1 hour
-            {"percent": 50, "delay_minutes": 120} # Try 50% after 2 hours
-        ]
+    if add_to_sell_queue is None:
+        logger.warning("Failed to queue token for gradual selling: add_to_sell_queue function not available")
+        return False
         
-        # Add each scheduled sell to the queue
-        for schedule in sell_schedule:
+    try:
+        # Add each scheduled sell to the queue, starting with 5% and gradually increasing
+        for schedule in SELL_SCHEDULE:
             sell_amount = total_amount * (schedule["percent"] / 100)
             scheduled_time = datetime.now() + timedelta(minutes=schedule["delay_minutes"])
             
@@ -76,31 +273,47 @@ def queue_token_for_gradual_selling(token_address, token_symbol, token_decimals,
                 scheduled_time
             )
             
-        logger.info(f"Queued {token_symbol} for gradual selling over time")
+        logger.info("Queued %s for gradual selling over time", token_symbol)
         return True
     
     except Exception as e:
-        logger.error(f"Error queuing token for gradual selling: {e}")
+        logger.error("Error queuing token for gradual selling: %s", e)
         return False
 
-def decode_revert_reason(transaction_hash):
-    """Attempt to decode revert reason from failed transaction"""
+def decode_revert_reason(transaction_hash, tx_receipt=None, tx=None):
+    """Attempt to decode revert reason from failed transaction
+    
+    Args:
+        transaction_hash: Hash of the reverted transaction
+        tx_receipt: Its receipt if already fetched (some nodes include the revertReason)
+        tx: The transaction dict as signed, so it can be replayed without fetching it back
+        
+    Returns:
+        str: Revert reason, "Unknown reason" or "Could not decode"
+    """
     try:
+        if tx_receipt is not None and tx_receipt.get('revertReason'):
+            return tx_receipt['revertReason']
+            
         w3 = Web3Singleton.get_instance()
-        tx = w3.eth.get_transaction(transaction_hash)
+        if tx is not None and tx_receipt is not None:
+            call = {key: tx[key] for key in ('to', 'from', 'data', 'value', 'gas', 'gasPrice')}
+            block_number = tx_receipt['blockNumber']
+        else:
+            fetched = w3.eth.get_transaction(transaction_hash)
+            call = {
+                'to': fetched['to'],
+                'from': fetched['from'],
+                'data': fetched['input'],
+                'value': fetched['value'],
+                'gas': fetched['gas'],
+                'gasPrice': fetched['gasPrice'],
+            }
+            block_number = fetched['blockNumber']
+            
         # Try to replay the transaction to get the revert reason
         try:
-            w3.eth.call(
-                {
-                    'to': tx['to'],
-                    'from': tx['from'],
-                    'data': tx['input'],
-                    'value': tx['value'],
-                    'gas': tx['gas'],
-                    'gasPrice': tx['gasPrice'],
-                },
-                tx['blockNumber'] - 1
-            )
+            w3.eth.call(call, block_number - 1)
         except Exception as e:
             error_msg = str(e)
             # Extract revert reason
@@ -108,81 +321,142 @@ def decode_revert_reason(transaction_hash):
                 return error_msg
         return "Unknown reason"
     except Exception as e:
-        logger.error(f"Error decoding revert reason: {e}")
+        logger.error("Error decoding revert reason: %s", e)
         return "Could not decode"
 
+def _record_successful_sell(token_address, token_symbol, amount_tokens, estimated_bnb, tx_hash_hex, portfolio_id=None, is_test=False):
+    """Record a mined sell and build its execute_sell result"""
+    # Calculate profit/loss if not a test sell
+    profit_loss_bnb = None
+    if not is_test and portfolio_id is not None:
+        # TODO: Calculate profit/loss based on portfolio entry
+        pass
+    
+    # Record transaction
+    transaction_type = "test_sell" if is_test else "sell"
+    record_transaction(
+        token_address,
+        token_symbol,
+        transaction_type,
+        amount_tokens,
+        estimated_bnb,
+        tx_hash_hex,
+        profit_loss_bnb
+    )
+    
+    # Update portfolio status if not a test sell
+    if not is_test and portfolio_id is not None:
+        update_portfolio_status(portfolio_id, "sold")
+        
+    # Quotes for the old position size are meaningless now
+    invalidate_quotes(token_address)
+    
+    return {
+        "status": "success",
+        "tx_hash": tx_hash_hex,
+        "tokens_sold": amount_tokens,
+        "bnb_received": estimated_bnb
+    }
+
 def execute_sell(token_address, token_symbol, token_decimals, amount_tokens=None, portfolio_id=None, is_test=False, max_retries=3):
     """Execute a sell transaction"""
     # Keep track of failure reasons to adapt strategy
     failure_reasons = []
+    # Tags of every reason so far, so retries check them without rescanning the strings
+    failure_flags = set()
+    
+    def note_failure(reason):
+        failure_reasons.append(reason)
+        failure_flags.update(_failure_tags(reason))
+    # Wei per token, the same for every attempt
+    scale = 10 ** token_decimals
+    # The amount is kept in wei from here on (amount_tokens is only derived for logs and records),
+    # so a retry never asks for more than the balance through float rounding
+    amount_tokens_wei = None if amount_tokens is None else int(amount_tokens * scale)
     
     for attempt in range(max_retries):
+        nonce_allocated = False
+        # Allocated nonce not yet accepted by the node, if any
+        unsent_nonce = None
+        timed_out = False
         try:
             w3 = Web3Singleton.get_instance()
             router_contract = get_router_contract()
             token_contract = get_token_contract(token_address)
             
             if not token_contract:
-                logger.error(f"Failed to get token contract for {token_address}")
+                logger.error("Failed to get token contract for %s", token_address)
                 return None
                 
-            # Get current token balance if amount not specified
-            if amount_tokens is None:
-                amount_tokens_wei = token_contract.functions.balanceOf(
-                    config.WALLET_ADDRESS
-                ).call()
-                amount_tokens = amount_tokens_wei / (10 ** token_decimals)
-                logger.info(f"Selling all tokens: {amount_tokens} {token_symbol}")
+            allowance_call = token_contract.functions.allowance(
+                config.WALLET_ADDRESS,
+                config.PANCAKE_ROUTER_ADDRESS
+            )
+            
+            # Get current token balance if amount not specified, with the router allowance in the same eth_call
+            if amount_tokens_wei is None:
+                amount_tokens_wei, allowance = _read_for_sell([
+                    token_contract.functions.balanceOf(config.WALLET_ADDRESS),
+                    allowance_call
+                ])
+                if amount_tokens_wei is None or allowance is None:
+                    amount_tokens_wei = None
+                    raise ValueError(f"balanceOf/allowance reverted for {token_symbol}")
+                amount_tokens = amount_tokens_wei / scale
+                # Quoted once the balance is known
+                amounts_out = None
+                logger.info("Selling all tokens: %s %s", amount_tokens, token_symbol)
             else:
                 # More aggressive reduction strategy based on prior failures
                 if attempt > 0:
                     # If we've seen 'OUT_OF_GAS' or 'EXCEEDED_MAXIMUM' errors, reduce more aggressively
-                    if any('gas' in reason.lower() for reason in failure_reasons) or any('exceed' in reason.lower() for reason in failure_reasons):
-                        reduction_factor = 0.5 ** attempt  # 50% reduction each time
+                    if failure_flags & _GAS_TAGS:
+                        numerator, denominator = 1, 2  # 50% reduction each time
                     else:
-                        reduction_factor = 0.8 ** attempt  # Normal 20% reduction
+                        numerator, denominator = 4, 5  # Normal 20% reduction
                         
-                    original_amount = amount_tokens
-                    amount_tokens = original_amount * reduction_factor
-                    logger.info(f"Retry {attempt}: Reduced sell amount to {amount_tokens:.4f} {token_symbol} ({reduction_factor*100:.0f}% of original)")
+                    amount_tokens_wei = amount_tokens_wei * numerator ** attempt // denominator ** attempt
+                    amount_tokens = amount_tokens_wei / scale
+                    logger.info("Retry %s: Reduced sell amount to %.4f %s (%.0f%% of original)", attempt, amount_tokens,
+                                token_symbol, 100 * numerator ** attempt / denominator ** attempt)
                 
-                # Convert provided amount to wei equivalent
-                amount_tokens_wei = int(amount_tokens * (10 ** token_decimals))
+                # Router allowance and a fresh quote in one eth_call
+                allowance, amounts_out = _read_for_sell([
+                    allowance_call,
+                    router_contract.functions.getAmountsOut(amount_tokens_wei, [token_address, config.WBNB_ADDRESS])
+                ])
+                if allowance is None:
+                    raise ValueError(f"allowance reverted for {token_symbol}")
             
             # Add a check for minimum sell amount to avoid dust
             minimum_sell_amount_wei = 1000  # Very small amount to avoid dust sells
             if amount_tokens_wei < minimum_sell_amount_wei:
-                logger.warning(f"Sell amount {amount_tokens} for {token_symbol} is too small, skipping")
+                logger.warning("Sell amount %s for %s is too small, skipping", amount_tokens, token_symbol)
                 return {
                     "status": "skipped",
                     "reason": "Amount too small"
                 }
             
             # Check if we need to approve the router
-            allowance = token_contract.functions.allowance(
-                config.WALLET_ADDRESS,
-                config.PANCAKE_ROUTER_ADDRESS
-            ).call()
-            
-            time.sleep(2)
-            
             if allowance < amount_tokens_wei:
-                logger.info(f"Approving PancakeSwap router to spend {token_symbol}")
+                logger.info("Approving PancakeSwap router to spend %s", token_symbol)
                 
-                approval_nonce = w3.eth.get_transaction_count(config.WALLET_ADDRESS)
-                logger.info(f"Using nonce {approval_nonce} for approval transaction")
+                approval_nonce = WALLET_NONCES.next()
+                nonce_allocated = True
+                unsent_nonce = approval_nonce
+                logger.info("Using nonce %s for approval transaction", approval_nonce)
                 
-                # Build approval transaction with higher gas
-                approve_tx = token_contract.functions.approve(
-                    config.PANCAKE_ROUTER_ADDRESS,
-                    2 ** 256 - 1  # Max approval
-                ).build_transaction({
+                # Build approval transaction (max approval) with higher gas
+                approve_tx = {
                     'from': config.WALLET_ADDRESS,
+                    'to': token_contract.address,
+                    'data': _APPROVE_ROUTER_CALLDATA,
+                    'value': 0,
                     'gas': 150000,  # Increased gas for approval
-                    'gasPrice': int(w3.eth.gas_price * config.GAS_MULTIPLIER * 1.2),  # 20% higher
+                    'gasPrice': int(GAS_TRACKER.current() * config.GAS_MULTIPLIER * 1.2),  # 20% higher
                     'nonce': approval_nonce,
                     'chainId': 56
-                })
+                }
                 
                 signed_approve_tx = w3.eth.account.sign_transaction(approve_tx, config.PRIVATE_KEY)
                 
@@ -192,28 +466,42 @@ def execute_sell(token_address, token_symbol, token_decimals, amount_tokens=None
                     raw_approve_tx = signed_approve_tx.raw_transaction
                     
                 approve_tx_hash = w3.eth.send_raw_transaction(raw_approve_tx)
+                WALLET_NONCES.sent(approval_nonce)
+                unsent_nonce = None
                 
-                approve_receipt = w3.eth.wait_for_transaction_receipt(approve_tx_hash, timeout=120)
+                approve_receipt = _wait_for_receipt(w3, approve_tx_hash)
                 
                 if approve_receipt['status'] != 1:
-                    reason = decode_revert_reason(approve_tx_hash)
-                    logger.error(f"Approval transaction failed: {approve_tx_hash.hex()}, reason: {reason}")
-                    failure_reasons.append(f"APPROVAL_FAILED: {reason}")
+                    reason = decode_revert_reason(approve_tx_hash, approve_receipt, approve_tx)
+                    logger.error("Approval transaction failed: %s, reason: %s", approve_tx_hash.hex(), reason)
+                    note_failure(f"APPROVAL_FAILED: {reason}")
                     return {
                         "status": "failed",
                         "reason": f"Approval failed: {reason}",
                         "tx_hash": approve_tx_hash.hex()
                     }
                     
-                logger.info(f"Approval transaction successful: {approve_tx_hash.hex()}")
+                logger.info("Approval transaction successful: %s", approve_tx_hash.hex())
                 
-                time.sleep(3)
+                # Instead of a fixed settling delay, read the allowance back until the RPC
+                # (possibly load-balanced over several nodes) reflects the approval
+                for _ in range(APPROVAL_READBACK_ATTEMPTS):
+                    if allowance_call.call() >= amount_tokens_wei:
+                        break
+                    time.sleep(APPROVAL_READBACK_INTERVAL)
+                
+                # The pre-read quote went stale while the approval was mined
+                amounts_out = None
             
-            # Estimate BNB output
-            estimated_bnb = estimate_bnb_output(token_address, amount_tokens, token_decimals)
+            # Estimate BNB output, reusing the quote read with the allowance when there is one
+            if amounts_out is not None:
+                estimated_bnb = float(w3.from_wei(amounts_out[1], 'ether'))
+                QUOTE_CACHE.set((token_address, amount_tokens, token_decimals), estimated_bnb)
+            else:
+                estimated_bnb = estimate_bnb_output(token_address, amount_tokens, token_decimals, use_cache=False)
             if not estimated_bnb:
-                logger.error(f"Failed to estimate BNB output for {token_symbol}")
-                failure_reasons.append("ESTIMATION_FAILED")
+                logger.error("Failed to estimate BNB output for %s", token_symbol)
+                note_failure("ESTIMATION_FAILED")
                 return {
                     "status": "failed",
                     "reason": "Failed to estimate BNB output"
@@ -223,13 +511,13 @@ def execute_sell(token_address, token_symbol, token_decimals, amount_tokens=None
             base_extra_slippage = min(10 * attempt, 30)  # Max +30% extra slippage
             
             # If we've seen price impact errors, increase slippage more aggressively
-            if any('price impact' in reason.lower() for reason in failure_reasons) or any('slippage' in reason.lower() for reason in failure_reasons):
+            if failure_flags & {'PRICE_IMPACT', 'SLIPPAGE'}:
                 extra_slippage = min(base_extra_slippage + 15, 49)  # Add up to 15% more, max 49%
             else:
                 extra_slippage = base_extra_slippage
                 
             effective_slippage = config.SLIPPAGE + extra_slippage
-            logger.info(f"Using slippage: {effective_slippage}% for sell transaction")
+            logger.info("Using slippage: %s%% for sell transaction", effective_slippage)
             
             # Calculate minimum BNB to receive (with dynamic slippage)
             min_bnb = int(w3.to_wei(estimated_bnb * (100 - effective_slippage) / 100, 'ether'))
@@ -238,39 +526,38 @@ def execute_sell(token_address, token_symbol, token_decimals, amount_tokens=None
             gas_base_multiplier = 1 + (0.2 * attempt)  # +20% per attempt
             
             # If we've seen gas-related errors, increase gas more aggressively
-            if any('gas' in reason.lower() for reason in failure_reasons):
+            if 'GAS' in failure_flags:
                 gas_multiplier = config.GAS_MULTIPLIER * gas_base_multiplier * 1.5  # 50% more gas
                 gas_limit_multiplier = 1 + (0.4 * attempt)  # +40% per attempt
             else:
                 gas_multiplier = config.GAS_MULTIPLIER * gas_base_multiplier
                 gas_limit_multiplier = 1 + (0.2 * attempt)  # +20% per attempt
                 
-            gas_price = int(w3.eth.gas_price * gas_multiplier)
+            gas_price = int(GAS_TRACKER.current() * gas_multiplier)
             gas_limit = 300000 * gas_limit_multiplier
             
-            logger.info(f"Using gas limit {gas_limit:.0f} and gas price {gas_price} for sell transaction")
+            logger.info("Using gas limit %.0f and gas price %s for sell transaction", gas_limit, gas_price)
             
-            # Get fresh nonce
-            sell_nonce = w3.eth.get_transaction_count(config.WALLET_ADDRESS)
-            logger.info(f"Using nonce {sell_nonce} for sell transaction")
+            # Next nonce from the local allocator
+            sell_nonce = WALLET_NONCES.next()
+            nonce_allocated = True
+            unsent_nonce = sell_nonce
+            logger.info("Using nonce %s for sell transaction", sell_nonce)
             
             # Transaction deadline (longer with each attempt)
             deadline = int(time.time() + 300 + (300 * attempt))  # +5 min per attempt
             
-            # Build transaction
-            tx = router_contract.functions.swapExactTokensForETHSupportingFeeOnTransferTokens(
-                amount_tokens_wei,  # Exact tokens to sell
-                min_bnb,  # Minimum BNB to receive
-                [token_address, config.WBNB_ADDRESS],  # Path
-                config.WALLET_ADDRESS,  # Recipient
-                deadline  # Deadline
-            ).build_transaction({
+            # Build transaction: every field is known, so skip build_transaction and its ABI encoding
+            tx = {
                 'from': config.WALLET_ADDRESS,
+                'to': config.PANCAKE_ROUTER_ADDRESS,
+                'data': _sell_calldata(token_address, amount_tokens_wei, min_bnb, deadline),
+                'value': 0,
                 'gas': int(gas_limit),
                 'gasPrice': gas_price,
                 'nonce': sell_nonce,
                 'chainId': 56
-            })
+            }
             
             signed_tx = w3.eth.account.sign_transaction(tx, config.PRIVATE_KEY)
             
@@ -280,162 +567,340 @@ def execute_sell(token_address, token_symbol, token_decimals, amount_tokens=None
                 raw_tx = signed_tx.raw_transaction
                 
             tx_hash = w3.eth.send_raw_transaction(raw_tx)
+            WALLET_NONCES.sent(sell_nonce)
+            unsent_nonce = None
             tx_hash_hex = tx_hash.hex()
             
-            logger.info(f"Sell transaction sent: {tx_hash_hex}")
+            logger.info("Sell transaction sent: %s", tx_hash_hex)
             
-            tx_receipt = w3.eth.wait_for_transaction_receipt(tx_hash, timeout=120)
+            tx_receipt = _wait_for_receipt(w3, tx_hash)
             
             # Log gas used for diagnostics
             gas_used = tx_receipt.get('gasUsed', 0)
             gas_usage_percent = (gas_used / int(gas_limit)) * 100
-            logger.info(f"Gas used: {gas_used}/{int(gas_limit)} ({gas_usage_percent:.2f}%)")
+            logger.info("Gas used: %s/%s (%.2f%%)", gas_used, int(gas_limit), gas_usage_percent)
             
             if tx_receipt['status'] == 1:
-                logger.info(f"Sell transaction successful: {tx_hash_hex}")
-                
-                # Calculate profit/loss if not a test sell
-                profit_loss_bnb = None
-                if not is_test and portfolio_id is not None:
-                    # TODO: Calculate profit/loss based on portfolio entry
-                    pass
-                
-                # Record transaction
-                transaction_type = "test_sell" if is_test else "sell"
-                record_transaction(
-                    token_address,
-                    token_symbol,
-                    transaction_type,
-                    amount_tokens,
-                    estimated_bnb,
-                    tx_hash_hex,
-                    profit_loss_bnb
-                )
-                
-                # Update portfolio status if not a test sell
-                if not is_test and portfolio_id is not None:
-                    update_portfolio_status(portfolio_id, "sold")
-                
-                return {
-                    "status": "success",
-                    "tx_hash": tx_hash_hex,
-                    "tokens_sold": amount_tokens,
-                    "bnb_received": estimated_bnb
-                }
+                logger.info("Sell transaction successful: %s", tx_hash_hex)
+                return _record_successful_sell(token_address, token_symbol, amount_tokens, estimated_bnb,
+                                               tx_hash_hex, portfolio_id, is_test)
             else:
                 # Extract and log the reason for failure
-                reason = decode_revert_reason(tx_hash)
-                failure_reasons.append(reason)
-                logger.error(f"Sell transaction failed: {tx_hash_hex}, reason: {reason}")
+                reason = decode_revert_reason(tx_hash, tx_receipt, tx)
+                note_failure(reason)
+                logger.error("Sell transaction failed: %s, reason: %s", tx_hash_hex, reason)
                 
                 # Record the failed transaction for future analysis
-                try:
-                    from database.operations import record_failed_transaction
-                    record_failed_transaction(
-                        token_address, 
-                        token_symbol, 
-                        "sell", 
-                        amount_tokens, 
-                        tx_hash_hex, 
-                        reason
-                    )
-                except ImportError:
-                    logger.warning("Failed to record failed transaction: record_failed_transaction function not available")
+                record_failed_transaction(
+                    token_address, 
+                    token_symbol, 
+                    "sell", 
+                    amount_tokens, 
+                    tx_hash_hex, 
+                    reason
+                )
                 
                 # If gas usage is near 100%, likely out of gas
                 if gas_usage_percent > 95:
-                    failure_reasons.append("OUT_OF_GAS")
-                    logger.error(f"Transaction likely failed due to out of gas (used {gas_usage_percent:.2f}%)")
+                    note_failure("OUT_OF_GAS")
+                    logger.error("Transaction likely failed due to out of gas (used %.2f%%)", gas_usage_percent)
                 
         except (TimeExhausted, BadFunctionCallOutput, TransactionNotFound) as e:
+            timed_out = True
             error_message = str(e)
-            failure_reasons.append(error_message)
-            logger.warning(f"Transaction error during sell (attempt {attempt+1}/{max_retries}): {e}")
+            note_failure(error_message)
+            logger.warning("Transaction error during sell (attempt %s/%s): %s", attempt+1, max_retries, e)
             
             # Add specific handling for known error patterns
             if "gas required exceeds allowance" in error_message:
                 # Likely needs more gas, increase gas limit more aggressively next time
-                failure_reasons.append("EXCEEDED_MAXIMUM")
+                note_failure("EXCEEDED_MAXIMUM")
             elif "always failing transaction" in error_message:
                 # Token might have selling restrictions
-                failure_reasons.append("ALWAYS_FAILING")
+                note_failure("ALWAYS_FAILING")
             elif "execution reverted" in error_message:
-                failure_reasons.append("EXECUTION_REVERTED")
-            
-            # Try to record the failed transaction 
-            try:
-                from database.operations import record_failed_transaction
-                record_failed_transaction(
-                    token_address, 
-                    token_symbol, 
-                    "sell", 
-                    amount_tokens, 
-                    None,  # No tx hash in this case
-                    error_message
-                )
-            except ImportError:
-                logger.warning("Failed to record failed transaction: record_failed_transaction function not available")
+                note_failure("EXECUTION_REVERTED")
+            
+            # Record the failed transaction
+            record_failed_transaction(
+                token_address, 
+                token_symbol, 
+                "sell", 
+                amount_tokens, 
+                None,  # No tx hash in this case
+                error_message
+            )
                 
         except Exception as e:
             error_message = str(e)
-            failure_reasons.append(error_message)
-            logger.error(f"Error executing sell (attempt {attempt+1}/{max_retries}): {e}")
+            note_failure(error_message)
+            logger.error("Error executing sell (attempt %s/%s): %s", attempt+1, max_retries, e)
+            
+            # Record the failed transaction
+            record_failed_transaction(
+                token_address, 
+                token_symbol, 
+                "sell", 
+                amount_tokens, 
+                None,  # No tx hash in this case
+                error_message
+            )
             
-            # Try to record the failed transaction
-            try:
-                from database.operations import record_failed_transaction
-                record_failed_transaction(
-                    token_address, 
-                    token_symbol, 
-                    "sell", 
-                    amount_tokens, 
-                    None,  # No tx hash in this case
-                    error_message
-                )
-            except ImportError:
-                logger.warning("Failed to record failed transaction: record_failed_transaction function not available")
+        # The allocated nonce may be unused (or already taken), so re-read it from the chain
+        if nonce_allocated:
+            WALLET_NONCES.resync(unsent_nonce)
+            # The retry re-reads the gas price too, in case the send was underpriced
+            GAS_TRACKER.invalidate()
+            
+        failure_kind = _sell_failure_kind(failure_reasons, timed_out)
+        # A token that still reverts after a retry has selling restrictions, more attempts
+        # would only repeat the same reads and revert again
+        if failure_kind == 'ALWAYS_FAILING' and attempt >= 1:
+            logger.warning("Sell of %s still reverts after %s attempts, not retrying", token_symbol, attempt + 1)
+            break
             
-        # Exponential backoff with larger delay
+        # Backoff depends on why the attempt failed, see SELL_RETRY_BACKOFF
         if attempt < max_retries - 1:
-            backoff_time = config.RETRY_DELAY_BASE * (attempt + 1) * 2
-            logger.info(f"Retrying sell in {backoff_time} seconds...")
+            backoff_time = _sell_retry_delay(failure_kind, attempt)
+            logger.info("Retrying sell in %.2f seconds...", backoff_time)
             time.sleep(backoff_time)
     
-    logger.error(f"Failed to execute sell for {token_address} after {max_retries} attempts")
+    logger.error("Failed to execute sell for %s after %s attempts", token_address, attempt + 1)
     
     # If we've exhausted all retries, check if we should queue this token for gradual selling
-    if len(failure_reasons) >= 3 and any(reason in ["ALWAYS_FAILING", "EXECUTION_REVERTED"] for reason in failure_reasons):
-        logger.info(f"Token {token_symbol} appears to have selling restrictions, queuing for gradual selling")
-        try:
-            from database.operations import add_to_sell_queue
-            # Create a queue entry in the database for gradual selling
-            sell_schedule = [
-                {"percent": 5, "delay_minutes": 5},   # Try 5% after 5 minutes
-                {"percent": 10, "delay_minutes": 15}, # Try 10% after 15 minutes
-                {"percent": 15, "delay_minutes": 30}, # Try 15% after 30 minutes
-                {"percent": 20, "delay_minutes": 60}, # Try 20% after 1 hour
-                {"percent": 50, "delay_minutes": 120} # Try 50% after 2 hours
-            ]
-            
-            for schedule in sell_schedule:
-                sell_amount = amount_tokens * (schedule["percent"] / 100)
-                scheduled_time = datetime.now() + timedelta(minutes=schedule["delay_minutes"])
-                
-                add_to_sell_queue(
-                    token_address,
-                    token_symbol,
-                    token_decimals,
-                    sell_amount,
-                    scheduled_time
-                )
-            
-            logger.info(f"Queued {token_symbol} for gradual selling over time")
-        except ImportError:
-            logger.warning("Failed to queue token for gradual selling: add_to_sell_queue function not available")
+    if len(failure_reasons) >= 3 and failure_flags & _REVERT_MARKERS:
+        logger.info("Token %s appears to have selling restrictions, queuing for gradual selling", token_symbol)
+        queue_token_for_gradual_selling(token_address, token_symbol, token_decimals, amount_tokens)
     
     return {
         "status": "failed",
         "reasons": failure_reasons,
         "token_address": token_address,
         "token_symbol": token_symbol
-    }
\ No newline at end of file
+    }
+
+def _raw_transaction(signed_tx):
+    """Get the raw bytes of a signed transaction (attribute name differs across eth-account versions)"""
+    if hasattr(signed_tx, 'rawTransaction'):
+        return signed_tx.rawTransaction
+    return signed_tx.raw_transaction
+
+def _fill_nonce_gap(w3, nonce, gas_price):
+    """Send a zero-value self-transfer so transactions queued after a missing nonce can be mined"""
+    tx = {
+        'from': config.WALLET_ADDRESS,
+        'to': config.WALLET_ADDRESS,
+        'value': 0,
+        'gas': 21000,
+        'gasPrice': gas_price,
+        'nonce': nonce,
+        'chainId': 56
+    }
+    signed_tx = w3.eth.account.sign_transaction(tx, config.PRIVATE_KEY)
+    w3.eth.send_raw_transaction(_raw_transaction(signed_tx))
+    logger.warning("Filled nonce gap at %s with a self-transfer", nonce)
+
+# Lowercase send errors meaning the node already holds a transaction at that nonce
+_ALREADY_SENT_ERRORS = ('already known', 'known transaction', 'nonce too low', 'replacement transaction underpriced')
+
+def _rebroadcast(w3, signed_tx):
+    """Send a batched transaction again on its own to learn whether the node has it
+    
+    The payload is the same signed transaction, so this can never create a second sell.
+    
+    Args:
+        w3: Web3 instance
+        signed_tx: The signed transaction
+        
+    Returns:
+        bool: False only if the node explicitly refused the transaction, True if it has it or the answer is unclear
+    """
+    try:
+        w3.eth.send_raw_transaction(_raw_transaction(signed_tx))
+        return True
+    except (ValueError, Web3RPCError) as e:
+        message = str(e).lower()
+        if any(known in message for known in _ALREADY_SENT_ERRORS):
+            return True
+        logger.warning("Batched sell transaction %s was rejected: %s", signed_tx.hash.hex(), e)
+        return False
+    except Exception as e:
+        # Without an answer it may still be in the mempool, so it counts as sent
+        logger.warning("Could not rebroadcast batched sell transaction %s: %s", signed_tx.hash.hex(), e)
+        Web3Singleton.reconnect_on_transport_error(e)
+        return True
+
+def _send_sells_batch(sells, results):
+    """Sign sells with sequential nonces and send them in one JSON-RPC batch request
+    
+    Results are written per index as soon as they are known, so an error part
+    way through never leaves a sent sell looking unsent. An index is set back
+    to None only when its transaction certainly did not sell (rejected by the
+    node or reverted), so the caller can retry it through execute_sell.
+    
+    Args:
+        sells: (index, sell, amount_tokens_wei, estimated_bnb) tuples, all approved and quoted
+        results: Result list of the caller, filled in by index
+    """
+    w3 = Web3Singleton.get_instance()
+    
+    gas_price = int(GAS_TRACKER.current() * config.GAS_MULTIPLIER)
+    nonce = WALLET_NONCES.reserve(len(sells)).start
+    deadline = int(time.time() + 300)
+    
+    txs = []
+    signed_txs = []
+    try:
+        for offset, (index, sell, amount_tokens_wei, estimated_bnb) in enumerate(sells):
+            min_bnb = int(w3.to_wei(estimated_bnb * (100 - config.SLIPPAGE) / 100, 'ether'))
+            tx = {
+                'from': config.WALLET_ADDRESS,
+                'to': config.PANCAKE_ROUTER_ADDRESS,
+                'data': _sell_calldata(sell['token_address'], amount_tokens_wei, min_bnb, deadline),
+                'value': 0,
+                'gas': 300000,
+                'gasPrice': gas_price,
+                'nonce': nonce + offset,
+                'chainId': 56
+            }
+            txs.append(tx)
+            signed_txs.append(w3.eth.account.sign_transaction(tx, config.PRIVATE_KEY))
+    except Exception:
+        # Nothing was sent, give the allocated nonces back
+        WALLET_NONCES.release(nonce, len(sells))
+        raise
+        
+    # From here on every sell may be on chain: it stays failed with its hash unless proven otherwise
+    for (index, _, _, _), signed_tx in zip(sells, signed_txs):
+        results[index] = {
+            "status": "failed",
+            "reason": "Batched sell not confirmed",
+            "tx_hash": signed_tx.hash.hex()
+        }
+        
+    logger.info("Sending %s sell transactions in one batch (nonces %s-%s)", len(signed_txs), nonce, nonce + len(signed_txs) - 1)
+    batch_failed = False
+    try:
+        with w3.batch_requests() as batch:
+            for signed_tx in signed_txs:
+                batch.add(w3.eth.send_raw_transaction(_raw_transaction(signed_tx)))
+            batch.execute()
+    except Exception as e:
+        # One rejected transaction fails the whole batch response, the others may still be accepted
+        logger.warning("Batched sell submission reported an error: %s", e)
+        batch_failed = True
+    # Any rejected ones are left to the resync below
+    WALLET_NONCES.sent(nonce, len(signed_txs))
+        
+    # Transaction hashes are known from the signed payloads, so check which ones the node accepted.
+    # A load-balanced endpoint may not have seen a transaction yet, so only an explicit refusal counts.
+    accepted = [True] * len(signed_txs)
+    if batch_failed:
+        for offset, signed_tx in enumerate(signed_txs):
+            try:
+                w3.eth.get_transaction(signed_tx.hash)
+            except TransactionNotFound:
+                accepted[offset] = _rebroadcast(w3, signed_tx)
+            except Exception as e:
+                logger.warning("Could not look up batched sell transaction %s: %s", signed_tx.hash.hex(), e)
+                Web3Singleton.reconnect_on_transport_error(e)
+                
+    if not all(accepted):
+        # A rejected nonce would block every later one
+        for offset, is_accepted in enumerate(accepted):
+            if not is_accepted and any(accepted[offset + 1:]):
+                try:
+                    _fill_nonce_gap(w3, nonce + offset, gas_price)
+                except Exception as e:
+                    logger.error("Error filling nonce gap at %s: %s", nonce + offset, e)
+        # Rejected trailing nonces were never used
+        WALLET_NONCES.resync()
+        for (index, _, _, _), is_accepted in zip(sells, accepted):
+            if not is_accepted:
+                results[index] = None
+                
+    for (index, sell, _, estimated_bnb), tx, signed_tx, is_accepted in zip(sells, txs, signed_txs, accepted):
+        if not is_accepted:
+            continue
+        tx_hash_hex = signed_tx.hash.hex()
+        try:
+            tx_receipt = _wait_for_receipt(w3, signed_tx.hash)
+            
+            if tx_receipt['status'] == 1:
+                logger.info("Sell transaction successful: %s", tx_hash_hex)
+                results[index] = _record_successful_sell(sell['token_address'], sell['token_symbol'], sell['amount_tokens'],
+                                                         estimated_bnb, tx_hash_hex, sell.get('portfolio_id'))
+            else:
+                logger.error("Batched sell of %s failed: %s, reason: %s", sell['token_symbol'], tx_hash_hex, decode_revert_reason(signed_tx.hash, tx_receipt, tx))
+                # Reverted on chain, the tokens were not sold
+                results[index] = None
+        except TimeExhausted:
+            # Still pending, so it must not be sent again
+            logger.warning("Batched sell of %s not mined in time: %s", sell['token_symbol'], tx_hash_hex)
+            results[index]["reason"] = "Transaction not mined in time"
+        except Exception as e:
+            # The outcome is unknown, keep the failed result with its hash
+            logger.error("Error confirming batched sell of %s (%s): %s", sell['token_symbol'], tx_hash_hex, e)
+            Web3Singleton.reconnect_on_transport_error(e)
+            
+def execute_sells(sells):
+    """Execute several sells, submitting their transactions together
+    
+    Sells whose router allowance and quote are ready are signed with
+    sequential nonces and sent as one JSON-RPC batch. Sells that need an
+    approval first, or whose batched transaction was rejected or reverted, go
+    through execute_sell with its retries. A batched sell whose outcome is
+    unknown keeps its failed result and is never sent again.
+    
+    Args:
+        sells: Dicts with token_address, token_symbol, token_decimals, amount_tokens and portfolio_id
+        
+    Returns:
+        list: execute_sell result per sell, in order
+    """
+    results = [None] * len(sells)
+    
+    if len(sells) > 1:
+        try:
+            allowances = multicall([
+                get_token_contract(sell['token_address']).functions.allowance(
+                    config.WALLET_ADDRESS,
+                    config.PANCAKE_ROUTER_ADDRESS
+                )
+                for sell in sells
+            ])
+            
+            approved = []
+            for index, (sell, allowance) in enumerate(zip(sells, allowances)):
+                amount_tokens_wei = int(sell['amount_tokens'] * (10 ** sell['token_decimals']))
+                if allowance is not None and allowance >= amount_tokens_wei:
+                    approved.append((index, sell, amount_tokens_wei))
+                    
+            # Fresh quotes for every approved sell in one eth_call
+            estimates = batch_estimate_bnb_output(
+                [(sell['token_address'], sell['amount_tokens'], sell['token_decimals']) for _, sell, _ in approved],
+                use_cache=False
+            )
+            ready = [
+                (index, sell, amount_tokens_wei, estimated_bnb)
+                for (index, sell, amount_tokens_wei), estimated_bnb in zip(approved, estimates)
+                if estimated_bnb
+            ]
+                    
+            if len(ready) > 1:
+                _send_sells_batch(ready, results)
+        except Exception as e:
+            logger.error("Error executing batched sells: %s", e)
+            Web3Singleton.reconnect_on_transport_error(e)
+            
+    for index, sell in enumerate(sells):
+        if results[index] is None:
+            results[index] = execute_sell(
+                sell['token_address'],
+                sell['token_symbol'],
+                sell['token_decimals'],
+                amount_tokens=sell['amount_tokens'],
+                portfolio_id=sell.get('portfolio_id')
+            )
+            
+    return results
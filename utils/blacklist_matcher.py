@@ -0,0 +1,60 @@
+"""
+Multi-pattern matcher for config.BLACKLISTED_PATTERNS
+"""
+import re
+from functools import lru_cache
+
+import config
+
+@lru_cache(maxsize=32)
+def compile_patterns(patterns, flags=0):
+    """Compile patterns into one alternation, so a string is scanned in a single pass
+
+    Args:
+        patterns: Tuple of literal substrings, str or bytes (hashable, so each list is compiled once)
+        flags: re flags, e.g. re.IGNORECASE to match bytes without lowercasing them first
+
+    Returns:
+        re.Pattern: Compiled matcher, or None if there are no patterns
+    """
+    if not patterns:
+        return None
+    separator = b'|' if isinstance(patterns[0], bytes) else '|'
+    return re.compile(separator.join(re.escape(pattern) for pattern in patterns), flags)
+
+def find_pattern(regex, *texts):
+    """Find the first pattern of a compiled matcher contained in any of the given strings
+
+    Args:
+        regex: Matcher from compile_patterns (None matches nothing)
+        *texts: Strings to scan, matched case-insensitively
+
+    Returns:
+        str: Matched pattern or None if no pattern matches
+    """
+    if regex is None:
+        return None
+    for text in texts:
+        if not text:
+            continue
+        match = regex.search(text.lower())
+        if match:
+            return match.group(0)
+    return None
+
+_BLACKLIST_RE = compile_patterns(tuple(config.BLACKLISTED_PATTERNS))
+
+def find_blacklisted_pattern(*texts):
+    """Find the first blacklisted pattern contained in any of the given strings
+
+    Args:
+        *texts: Strings to scan (e.g. token name and symbol), matched case-insensitively
+
+    Returns:
+        str: Matched pattern or None if no pattern matches
+    """
+    return find_pattern(_BLACKLIST_RE, *texts)
+
+def has_blacklisted_pattern(text):
+    """Check if a string contains any blacklisted pattern"""
+    return find_blacklisted_pattern(text) is not None
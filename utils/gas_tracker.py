@@ -0,0 +1,102 @@
+"""
+Network gas price kept current by a newHeads subscription, so sends don't wait on eth_gasPrice
+
+The same subscription wakes threads waiting for the next block (e.g. to poll a receipt).
+"""
+import asyncio
+import threading
+import time
+
+from utils.logging_setup import logger
+from utils.web3_singleton import Web3Singleton
+import config
+
+# A tracked price older than this is not trusted (seconds, ~4 BSC blocks)
+GAS_TRACKER_MAX_AGE = 12
+# Delay before re-subscribing after the WebSocket connection drops (seconds)
+GAS_TRACKER_RECONNECT_DELAY = 5
+# Without a subscription, an eth_gasPrice reading is reused this long (seconds, under one block)
+GAS_TRACKER_FALLBACK_TTL = 2
+
+class GasTracker:
+    """Refreshes the gas price and signals waiters on every new block, in a background thread"""
+
+    def __init__(self, max_age=GAS_TRACKER_MAX_AGE):
+        self.max_age = max_age
+        self.last = None
+        self._updated = 0.0
+        self._fallback = None
+        self._fallback_updated = 0.0
+        self._new_block = threading.Condition()
+        self._thread = None
+
+    def is_live(self):
+        """Check if new heads are arriving over the subscription"""
+        return self.last is not None and time.monotonic() - self._updated < self.max_age
+    
+    def wait_for_block(self, timeout):
+        """Wait until the subscription delivers the next block header
+        
+        Args:
+            timeout: Maximum wait (seconds)
+            
+        Returns:
+            bool: True if a new block arrived, False on timeout
+        """
+        with self._new_block:
+            return self._new_block.wait(timeout)
+    
+    def current(self):
+        """Get the network gas price (wei), from memory unless the tracked price is stale
+
+        Returns:
+            int: Gas price without the GAS_MULTIPLIER margin
+        """
+        if self.is_live():
+            return self.last
+        
+        now = time.monotonic()
+        if self._fallback is None or now - self._fallback_updated >= GAS_TRACKER_FALLBACK_TTL:
+            self._fallback = Web3Singleton.call_race(lambda w3: w3.eth.gas_price)
+            self._fallback_updated = now
+        return self._fallback
+    
+    def invalidate(self):
+        """Forget the known price, so a retry after a failed send reads it from the node"""
+        self.last = None
+        self._fallback = None
+
+    async def _track(self):
+        """Update the price on each new head until the connection drops"""
+        async with Web3Singleton.websocket() as w3:
+            await w3.eth.subscribe('newHeads')
+            logger.info("Tracking gas price on new blocks via %s", config.BSC_WS_ENDPOINT)
+
+            async for _ in w3.socket.process_subscriptions():
+                # Wake block waiters first, the gas price read costs a round trip
+                with self._new_block:
+                    self._new_block.notify_all()
+                self.last = await w3.eth.gas_price
+                self._updated = time.monotonic()
+
+    def start(self):
+        """Start the tracking thread (once)
+
+        Returns:
+            threading.Thread: Tracker thread
+        """
+        def tracker_thread():
+            while True:
+                try:
+                    asyncio.run(self._track())
+                except Exception as e:
+                    logger.warning("Gas price subscription dropped: %s", e)
+                time.sleep(GAS_TRACKER_RECONNECT_DELAY)
+
+        if self._thread is None:
+            self._thread = threading.Thread(target=tracker_thread, name="gas-tracker", daemon=True)
+            self._thread.start()
+        return self._thread
+
+# Shared by every sender; falls back to eth_gasPrice until started
+GAS_TRACKER = GasTracker()
@@ -1,5 +1,4 @@
 import time
-import pandas as pd
 from datetime import datetime
 
 from utils.logging_setup import logger
@@ -21,12 +20,14 @@ def time_since(timestamp):
     """Calculate time elapsed since a timestamp
     
     Args:
-        timestamp: Timestamp to compare against
+        timestamp: Timestamp to compare against (epoch seconds, string or datetime)
         
     Returns:
         str: Formatted time difference
     """
-    if isinstance(timestamp, str):
+    if isinstance(timestamp, (int, float)):
+        dt = datetime.fromtimestamp(timestamp)
+    elif isinstance(timestamp, str):
         dt = datetime.strptime(timestamp, '%Y-%m-%d %H:%M:%S')
     else:
         dt = timestamp
@@ -72,11 +73,15 @@ def retry_function(func, max_retries=3, retry_delay=2, *args, **kwargs):
                 logger.error(f"Function {func.__name__} failed after {max_retries} attempts: {e}")
                 return None
 
+# Display columns of the report helpers, in order
+PORTFOLIO_SUMMARY_COLUMNS = ['Token', 'Amount', 'Investment (BNB)', 'Status', 'Holding Time']
+TRANSACTION_HISTORY_COLUMNS = ['Token', 'Type', 'Amount', 'BNB', 'Time Ago', 'P/L (BNB)']
+
 def get_portfolio_summary():
     """Get a summary of the portfolio
     
     Returns:
-        pandas.DataFrame: Portfolio summary
+        list: Portfolio entries as dicts keyed by PORTFOLIO_SUMMARY_COLUMNS, None on error
     """
     try:
         conn = get_connection()
@@ -84,34 +89,19 @@ def get_portfolio_summary():
             return None
             
         # Query for active portfolio entries
-        query = '''
-        SELECT token_symbol, token_address, amount_tokens, investment_amount_bnb, 
-               purchase_time, purchase_price_bnb, status
+        rows = conn.execute('''
+        SELECT token_symbol, amount_tokens, investment_amount_bnb, purchase_time, status
         FROM portfolio
         ORDER BY purchase_time DESC
-        '''
-        
-        df = pd.read_sql_query(query, conn)
-        
-        if df.empty:
-            return pd.DataFrame(columns=['Token', 'Amount', 'Investment (BNB)', 'Status', 'Holding Time'])
-            
-        # Add holding time
-        df['Holding Time'] = df['purchase_time'].apply(time_since)
-        
-        # Rename columns for display
-        df = df.rename(columns={
-            'token_symbol': 'Token',
-            'amount_tokens': 'Amount',
-            'investment_amount_bnb': 'Investment (BNB)',
-            'status': 'Status'
-        })
-        
-        # Select only relevant columns
-        summary = df[['Token', 'Amount', 'Investment (BNB)', 'Status', 'Holding Time']]
+        ''')
         
-        conn.close()
-        return summary
+        return [{
+            'Token': row['token_symbol'],
+            'Amount': row['amount_tokens'],
+            'Investment (BNB)': row['investment_amount_bnb'],
+            'Status': row['status'],
+            'Holding Time': time_since(row['purchase_time'])
+        } for row in rows]
     except Exception as e:
         logger.error(f"Error getting portfolio summary: {e}")
         return None
@@ -123,7 +113,7 @@ def get_transaction_history(limit=20):
         limit: Maximum number of transactions to return
         
     Returns:
-        pandas.DataFrame: Transaction history
+        list: Transactions as dicts keyed by TRANSACTION_HISTORY_COLUMNS, None on error
     """
     try:
         conn = get_connection()
@@ -131,36 +121,22 @@ def get_transaction_history(limit=20):
             return None
             
         # Query for transactions
-        query = f'''
+        rows = conn.execute('''
         SELECT token_symbol, transaction_type, amount_tokens, amount_bnb, 
                timestamp, profit_loss_bnb
         FROM transactions
         ORDER BY timestamp DESC
-        LIMIT {limit}
-        '''
-        
-        df = pd.read_sql_query(query, conn)
-        
-        if df.empty:
-            return pd.DataFrame(columns=['Token', 'Type', 'Amount', 'BNB', 'Time', 'P/L (BNB)'])
-            
-        # Add time ago
-        df['Time Ago'] = df['timestamp'].apply(time_since)
-        
-        # Rename columns for display
-        df = df.rename(columns={
-            'token_symbol': 'Token',
-            'transaction_type': 'Type',
-            'amount_tokens': 'Amount',
-            'amount_bnb': 'BNB',
-            'profit_loss_bnb': 'P/L (BNB)'
-        })
-        
-        # Select only relevant columns
-        history = df[['Token', 'Type', 'Amount', 'BNB', 'Time Ago', 'P/L (BNB)']]
-        
-        conn.close()
-        return history
+        LIMIT ?
+        ''', (limit,))
+        
+        return [{
+            'Token': row['token_symbol'],
+            'Type': row['transaction_type'],
+            'Amount': row['amount_tokens'],
+            'BNB': row['amount_bnb'],
+            'Time Ago': time_since(row['timestamp']),
+            'P/L (BNB)': row['profit_loss_bnb']
+        } for row in rows]
     except Exception as e:
         logger.error(f"Error getting transaction history: {e}")
         return None
@@ -188,7 +164,6 @@ def calculate_total_profits():
         result = cursor.fetchone()
         total_profit = result[0] if result[0] else 0
         
-        conn.close()
         return total_profit
     except Exception as e:
         logger.error(f"Error calculating total profits: {e}")
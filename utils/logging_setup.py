@@ -1,18 +1,39 @@
+import atexit
 import logging
+import queue
 from datetime import datetime
+from logging.handlers import QueueHandler, QueueListener
 
 def setup_logging():
-    """Configure and set up logging for the application"""
+    """Configure and set up logging for the application
+
+    Records are only queued by the logging thread; a background listener formats
+    them and writes them to the log file and stderr, so trading threads never
+    block on disk or console I/O.
+    """
+    log_queue = queue.Queue(-1)
+
+    formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
+    file_handler = logging.FileHandler(f"sniper_log_{datetime.now().strftime('%Y%m%d_%H%M%S')}.log", delay=True)
+    stream_handler = logging.StreamHandler()
+    for handler in (file_handler, stream_handler):
+        handler.setFormatter(formatter)
+
+    listener = QueueListener(log_queue, file_handler, stream_handler)
+    listener.start()
+    # Write out whatever is still queued when the process exits
+    atexit.register(listener.stop)
+
+    # Only merges the message arguments, the listener's handlers add the timestamp and level
+    queue_handler = QueueHandler(log_queue)
+    queue_handler.setFormatter(logging.Formatter('%(message)s'))
+
     logging.basicConfig(
         level=logging.INFO,
-        format='%(asctime)s - %(levelname)s - %(message)s',
-        handlers=[
-            logging.FileHandler(f"sniper_log_{datetime.now().strftime('%Y%m%d_%H%M%S')}.log"),
-            logging.StreamHandler()
-        ]
+        handlers=[queue_handler]
     )
     logger = logging.getLogger()
     return logger
 
 # Create a global logger instance
-logger = setup_logging()
\ No newline at end of file
+logger = setup_logging()
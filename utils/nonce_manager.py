@@ -0,0 +1,130 @@
+"""
+Process-local nonce allocator for the trading wallet
+"""
+import threading
+
+from utils.logging_setup import logger
+from utils.web3_singleton import Web3Singleton
+import config
+
+class NonceManager:
+    """Hands out consecutive nonces for an address, reading the chain only to seed or resync
+
+    Every transaction sent from the address must take its nonce from here, otherwise
+    the local counter falls behind and the next send fails with "nonce too low".
+    Nonces given back unsent are recycled, lowest first, so they don't leave a gap
+    that would hold every later transaction in the mempool. Ranges take recycled
+    nonces too when enough of them are consecutive; a shorter gap goes to the next
+    single allocation.
+
+    Allocated nonces stay outstanding until the caller reports them sent (sent),
+    gives them back (release) or leaves them to the chain (resync). A resync never
+    hands out an outstanding nonce again, and only outstanding nonces can be released.
+    """
+
+    def __init__(self, address):
+        self.address = address
+        self._nonce = None
+        self._recyclable = set()
+        self._outstanding = set()
+        self._lock = threading.Lock()
+
+    def _fetch(self):
+        """Next nonce according to the node, counting transactions still in the mempool"""
+        return Web3Singleton.get_instance().eth.get_transaction_count(self.address, 'pending')
+
+    def _seed(self):
+        """Set the counter from the chain without reusing outstanding nonces (lock held)"""
+        chain_nonce = self._fetch()
+        self._nonce = max([chain_nonce] + [nonce + 1 for nonce in self._outstanding])
+        # Nonces below the outstanding ones that the chain hasn't seen would otherwise stay a gap
+        self._recyclable = set(range(chain_nonce, self._nonce)) - self._outstanding
+
+    def next(self, count=1):
+        """Allocate count consecutive nonces
+
+        Args:
+            count: Number of nonces to allocate (e.g. for a batch of transactions)
+
+        Returns:
+            int: First allocated nonce
+        """
+        with self._lock:
+            if self._nonce is None:
+                self._seed()
+            nonce = self._recycled_run(count)
+            if nonce is not None:
+                self._recyclable.difference_update(range(nonce, nonce + count))
+            else:
+                nonce = self._nonce
+                self._nonce += count
+            self._outstanding.update(range(nonce, nonce + count))
+            return nonce
+
+    def _recycled_run(self, count):
+        """Lowest run of count consecutive recyclable nonces (lock held)
+
+        Returns:
+            int: First nonce of the run, or None if no run is long enough
+        """
+        for nonce in sorted(self._recyclable):
+            if all(nonce + offset in self._recyclable for offset in range(1, count)):
+                return nonce
+        return None
+
+    def reserve(self, count):
+        """Allocate a contiguous range of nonces, e.g. for a batch of transactions"""
+        start = self.next(count)
+        return range(start, start + count)
+
+    def sent(self, nonce, count=1):
+        """Mark allocated nonces as used by transactions the node accepted
+
+        Args:
+            nonce: First sent nonce
+            count: Number of consecutive sent nonces
+        """
+        with self._lock:
+            self._outstanding.difference_update(range(nonce, nonce + count))
+
+    def release(self, nonce, count=1):
+        """Give back allocated nonces whose transactions were never sent
+
+        Args:
+            nonce: First nonce to give back
+            count: Number of consecutive nonces to give back
+        """
+        with self._lock:
+            # Nonces no longer outstanding were left to the chain by a resync and may be in use again
+            released = self._outstanding.intersection(range(nonce, nonce + count))
+            self._outstanding -= released
+            if self._nonce is None:
+                # Seeded again on the next allocation, which recycles them
+                return
+            self._recyclable |= released
+            # Recycled nonces at the top of the range simply lower the counter
+            while self._nonce - 1 in self._recyclable:
+                self._nonce -= 1
+                self._recyclable.discard(self._nonce)
+
+    def resync(self, nonce=None, count=1):
+        """Reseed from the chain, after a send failed (it may or may not have reached the node)
+
+        Args:
+            nonce: First nonce of the failed send, if still outstanding; the chain decides whether it was used
+            count: Number of consecutive nonces of the failed send
+        """
+        with self._lock:
+            if nonce is not None:
+                self._outstanding.difference_update(range(nonce, nonce + count))
+            try:
+                self._seed()
+                logger.info("Resynced nonce of %s to %s", self.address, self._nonce)
+            except Exception as e:
+                # Seed again on the next allocation
+                self._nonce = None
+                self._recyclable.clear()
+                logger.warning("Error resyncing nonce of %s: %s", self.address, e)
+
+# Shared by buys and sells, which all send from the same wallet
+WALLET_NONCES = NonceManager(config.WALLET_ADDRESS)
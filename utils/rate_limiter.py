@@ -0,0 +1,35 @@
+"""
+Thread-safe token bucket to keep request rates under an RPC provider's limit
+"""
+import threading
+import time
+
+import config
+
+class TokenBucket:
+    """Rate limiter allowing bursts of up to capacity requests, refilled at rate per second"""
+
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(1.0, rate)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Take one token, blocking until one is available"""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+
+            time.sleep(wait)
+
+# Shared across threads so concurrent scanners together stay under the provider limit
+RPC_RATE_LIMITER = TokenBucket(config.RPC_MAX_RPS)
@@ -0,0 +1,100 @@
+"""
+Retry decorator with exponential backoff and jitter for flaky RPC/HTTP calls
+"""
+import functools
+import random
+import time
+
+from web3.exceptions import TimeExhausted, BadFunctionCallOutput
+
+from utils.logging_setup import logger
+import config
+
+# Errors that only mean the node was slow, logged as warnings rather than errors
+TIMEOUT_ERRORS = (TimeExhausted, BadFunctionCallOutput)
+
+def _retry_after(error):
+    """Get the wait requested by a Retry-After header on the error's HTTP response, if any"""
+    response = getattr(error, 'response', None)
+    headers = getattr(response, 'headers', None) or {}
+    try:
+        return max(0.0, float(headers['Retry-After']))
+    except (KeyError, TypeError, ValueError):
+        # Missing, or the HTTP-date form, which RPC providers don't use
+        return None
+
+def backoff_delay(attempt, base=config.RETRY_DELAY_BASE, factor=2.0, jitter=1.0):
+    """Exponential backoff with random jitter, so callers that failed together don't retry together
+
+    Args:
+        attempt: Number of the attempt that just failed (0 for the first)
+        base: Delay after the first failure (seconds)
+        factor: Multiplier applied per further failure
+        jitter: Maximum random extra delay (seconds)
+
+    Returns:
+        float: Seconds to wait before the next attempt
+    """
+    return base * factor ** attempt + random.uniform(0, jitter)
+
+def rpc_backoff_delay(attempt, base=config.RPC_RETRY_BASE_SECONDS, cap=config.RPC_RETRY_CAP_SECONDS):
+    """Sub-second, capped exponential backoff with proportional jitter for read-only RPC calls
+
+    A failed read is usually a dropped connection or a momentary rate limit, so it is
+    retried almost immediately; waits that have to span a block use backoff_delay instead.
+
+    Args:
+        attempt: Number of the attempt that just failed (0 for the first)
+        base: Delay after the first failure before jitter (seconds)
+        cap: Longest delay before jitter (seconds)
+
+    Returns:
+        float: Seconds to wait before the next attempt (50-150% of the capped delay)
+    """
+    return min(cap, base * 2 ** attempt) * random.uniform(0.5, 1.5)
+
+def retry(description, default=None, max_attempts=3, base=config.RETRY_DELAY_BASE, factor=2.0, jitter=1.0, on_error=None):
+    """Retry a function that raises, waiting backoff_delay() (or Retry-After) between attempts
+
+    Return values are never retried: a function reports a definitive negative
+    answer by returning it, and a transient failure by raising.
+
+    Args:
+        description: What the function does, for log messages (e.g. "getting pair address")
+        default: Value returned once every attempt has failed
+        max_attempts: Maximum number of attempts
+        base: Delay after the first failure (seconds)
+        factor: Backoff multiplier per further failure
+        jitter: Maximum random extra delay (seconds)
+        on_error: Optional callback receiving each non-timeout exception (e.g. to reconnect)
+
+    Returns:
+        callable: Decorator
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            for attempt in range(max_attempts):
+                try:
+                    return func(*args, **kwargs)
+                except TIMEOUT_ERRORS as e:
+                    logger.warning("Timeout %s (attempt %s/%s): %s", description, attempt+1, max_attempts, e)
+                    error = e
+                except Exception as e:
+                    logger.error("Error %s (attempt %s/%s): %s", description, attempt+1, max_attempts, e)
+                    if on_error is not None:
+                        on_error(e)
+                    error = e
+
+                if attempt < max_attempts - 1:
+                    delay = _retry_after(error)
+                    if delay is None:
+                        delay = backoff_delay(attempt, base, factor, jitter)
+                    logger.info("Retrying %s in %.1f seconds...", description, delay)
+                    time.sleep(delay)
+
+            target = f" for {args[0]}" if args else ""
+            logger.error("Failed %s%s after %s attempts", description, target, max_attempts)
+            return default
+        return wrapper
+    return decorator
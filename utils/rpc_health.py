@@ -0,0 +1,131 @@
+"""
+Health scoring for the BSC RPC endpoints
+
+Every request is timed and classified so the singleton can prefer the fastest
+healthy endpoint instead of always walking BSC_RPC_ENDPOINTS in list order.
+"""
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass
+
+import requests
+
+from utils.logging_setup import logger
+
+# Weight of the newest sample in the latency average
+EWMA_ALPHA = 0.3
+# Consecutive unreachable failures before an endpoint is quarantined
+QUARANTINE_AFTER_FAILURES = 2
+# How long a quarantined endpoint is skipped (seconds)
+QUARANTINE_SECONDS = 600
+
+# Transport-level errors, i.e. the endpoint could not be reached at all
+UNREACHABLE_ERRORS = (requests.ConnectionError, requests.Timeout, ConnectionError, TimeoutError)
+
+@dataclass
+class EndpointStats:
+    ewma_latency: float = 0.0
+    consec_unreach: int = 0
+    consec_exec_fail: int = 0
+    quarantined_until: float = 0.0
+
+    def sort_key(self):
+        return (self.consec_unreach, self.consec_exec_fail, self.ewma_latency)
+
+    def is_quarantined(self, now=None):
+        return (now or time.time()) < self.quarantined_until
+
+_stats = {}
+_lock = threading.Lock()
+
+def get_stats(endpoint):
+    """Get (creating if needed) the stats of an endpoint"""
+    with _lock:
+        stats = _stats.get(endpoint)
+        if stats is None:
+            stats = _stats[endpoint] = EndpointStats()
+        return stats
+
+def ranked_endpoints(endpoints):
+    """
+    Order endpoints from healthiest to least healthy, skipping quarantined ones
+
+    Args:
+        endpoints: RPC endpoint URLs
+
+    Returns:
+        list: Endpoint URLs sorted by (unreachable failures, execution failures, EWMA latency).
+              If every endpoint is quarantined, all of them are returned so we still try something.
+    """
+    now = time.time()
+    available = [e for e in endpoints if not get_stats(e).is_quarantined(now)]
+    return sorted(available or list(endpoints), key=lambda e: get_stats(e).sort_key())
+
+def is_quarantined(endpoint):
+    """Check if an endpoint is currently quarantined"""
+    return get_stats(endpoint).is_quarantined()
+
+def record_success(endpoint, latency):
+    """Record a successful request and fold its latency into the EWMA"""
+    stats = get_stats(endpoint)
+    with _lock:
+        if stats.ewma_latency:
+            stats.ewma_latency = EWMA_ALPHA * latency + (1 - EWMA_ALPHA) * stats.ewma_latency
+        else:
+            stats.ewma_latency = latency
+        stats.consec_unreach = 0
+        stats.consec_exec_fail = 0
+
+def record_exec_failure(endpoint):
+    """Record a request the endpoint answered with a node-side error"""
+    stats = get_stats(endpoint)
+    with _lock:
+        stats.consec_unreach = 0
+        stats.consec_exec_fail += 1
+
+def record_unreachable(endpoint):
+    """Record a request that never reached the endpoint, quarantining it on repeated failures"""
+    stats = get_stats(endpoint)
+    with _lock:
+        stats.consec_unreach += 1
+        if stats.consec_unreach >= QUARANTINE_AFTER_FAILURES:
+            stats.quarantined_until = time.time() + QUARANTINE_SECONDS
+            logger.warning("Quarantining RPC endpoint %s for %ss after %s consecutive failures",
+                           endpoint, QUARANTINE_SECONDS, stats.consec_unreach)
+
+def _is_exec_failure(response):
+    """Check if a JSON-RPC response is a node-side error (reverts are not the endpoint's fault)"""
+    error = response.get('error') if isinstance(response, dict) else None
+    if not error:
+        return False
+    message = str(error.get('message', '')) if isinstance(error, dict) else str(error)
+    code = error.get('code') if isinstance(error, dict) else None
+    return code != 3 and 'revert' not in message.lower()
+
+@contextmanager
+def track_request(endpoint):
+    """
+    Time a request against an endpoint and update its health stats
+
+    Args:
+        endpoint: RPC endpoint URL
+
+    Yields:
+        dict: Set its 'response' key to the JSON-RPC response to classify node-side errors
+    """
+    outcome = {}
+    start = time.perf_counter()
+    try:
+        yield outcome
+    except UNREACHABLE_ERRORS:
+        record_unreachable(endpoint)
+        raise
+    except Exception:
+        record_exec_failure(endpoint)
+        raise
+
+    if _is_exec_failure(outcome.get('response')):
+        record_exec_failure(endpoint)
+    else:
+        record_success(endpoint, time.perf_counter() - start)
@@ -0,0 +1,58 @@
+"""
+Small thread-safe cache with per-entry expiry
+"""
+import threading
+import time
+from collections import OrderedDict
+
+class TTLCache:
+    """Mapping-like cache whose entries expire ttl seconds after being set
+    
+    When full, the least recently set entry is evicted.
+    """
+    
+    def __init__(self, maxsize=1024, ttl=10):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        
+    def get(self, key, default=None):
+        """Get a value, or default if missing or expired"""
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return default
+            value, expires_at = item
+            if time.monotonic() >= expires_at:
+                del self._data[key]
+                return default
+            return value
+            
+    def set(self, key, value, ttl=None):
+        """Set a value, optionally with its own TTL"""
+        expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._data.pop(key, None)
+            self._data[key] = (value, expires_at)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                
+    def pop(self, key, default=None):
+        """Remove a key and return its value (expired or not)"""
+        with self._lock:
+            item = self._data.pop(key, None)
+        return default if item is None else item[0]
+        
+    def discard_where(self, predicate):
+        """Remove every entry whose key matches predicate(key)"""
+        with self._lock:
+            for key in [key for key in self._data if predicate(key)]:
+                del self._data[key]
+                
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            
+    def __len__(self):
+        return len(self._data)
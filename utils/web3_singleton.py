@@ -2,64 +2,246 @@
 Singleton Web3 instance to ensure consistent usage across modules
 """
 import time
-from web3 import Web3
-from web3.exceptions import TimeExhausted, BadFunctionCallOutput
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from functools import lru_cache
+
+import requests
+from requests.adapters import HTTPAdapter
+from web3 import Web3, AsyncWeb3, WebSocketProvider
+from web3.exceptions import TimeExhausted, BadFunctionCallOutput, BadResponseFormat
+from eth_utils import to_checksum_address as _to_checksum_address
 
 from utils.logging_setup import logger
+from utils import rpc_health
+from utils.ttl_cache import TTLCache
+from utils.retry import rpc_backoff_delay
 import config
 
+# The chain never changes, so chain id lookups are answered from the provider's request cache
+CACHED_RPC_METHODS = {'eth_chainId', 'net_version'}
+
+_gas_price_cache = TTLCache(maxsize=1, ttl=config.GAS_PRICE_TTL_SECONDS)
+
+# Probes every RPC endpoint at once when (re)connecting
+_probe_pool = ThreadPoolExecutor(max_workers=len(config.BSC_RPC_ENDPOINTS), thread_name_prefix="rpc-probe")
+# Sends raced reads to several endpoints at once
+_race_pool = ThreadPoolExecutor(max_workers=config.RPC_PARALLELISM, thread_name_prefix="rpc-race")
+
+@lru_cache(maxsize=8192)
+def _checksum_lower(address_lower):
+    """Checksum an address, cached by its lowercase hex form"""
+    return _to_checksum_address(address_lower)
+
+class HealthTrackedHTTPProvider(Web3.HTTPProvider):
+    """HTTP provider that reports latency and failures of every request to rpc_health"""
+    
+    def make_request(self, method, params):
+        # Mostly served from the request cache, which would skew the latency stats
+        if method in CACHED_RPC_METHODS:
+            return super().make_request(method, params)
+        with rpc_health.track_request(self.endpoint_uri) as outcome:
+            outcome['response'] = super().make_request(method, params)
+        return outcome['response']
+    
+    def get_request_headers(self):
+        # User-Agent and keep-alive come from the pooled session, see Web3Singleton._get_provider
+        return {'Content-Type': 'application/json'}
+
 class Web3Singleton:
     _instance = None
+    _endpoint = None
+    # One provider (and pooled keep-alive session) per RPC endpoint, reused across reconnects
+    _providers = {}
+    # Web3 instance per endpoint for call_race, next to the pinned primary instance
+    _race_instances = {}
     
     @classmethod
     def get_instance(cls, force_reconnect=False):
         """Get the singleton Web3 instance, connecting if needed"""
+        # Move off the current endpoint once it has been quarantined, if there is somewhere to go
+        if (cls._endpoint is not None and rpc_health.is_quarantined(cls._endpoint)
+                and any(not rpc_health.is_quarantined(rpc) for rpc in config.BSC_RPC_ENDPOINTS)):
+            logger.warning("RPC endpoint %s is quarantined, switching endpoint", cls._endpoint)
+            force_reconnect = True
+        
         if cls._instance is None or force_reconnect:
+            reconnecting = cls._instance is not None
             cls._instance = cls._connect()
+            
+            if reconnecting:
+                # Cached contracts are bound to the old connection
+                # Import here to avoid circular imports
+                from contracts.interfaces import clear_contract_caches
+                clear_contract_caches()
         return cls._instance
     
+    @classmethod
+    def _get_provider(cls, rpc):
+        """Get the HTTP provider for an endpoint, backed by a pooled requests session"""
+        provider = cls._providers.get(rpc)
+        if provider is None:
+            session = requests.Session()
+            # Retries are handled by our own fallback logic, not by urllib3
+            adapter = HTTPAdapter(
+                pool_connections=config.RPC_POOL_CONNECTIONS,
+                pool_maxsize=config.RPC_POOL_MAXSIZE,
+                max_retries=0
+            )
+            # Also plain HTTP, e.g. a local node set through BSC_MAINNET_RPC_*
+            session.mount('https://', adapter)
+            session.mount('http://', adapter)
+            # Set once on the session rather than merged into every request
+            session.headers.update({
+                'Connection': 'keep-alive',
+                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
+            })
+            
+            provider = HealthTrackedHTTPProvider(rpc, session=session, request_kwargs={
+                'timeout': config.CONNECTION_TIMEOUT
+            }, cache_allowed_requests=True, cacheable_requests=CACHED_RPC_METHODS)
+            cls._providers[rpc] = provider
+        return provider
+    
+    @classmethod
+    def _probe(cls, rpc):
+        """Connect to one endpoint, returning the Web3 instance if it answers"""
+        w3 = Web3(cls._get_provider(rpc))
+        return w3 if w3.is_connected() else None
+    
     @classmethod
     def _connect(cls):
-        """Connect to BSC with fallback RPC endpoints"""
-        for rpc_attempt in range(len(config.BSC_RPC_ENDPOINTS)):
-            rpc = config.BSC_RPC_ENDPOINTS[rpc_attempt]
-            logger.info(f"Attempting to connect to BSC via {rpc}")
+        """Connect to BSC via the fastest responding RPC endpoint, then retry them healthiest first"""
+        endpoints = rpc_health.ranked_endpoints(config.BSC_RPC_ENDPOINTS)
+        
+        # Probe all endpoints in parallel and keep the first to answer; the slower probes
+        # still finish in the background and feed their latency into rpc_health
+        probes = {_probe_pool.submit(cls._probe, rpc): rpc for rpc in endpoints}
+        for probe in as_completed(probes):
+            rpc = probes[probe]
+            try:
+                w3 = probe.result()
+            except Exception as e:
+                logger.warning("Connection probe to %s failed: %s", rpc, e)
+                continue
+            if w3 is not None:
+                logger.info("Connected to BSC Mainnet via %s (first of %s endpoints to answer)", rpc, len(probes))
+                cls._endpoint = rpc
+                return w3
+        
+        for rpc in endpoints:
+            logger.info("Attempting to connect to BSC via %s", rpc)
             
             for attempt in range(config.MAX_RETRIES):
                 try:
-                    w3 = Web3(Web3.HTTPProvider(rpc, request_kwargs={
-                        'timeout': config.CONNECTION_TIMEOUT,
-                        'headers': {
-                            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
-                        }
-                    }))
+                    w3 = cls._probe(rpc)
                     
-                    if w3.is_connected():
-                        logger.info(f"Connected to BSC Mainnet via {rpc} (attempt {attempt+1})")
+                    if w3 is not None:
+                        logger.info("Connected to BSC Mainnet via %s (attempt %s)", rpc, attempt+1)
+                        cls._endpoint = rpc
                         return w3
                         
-                    logger.warning(f"Failed to connect to {rpc} - endpoint responded but connection test failed")
+                    logger.warning("Failed to connect to %s - endpoint responded but connection test failed", rpc)
+                    if rpc_health.is_quarantined(rpc):
+                        break
                 except Exception as e:
-                    backoff_time = config.RETRY_DELAY_BASE * (attempt + 1)
-                    logger.warning(f"Connection to {rpc} failed (attempt {attempt+1}/{config.MAX_RETRIES}): {str(e)}")
-                    logger.info(f"Retrying in {backoff_time} seconds...")
+                    backoff_time = rpc_backoff_delay(attempt)
+                    logger.warning("Connection to %s failed (attempt %s/%s): %s", rpc, attempt+1, config.MAX_RETRIES, e)
+                    
+                    # No point retrying an endpoint that just got quarantined
+                    if rpc_health.is_quarantined(rpc):
+                        break
+                        
+                    logger.info("Retrying in %.2f seconds...", backoff_time)
                     time.sleep(backoff_time)
         
         # If we get here, all RPC endpoints failed
         raise ConnectionError("Failed to connect to any BSC Mainnet RPC endpoint after multiple attempts")
     
+    @classmethod
+    def call_race(cls, fn, endpoints=config.RPC_RACE_ENDPOINTS):
+        """Run a read on the fastest endpoints at once and return the first answer
+        
+        Like a fallback provider with a quorum of one, so a slow but alive primary
+        endpoint doesn't hold up the read. Only for reads where any recent block will do
+        (quotes, gas price): the endpoints may be a block apart. Transactions and reads
+        of state we just changed stay on get_instance().
+        
+        Args:
+            fn: Callable taking a Web3 instance, e.g. lambda w3: w3.eth.gas_price
+            endpoints: Number of the healthiest (rpc_health) endpoints to race
+            
+        Returns:
+            Result of the first call to succeed
+            
+        Raises:
+            Exception: The last error if the call failed on every endpoint
+        """
+        ranked = rpc_health.ranked_endpoints(config.BSC_RPC_ENDPOINTS)[:endpoints]
+        if len(ranked) < 2:
+            return fn(cls.get_instance())
+        
+        racers = []
+        for rpc in ranked:
+            w3 = cls._race_instances.get(rpc)
+            if w3 is None:
+                w3 = cls._race_instances[rpc] = Web3(cls._get_provider(rpc))
+            racers.append(_race_pool.submit(fn, w3))
+        
+        error = None
+        for racer in as_completed(racers):
+            try:
+                return racer.result()
+            except Exception as e:
+                error = e
+        raise error
+    
+    @classmethod
+    def websocket(cls, endpoint=None):
+        """Create an AsyncWeb3 instance on a WebSocket connection, for eth_subscribe
+        
+        Use it as an async context manager (async with Web3Singleton.websocket() as w3),
+        which opens the connection and closes it on exit.
+        
+        Args:
+            endpoint: WebSocket endpoint (defaults to config.BSC_WS_ENDPOINT)
+            
+        Returns:
+            AsyncWeb3: Instance backed by a WebSocketProvider
+        """
+        return AsyncWeb3(WebSocketProvider(endpoint or config.BSC_WS_ENDPOINT))
+    
+    @classmethod
+    def reconnect_on_transport_error(cls, error):
+        """Reconnect (to the healthiest endpoint) if an RPC call failed at the transport level
+        
+        Used instead of probing is_connected() before every call.
+        
+        Args:
+            error: Exception raised by an RPC call
+            
+        Returns:
+            bool: True if a reconnect was performed
+        """
+        if not isinstance(error, rpc_health.UNREACHABLE_ERRORS + (requests.HTTPError, BadResponseFormat)):
+            return False
+            
+        logger.warning("RPC transport error (%s), reconnecting...", type(error).__name__)
+        try:
+            cls.get_instance(force_reconnect=True)
+            return True
+        except Exception as e:
+            logger.error("Reconnect failed: %s", e)
+            return False
+    
     @classmethod
     def to_checksum_address(cls, address):
-        """Convert address to checksum format"""
+        """Convert address to checksum format (pure computation, cached per address)"""
         try:
-            w3 = cls.get_instance()
-            if not w3.is_connected():
-                logger.warning("Web3 connection lost during address checksum conversion, reconnecting...")
-                w3 = cls.get_instance(force_reconnect=True)
-                
-            return w3.to_checksum_address(address)
+            if isinstance(address, str):
+                return _checksum_lower(address.lower())
+            return _to_checksum_address(address)
         except Exception as e:
-            logger.error(f"Invalid address format: {e}")
+            logger.error("Invalid address format: %s", e)
             return None
     
     @classmethod
@@ -75,27 +257,33 @@ class Web3Singleton:
                 base_gas = w3.eth.gas_price
                 return int(base_gas * config.GAS_MULTIPLIER)
             except Exception as e:
-                logger.warning(f"Error getting gas price (attempt {attempt+1}/{max_retries}): {e}")
+                logger.warning("Error getting gas price (attempt %s/%s): %s", attempt+1, max_retries, e)
                 if attempt < max_retries - 1:
-                    # Exponential backoff
-                    backoff_time = config.RETRY_DELAY_BASE * (attempt + 1)
-                    time.sleep(backoff_time)
+                    time.sleep(rpc_backoff_delay(attempt))
         
         # If all retries fail, use a fallback gas price
         logger.warning("Using fallback gas price of 5 gwei")
         w3 = cls.get_instance()
         return w3.to_wei(5, 'gwei')
 
+    @classmethod
+    def get_cached_gas_price(cls):
+        """Get the network gas price, reused for GAS_PRICE_TTL_SECONDS
+        
+        Only for calls where a slightly stale price doesn't matter (gas estimates,
+        simulations); transactions that get sent should use get_gas_price.
+        """
+        gas_price = _gas_price_cache.get('gas_price')
+        if gas_price is None:
+            gas_price = cls.get_instance().eth.gas_price
+            _gas_price_cache.set('gas_price', gas_price)
+        return gas_price
+
 # Initialize web3 addresses with checksum format
 def initialize_web3_addresses():
-    """Initialize web3 addresses with checksum format"""
-    # Make sure we have a web3 instance
-    w3 = Web3Singleton.get_instance()
-    
-    # Initialize checksum addresses
-    config.WBNB_ADDRESS = Web3Singleton.to_checksum_address(config.WBNB_ADDRESS)
-    config.BUSD_ADDRESS = Web3Singleton.to_checksum_address(config.BUSD_ADDRESS)
-    config.PANCAKE_FACTORY_ADDRESS = Web3Singleton.to_checksum_address(config.PANCAKE_FACTORY_ADDRESS)
-    config.PANCAKE_ROUTER_ADDRESS = Web3Singleton.to_checksum_address(config.PANCAKE_ROUTER_ADDRESS)
+    """Initialize web3 addresses with checksum format
     
-    return w3
\ No newline at end of file
+    The contract addresses are already checksummed when config is imported,
+    so this only makes sure we have a web3 instance.
+    """
+    return Web3Singleton.get_instance()
\ No newline at end of file